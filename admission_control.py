@@ -0,0 +1,191 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+from starlette.responses import StreamingResponse
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# route class -> (max concurrent, max queued, max queue wait in seconds)
+DEFAULT_ROUTE_LIMITS = {
+    "agent": (int(os.getenv("AGENT_POOL_MAX_WORKERS", "8")), 32, 10.0),
+    "tool": (16, 64, 5.0),
+    "oct": (4, 16, 15.0),
+    # WeChat must reply within 5s, so its requests never queue for long
+    "wechat": (8, 32, 3.0),
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a route class is saturated; surfaced to clients as 429 with Retry-After."""
+
+    def __init__(self, route_class: str, retry_after: int, reason: str):
+        super().__init__(f"Too many concurrent {route_class} requests ({reason}), retry after {retry_after}s")
+        self.route_class = route_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionSlot:
+    """A granted unit of concurrency; release() is idempotent."""
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self._limiter = limiter
+        self._acquired_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release((time.perf_counter() - self._acquired_at) * 1000)
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded FIFO wait queue for one route class.
+
+    Requests beyond max_concurrent wait in a queue of at most max_queue entries
+    for up to max_wait_seconds; anything beyond that is rejected at once so
+    bursts cost clients a fast 429 instead of a slow timeout. Runs on the event
+    loop only, so no locking is needed.
+    """
+
+    def __init__(self, route_class: str, max_concurrent: int, max_queue: int, max_wait_seconds: float):
+        self.route_class = route_class
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_hold_ms = 1000.0
+        self._metrics = get_metrics_registry()
+
+    def _update_gauges(self):
+        self._metrics.set_gauge(f"admission.{self.route_class}.active", self._active)
+        self._metrics.set_gauge(f"admission.{self.route_class}.queue_depth", len(self._waiters))
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, from the average time slots are held."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold_ms / 1000 * backlog / self.max_concurrent))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._metrics.increment(f"admission.{self.route_class}.rejected")
+        logger.warning(f"Rejecting {self.route_class} request: {reason}")
+        return AdmissionRejected(self.route_class, self._retry_after(), reason)
+
+    async def acquire(self) -> AdmissionSlot:
+        started = time.perf_counter()
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+        else:
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject("queue full")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._update_gauges()
+            try:
+                # A releasing slot is handed straight to the waiter, so _active is unchanged
+                await asyncio.wait_for(waiter, self.max_wait_seconds)
+            except asyncio.TimeoutError:
+                raise self._reject("queue wait timed out")
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(None)
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._update_gauges()
+
+        self._metrics.observe(f"admission.{self.route_class}.wait", (time.perf_counter() - started) * 1000)
+        self._metrics.increment(f"admission.{self.route_class}.admitted")
+        self._update_gauges()
+        return AdmissionSlot(self)
+
+    def _release(self, held_ms: float = None):
+        if held_ms is not None:
+            self._avg_hold_ms = 0.8 * self._avg_hold_ms + 0.2 * held_ms
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def queue_ratio(self) -> float:
+        return len(self._waiters) / self.max_queue if self.max_queue else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self._active,
+            "queue_depth": len(self._waiters)
+        }
+
+
+class AdmissionController:
+    """Per-route-class limiters, configured by ADMISSION_<CLASS>_MAX_CONCURRENT / _MAX_QUEUE / _MAX_WAIT_SECONDS."""
+
+    def __init__(self):
+        self.limiters: Dict[str, AdmissionLimiter] = {}
+        for route_class, (max_concurrent, max_queue, max_wait_seconds) in DEFAULT_ROUTE_LIMITS.items():
+            prefix = f"ADMISSION_{route_class.upper()}"
+            self.limiters[route_class] = AdmissionLimiter(
+                route_class,
+                int(os.getenv(f"{prefix}_MAX_CONCURRENT", str(max_concurrent))),
+                int(os.getenv(f"{prefix}_MAX_QUEUE", str(max_queue))),
+                float(os.getenv(f"{prefix}_MAX_WAIT_SECONDS", str(max_wait_seconds)))
+            )
+
+    async def admit(self, route_class: str) -> AdmissionSlot:
+        """Wait for a slot; raises AdmissionRejected when the class is saturated."""
+        return await self.limiters[route_class].acquire()
+
+    @asynccontextmanager
+    async def limit(self, route_class: str):
+        slot = await self.admit(route_class)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {route_class: limiter.get_stats() for route_class, limiter in self.limiters.items()}
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that holds an admission slot until the response is finished or torn down.
+
+    Releasing here rather than in the body generator also covers clients that
+    disconnect before the generator is ever started.
+    """
+
+    def __init__(self, content: Any, slot: AdmissionSlot, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+admission_controller = None
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the shared admission controller"""
+    global admission_controller
+    if admission_controller is None:
+        admission_controller = AdmissionController()
+    return admission_controller
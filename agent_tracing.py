@@ -0,0 +1,309 @@
+import os
+import re
+import threading
+import time
+import uuid
+import logging
+import contextvars
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from llm_usage import record_model_usage
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR_TOOL_NAME = "_Exception"
+
+# X-Request-ID sent by the client, kept only to correlate its logs with our trace
+_client_request_id: contextvars.ContextVar = contextvars.ContextVar("client_request_id", default=None)
+
+
+def get_client_request_id() -> Optional[str]:
+    return _client_request_id.get()
+
+_CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate for Gemini: one per CJK character, one per four other characters."""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def _extract_token_usage(response: LLMResult) -> Optional[Dict[str, int]]:
+    """Read provider-reported token usage from an LLM result if present."""
+    llm_output = response.llm_output or {}
+    usage = llm_output.get("token_usage") or llm_output.get("usage_metadata")
+    if not usage:
+        return None
+    tokens_in = usage.get("prompt_tokens", usage.get("prompt_token_count"))
+    tokens_out = usage.get("completion_tokens", usage.get("candidates_token_count"))
+    if tokens_in is None or tokens_out is None:
+        return None
+    return {"tokens_in": int(tokens_in), "tokens_out": int(tokens_out)}
+
+
+class AgentTraceCallbackHandler(BaseCallbackHandler):
+    """Collect per-step timings of one agent run and export them as metrics."""
+
+    run_inline = True
+
+    def __init__(self, request_id: Optional[str] = None, query: str = ""):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.client_request_id = get_client_request_id()
+        self.query = query
+        self._lock = threading.Lock()
+        self._pending: Dict[UUID, Dict[str, Any]] = {}
+        self._started_at = time.time()
+        self._start_clock = time.perf_counter()
+        self._metrics = get_metrics_registry()
+        self.steps: List[Dict[str, Any]] = []
+        self.totals = {
+            "llm_calls": 0,
+            "llm_ms": 0.0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "tool_calls": 0,
+            "tool_ms": 0.0,
+            "parse_errors": 0
+        }
+        self.cache_hit = False
+        self.status = "running"
+
+    def _elapsed_ms(self, started: float) -> float:
+        return round((time.perf_counter() - started) * 1000, 2)
+
+    def _start(self, run_id: UUID, **info):
+        with self._lock:
+            self._pending[run_id] = dict(info, started=time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._pending.pop(run_id, None)
+
+    def _model_name(self, serialized: Dict[str, Any], kwargs: Dict[str, Any]) -> str:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name")
+        if not model:
+            model = (serialized or {}).get("kwargs", {}).get("model")
+        return model or "unknown"
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> Any:
+        self._start(run_id, model=self._model_name(serialized, kwargs), prompt_text="".join(prompts))
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> Any:
+        prompt_text = "".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, model=self._model_name(serialized, kwargs), prompt_text=prompt_text)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        pending = self._finish(run_id)
+        if pending is None:
+            return
+        latency_ms = self._elapsed_ms(pending["started"])
+        output_text = "".join(
+            generation.text for generations in response.generations for generation in generations
+        )
+
+        usage = _extract_token_usage(response)
+        estimated = usage is None
+        if usage is None:
+            usage = {
+                "tokens_in": estimate_tokens(pending["prompt_text"]),
+                "tokens_out": estimate_tokens(output_text)
+            }
+
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or pending["model"]
+        if "cascade_stage" not in llm_output and not llm_output.get("llm_cache_hit"):
+            # CascadeChatModel records usage per underlying model itself; cache hits cost nothing
+            record_model_usage(model, latency_ms, usage["tokens_in"], usage["tokens_out"])
+
+        step = {
+            "type": "llm",
+            "model": model,
+            "latency_ms": latency_ms,
+            "tokens_in": usage["tokens_in"],
+            "tokens_out": usage["tokens_out"],
+            "tokens_estimated": estimated
+        }
+        if "cascade_stage" in llm_output:
+            step["cascade_stage"] = llm_output["cascade_stage"]
+        if llm_output.get("llm_cache_hit"):
+            step["cached"] = True
+        with self._lock:
+            self.steps.append(step)
+            self.totals["llm_calls"] += 1
+            self.totals["llm_ms"] += latency_ms
+            self.totals["tokens_in"] += usage["tokens_in"]
+            self.totals["tokens_out"] += usage["tokens_out"]
+
+        self._metrics.observe("agent.llm_call", latency_ms)
+        self._metrics.increment("agent.tokens_in", usage["tokens_in"])
+        self._metrics.increment("agent.tokens_out", usage["tokens_out"])
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        pending = self._finish(run_id)
+        if pending is None:
+            return
+        latency_ms = self._elapsed_ms(pending["started"])
+        with self._lock:
+            self.steps.append({
+                "type": "llm",
+                "model": pending["model"],
+                "latency_ms": latency_ms,
+                "error": str(error)
+            })
+        self._metrics.increment("agent.llm_errors")
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._start(run_id, tool=(serialized or {}).get("name", "unknown"), input=input_str)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._record_tool(run_id, error=None)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._record_tool(run_id, error=str(error))
+
+    def _record_tool(self, run_id: UUID, error: Optional[str]):
+        pending = self._finish(run_id)
+        if pending is None:
+            return
+        latency_ms = self._elapsed_ms(pending["started"])
+
+        if pending["tool"] == PARSE_ERROR_TOOL_NAME:
+            # AgentExecutor routes unparseable LLM output through a pseudo-tool before retrying
+            with self._lock:
+                self.steps.append({"type": "parse_error_retry", "latency_ms": latency_ms})
+                self.totals["parse_errors"] += 1
+            self._metrics.increment("agent.parse_errors")
+            return
+
+        step = {
+            "type": "tool",
+            "tool": pending["tool"],
+            "input": pending["input"],
+            "latency_ms": latency_ms
+        }
+        if error:
+            step["error"] = error
+        with self._lock:
+            self.steps.append(step)
+            self.totals["tool_calls"] += 1
+            self.totals["tool_ms"] += latency_ms
+
+        self._metrics.observe(f"agent.tool.{pending['tool']}", latency_ms)
+        if error:
+            self._metrics.increment(f"agent.tool.{pending['tool']}.errors")
+
+    def mark_cache_hit(self):
+        self.cache_hit = True
+        self._metrics.increment("agent.cache_hits")
+
+    def finish(self, status: str = "success") -> Dict[str, Any]:
+        """Close the trace, record run-level metrics and store it for lookup."""
+        self.status = status
+        total_ms = self._elapsed_ms(self._start_clock)
+        self._metrics.observe("agent.run", total_ms)
+        self._metrics.increment(f"agent.runs.{status}")
+
+        trace = self.to_dict()
+        trace["total_ms"] = total_ms
+        get_trace_store().save(trace)
+        return trace
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = dict(self.totals)
+            totals["llm_ms"] = round(totals["llm_ms"], 2)
+            totals["tool_ms"] = round(totals["tool_ms"], 2)
+            return {
+                "request_id": self.request_id,
+                "client_request_id": self.client_request_id,
+                "query": self.query,
+                "started_at": self._started_at,
+                "status": self.status,
+                "cache_hit": self.cache_hit,
+                "steps": list(self.steps),
+                "totals": totals
+            }
+
+
+class TraceStore:
+    """Bounded in-memory store of recent agent traces keyed by request id."""
+
+    def __init__(self, max_traces: int = None):
+        if max_traces is None:
+            max_traces = int(os.getenv("AGENT_TRACE_MAX_ENTRIES", "500"))
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, trace: Dict[str, Any]):
+        with self._lock:
+            self._traces[trace["request_id"]] = trace
+            self._traces.move_to_end(trace["request_id"])
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+
+trace_store = None
+
+def get_trace_store() -> TraceStore:
+    """Get or create the shared agent trace store"""
+    global trace_store
+    if trace_store is None:
+        trace_store = TraceStore()
+    return trace_store
+
+
+class RequestIdMiddleware:
+    """ASGI middleware that assigns every HTTP request an id and returns it as X-Request-ID.
+
+    The id is always issued here: traces are stored and served under it, so a
+    client-chosen id could overwrite or read another request's trace. An
+    X-Request-ID sent by the client is only recorded as client_request_id.
+    """
+
+    header_name = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client_request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header_name:
+                client_request_id = value.decode("latin-1")[:64] or None
+                break
+        request_id = uuid.uuid4().hex
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        state["client_request_id"] = client_request_id
+        context_token = _client_request_id.set(client_request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((self.header_name, request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _client_request_id.reset(context_token)
@@ -0,0 +1,93 @@
+import os
+import asyncio
+import contextvars
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class AgentWorkerPool:
+    """Bounded thread pool for blocking agent runs, so async handlers never block the event loop."""
+
+    def __init__(self, max_workers: int = None, name: str = "agent"):
+        if max_workers is None:
+            max_workers = int(os.getenv("AGENT_POOL_MAX_WORKERS", "8"))
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._metrics = get_metrics_registry()
+
+    def _update_gauges(self):
+        self._metrics.set_gauge(f"{self.name}_pool.queue_depth", self._queued)
+        self._metrics.set_gauge(f"{self.name}_pool.active", self._active)
+
+    def _run(self, submitted_at: float, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._update_gauges()
+        self._metrics.observe(f"{self.name}_pool.wait", (started_at - submitted_at) * 1000)
+
+        try:
+            result = func(*args, **kwargs)
+            self._metrics.increment(f"{self.name}_pool.completed")
+            return result
+        except Exception:
+            self._metrics.increment(f"{self.name}_pool.failed")
+            raise
+        finally:
+            self._metrics.observe(f"{self.name}_pool.run", (time.perf_counter() - started_at) * 1000)
+            with self._lock:
+                self._active -= 1
+                self._update_gauges()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on the pool and await its result."""
+        with self._lock:
+            self._queued += 1
+            self._update_gauges()
+        submitted_at = time.perf_counter()
+
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._run, submitted_at, func, args, kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Cancelled before a worker picked it up, so _run never decrements the queue
+                with self._lock:
+                    self._queued -= 1
+                    self._update_gauges()
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get current pool utilization"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queue_depth": self._queued
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+agent_worker_pool = None
+
+def get_agent_worker_pool() -> AgentWorkerPool:
+    """Get or create the shared agent worker pool"""
+    global agent_worker_pool
+    if agent_worker_pool is None:
+        agent_worker_pool = AgentWorkerPool()
+    return agent_worker_pool
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# TTLs follow how often the upstream /hub data changes: prices are published monthly,
+# generation hours are annual statistics, capacity and policy listings move faster.
+INTENT_TTL_SECONDS = {
+    "electricity_price": 12 * 3600,
+    "power_generation_duration": 24 * 3600,
+    "photovoltaic_capacity": 6 * 3600,
+    "policy": 6 * 3600,
+}
+
+# Words that only make sense with the previous turns, e.g. "那边的补贴政策呢？"
+CONTEXT_REFERENCE_MARKERS = [
+    "那边", "那里", "这边", "这里", "该地", "当地", "该市", "该省", "该区",
+    "上述", "刚才", "之前", "前面", "同样", "它的", "那个地方", "这个地方"
+]
+
+QUERY_PREFIXES = ["请问", "我想了解一下", "我想了解", "我想知道", "帮我查一下", "帮我查", "查一下", "告诉我"]
+
+BARE_CITY_NAMES = [
+    "蚌埠", "淮南", "开封", "深圳", "苏州", "杭州", "宁波", "青岛", "大连", "厦门", "广州",
+    "上海", "北京", "天津", "重庆", "南京", "武汉", "成都", "西安", "长沙", "郑州", "济南",
+    "合肥", "福州", "南昌", "石家庄", "太原", "沈阳", "长春", "哈尔滨"
+]
+
+ANSWER_ERROR_PHRASES = ["出现错误", "无法处理", "无法理解", "查询失败", "Agent stopped"]
+
+
+def has_context_reference(query: str) -> bool:
+    """Check whether a query depends on earlier turns of the conversation."""
+    if any(marker in query for marker in CONTEXT_REFERENCE_MARKERS):
+        return True
+    return query.rstrip("？?。. ").endswith("呢")
+
+
+def _strip_query_prefix(query: str) -> str:
+    query = query.strip()
+    for prefix in QUERY_PREFIXES:
+        if query.startswith(prefix):
+            return query[len(prefix):].strip()
+    return query
+
+
+def _resolve_location(query: str, tools: Dict[str, Any]) -> Optional[str]:
+    """Resolve the location in a query to a canonical string, e.g. 安徽省淮南市."""
+    mentioned = [name for name in BARE_CITY_NAMES if name in query]
+    if len(mentioned) > 1:
+        return None
+
+    electricity_tool = tools.get("query_electricity_price")
+    if electricity_tool is None:
+        return None
+
+    city, _ = electricity_tool._parse_query(query)
+    if not city:
+        return None
+    return city.replace("-", "").strip()
+
+
+def resolve_query_intent(query: str, tools: List[Any]) -> Optional[Tuple[str, Dict[str, str]]]:
+    """Map a raw query to (intent, entities) using the tools' own parsers.
+
+    Returns None when the query is ambiguous, spans several tools, or lacks an
+    entity the answer depends on; such queries are never served from cache.
+    """
+    tools_by_name = {tool.name: tool for tool in tools}
+    query = _strip_query_prefix(query)
+
+    has_capacity = any(keyword in query for keyword in ["承载力", "可开放容量", "光伏承载"])
+    has_policy = any(keyword in query for keyword in ["政策", "补贴", "法规", "标准"])
+    has_price = any(keyword in query for keyword in ["电价", "上网电价", "工商电价", "脱硫煤电价"])
+    has_duration = any(keyword in query for keyword in ["发电小时", "发电时长", "有效发电"])
+
+    if sum([has_capacity, has_policy, has_price, has_duration]) != 1:
+        return None
+
+    if has_price:
+        electricity_tool = tools_by_name.get("query_electricity_price")
+        if electricity_tool is None:
+            return None
+        _, price_type = electricity_tool._parse_query(query)
+        location = _resolve_location(query, tools_by_name)
+        if not location or not price_type:
+            return None
+        return "electricity_price", {"location": location, "price_type": price_type}
+
+    if has_duration:
+        location = _resolve_location(query, tools_by_name)
+        if not location:
+            return None
+        return "power_generation_duration", {"location": location}
+
+    if has_capacity:
+        location = _resolve_location(query, tools_by_name)
+        if not location:
+            return None
+        return "photovoltaic_capacity", {"location": location}
+
+    policy_tool = tools_by_name.get("query_policies")
+    if policy_tool is None:
+        return None
+    if policy_tool._parse_is_countrywide(query):
+        region = "全国"
+    else:
+        region = _resolve_location(query, tools_by_name)
+    if not region:
+        return None
+    return "policy", {
+        "region": region,
+        "topic": policy_tool._parse_topic(query) or "",
+        "station_mode": policy_tool._parse_elec_station_mode(query) or "",
+        "network_mode": policy_tool._parse_network_mode(query) or ""
+    }
+
+
+def is_cacheable_answer(answer: str) -> bool:
+    """Only keep answers that did not come from an error or a failed tool call."""
+    return bool(answer) and not any(phrase in answer for phrase in ANSWER_ERROR_PHRASES)
+
+
+class AnswerCache:
+    """Process-wide cache of final router answers keyed on (intent, entities)."""
+
+    def __init__(self, max_entries: int = None, enabled: bool = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+        if enabled is None:
+            enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    @staticmethod
+    def make_key(intent: str, entities: Dict[str, str]) -> str:
+        parts = [f"{name}={entities[name]}" for name in sorted(entities)]
+        return "|".join([intent] + parts)
+
+    def _ttl_for(self, intent: str) -> int:
+        override = os.getenv(f"ANSWER_CACHE_TTL_{intent.upper()}")
+        if override:
+            return int(override)
+        return INTENT_TTL_SECONDS.get(intent, 0)
+
+    def lookup_key(self, query: str, tools: List[Any]) -> Optional[str]:
+        """Return the cache key for a query, or None when the cache must be bypassed."""
+        if not self.enabled:
+            return None
+        if has_context_reference(query):
+            self._metrics.increment("answer_cache.bypass")
+            return None
+
+        resolved = resolve_query_intent(query, tools)
+        if resolved is None:
+            self._metrics.increment("answer_cache.bypass")
+            return None
+        intent, entities = resolved
+        return self.make_key(intent, entities)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._metrics.increment("answer_cache.hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._metrics.increment("answer_cache.misses")
+        return None
+
+    def set(self, key: str, answer: str):
+        if not is_cacheable_answer(answer):
+            return
+        ttl = self._ttl_for(key.split("|", 1)[0])
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._metrics.set_gauge("answer_cache.entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._metrics.set_gauge("answer_cache.entries", 0)
+
+
+answer_cache = None
+
+def get_answer_cache() -> AnswerCache:
+    """Get or create the shared router answer cache"""
+    global answer_cache
+    if answer_cache is None:
+        answer_cache = AnswerCache()
+    return answer_cache
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+路由智能体离线基准测试
+使用确定性的脚本化LLM驱动真实的 create_react_agent / AgentExecutor 流程，
+在无网络环境下测量框架开销、内存增长和并发表现
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import tracemalloc
+from typing import List, Dict, Any
+
+os.environ.setdefault("ROUTER_LLM_BACKEND", "scripted")
+os.environ.setdefault("AGENT_VERBOSE", "false")
+os.environ.setdefault("AUTHORIZATION_TOKEN", "offline-benchmark")
+os.environ["USE_MOCK_DATA"] = "True"
+
+import electricity_price_tool
+
+electricity_price_tool.USE_MOCK_DATA = True
+
+from main_router_agent import MainRouterAgent
+from fake_llm import create_offline_llm
+from agent_tracing import get_trace_store
+
+BENCH_QUERIES = [
+    "安徽淮南的工商电价是多少？",
+    "查询上海市杨浦区的上网电价",
+    "北京市的有效发电小时数",
+    "我想了解一下河南开封的光伏承载力",
+    "查找全国范围内关于户用屋顶光伏的并网接入政策",
+    "你们地面项目投资吗？"
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def create_agent(backend: str) -> MainRouterAgent:
+    return MainRouterAgent(llm=create_offline_llm(backend))
+
+
+def bench_construction(backend: str, rounds: int = 5) -> Dict[str, Any]:
+    """智能体构建耗时"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        create_agent(backend)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"avg_ms": statistics.mean(timings), "max_ms": max(timings)}
+
+
+def bench_sequential(backend: str, requests: int) -> Dict[str, Any]:
+    """串行请求：端到端延迟与框架开销（总耗时 - LLM耗时 - 工具耗时）"""
+    agent = create_agent(backend)
+    totals, overheads = [], []
+    trace_store = get_trace_store()
+
+    for i in range(requests):
+        request_id = f"bench-seq-{i}"
+        agent.query(BENCH_QUERIES[i % len(BENCH_QUERIES)], request_id)
+        trace = trace_store.get(request_id)
+        totals.append(trace["total_ms"])
+        overheads.append(trace["total_ms"] - trace["totals"]["llm_ms"] - trace["totals"]["tool_ms"])
+        agent.clear_memory()
+
+    return {
+        "p50_ms": percentile(totals, 50),
+        "p95_ms": percentile(totals, 95),
+        "overhead_p50_ms": percentile(overheads, 50),
+        "overhead_p95_ms": percentile(overheads, 95)
+    }
+
+
+def bench_memory(backend: str, requests: int) -> Dict[str, Any]:
+    """内存增长：同一会话连续对话 vs. 每次新建智能体"""
+    tracemalloc.start()
+
+    agent = create_agent(backend)
+    baseline = tracemalloc.take_snapshot()
+    for i in range(requests):
+        agent.query(BENCH_QUERIES[i % len(BENCH_QUERIES)])
+    session_growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+
+    baseline = tracemalloc.take_snapshot()
+    for i in range(requests):
+        create_agent(backend).query(BENCH_QUERIES[i % len(BENCH_QUERIES)])
+    fresh_growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+
+    tracemalloc.stop()
+    return {
+        "session_growth_kb_per_turn": session_growth / 1024 / requests,
+        "fresh_agent_growth_kb_per_request": fresh_growth / 1024 / requests
+    }
+
+
+async def bench_concurrency(backend: str, concurrency: int, requests: int, stream: bool) -> Dict[str, Any]:
+    """并发请求：每个请求独立会话，测量吞吐与延迟分布"""
+    agents = [create_agent(backend) for _ in range(concurrency)]
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(i: int):
+        async with semaphore:
+            agent = agents[i % concurrency]
+            query = BENCH_QUERIES[i % len(BENCH_QUERIES)]
+            started = time.perf_counter()
+            if stream:
+                async for _ in agent.query_stream(query):
+                    pass
+            else:
+                await agent.aquery(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the MainRouterAgent ReAct loop")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--first-token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--backend", choices=["scripted", "replay"], default=os.getenv("ROUTER_LLM_BACKEND", "scripted"))
+    parser.add_argument("--stream", action="store_true", help="use query_stream instead of aquery")
+    parser.add_argument("--with-answer-cache", action="store_true")
+    args = parser.parse_args()
+
+    os.environ["FAKE_LLM_TOKEN_LATENCY_MS"] = str(args.token_latency_ms)
+    os.environ["FAKE_LLM_FIRST_TOKEN_LATENCY_MS"] = str(args.first_token_latency_ms)
+    if not args.with_answer_cache:
+        from answer_cache import get_answer_cache
+        get_answer_cache().enabled = False
+
+    print("=" * 80)
+    print(f"路由智能体离线基准测试 (backend={args.backend}, requests={args.requests}, "
+          f"token_latency={args.token_latency_ms}ms, first_token={args.first_token_latency_ms}ms)")
+    print("=" * 80)
+
+    construction = bench_construction(args.backend)
+    print(f"智能体构建: avg {construction['avg_ms']:.2f}ms, max {construction['max_ms']:.2f}ms")
+
+    sequential = bench_sequential(args.backend, args.requests)
+    print(f"串行延迟: p50 {sequential['p50_ms']:.2f}ms, p95 {sequential['p95_ms']:.2f}ms")
+    print(f"框架开销: p50 {sequential['overhead_p50_ms']:.2f}ms, p95 {sequential['overhead_p95_ms']:.2f}ms")
+
+    memory = bench_memory(args.backend, args.requests)
+    print(f"内存增长: 会话内 {memory['session_growth_kb_per_turn']:.1f}KB/轮, "
+          f"新建智能体 {memory['fresh_agent_growth_kb_per_request']:.1f}KB/请求")
+
+    print("-" * 80)
+    for concurrency in args.concurrency:
+        result = asyncio.run(bench_concurrency(args.backend, concurrency, args.requests, args.stream))
+        print(f"并发 {result['concurrency']:>3}: {result['throughput_rps']:.1f} req/s, "
+              f"p50 {result['p50_ms']:.2f}ms, p95 {result['p95_ms']:.2f}ms")
+    print("=" * 80)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
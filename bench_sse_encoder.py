@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+SSE 编码微基准测试
+对比旧的逐块构建字典 + json.dumps 方式与预序列化信封的流式编码器的单块CPU开销
+"""
+
+import json
+import time
+import uuid
+import argparse
+
+from sse_encoder import OpenAIStreamEncoder, AgentStreamEncoder, orjson
+
+SAMPLE_CHUNKS = ["查询", "成功：", "安徽省-淮南市", "的工商加权电价为", "0.5731", "元/千瓦时。\n", "Observation: ok"]
+
+
+def legacy_openai_chunk(response_id: str, created: int, model: str, chunk: str) -> str:
+    content_chunk = {
+        "id": response_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"content": chunk},
+            "finish_reason": None
+        }]
+    }
+    return f"data: {json.dumps(content_chunk, ensure_ascii=False)}\n\n"
+
+
+def legacy_agent_chunk(chunk: str) -> bytes:
+    chunk_escaped = chunk.replace('\n', '\\n').replace('\r', '\\r')
+    data = json.dumps({'chunk': chunk_escaped, 'type': 'content'}, ensure_ascii=False)
+    return f"data: {data}\n\n".encode('utf-8')
+
+
+def measure(label: str, encode, chunks: int) -> float:
+    samples = len(SAMPLE_CHUNKS)
+    started = time.perf_counter()
+    for i in range(chunks):
+        encode(SAMPLE_CHUNKS[i % samples])
+    elapsed = time.perf_counter() - started
+    per_chunk_us = elapsed / chunks * 1_000_000
+    print(f"{label:<40} {per_chunk_us:8.3f} µs/chunk  {chunks / elapsed:12,.0f} chunks/s")
+    return per_chunk_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chunk CPU cost of SSE encoding")
+    parser.add_argument("--chunks", type=int, default=200_000)
+    args = parser.parse_args()
+
+    response_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
+    created = int(time.time())
+    model = "daxia-agent"
+    openai_encoder = OpenAIStreamEncoder(response_id, created, model)
+    agent_encoder = AgentStreamEncoder()
+
+    print("=" * 80)
+    print(f"SSE 编码微基准测试 ({args.chunks:,} chunks, JSON backend: {'orjson' if orjson else 'json'})")
+    print("=" * 80)
+
+    legacy = measure("/v1/chat/completions legacy", lambda c: legacy_openai_chunk(response_id, created, model, c).encode("utf-8"), args.chunks)
+    fast = measure("/v1/chat/completions OpenAIStreamEncoder", openai_encoder.content, args.chunks)
+    print(f"{'speedup':<40} {legacy / fast:8.2f}x")
+    print("-" * 80)
+
+    legacy = measure("/ask_agent_stream legacy", legacy_agent_chunk, args.chunks)
+    fast = measure("/ask_agent_stream AgentStreamEncoder", agent_encoder.content, args.chunks)
+    print(f"{'speedup':<40} {legacy / fast:8.2f}x")
+    print("=" * 80)
+
+    for chunk in SAMPLE_CHUNKS:
+        assert json.loads(openai_encoder.content(chunk)[6:]) == json.loads(legacy_openai_chunk(response_id, created, model, chunk)[6:])
+        assert json.loads(agent_encoder.content(chunk)[6:]) == json.loads(legacy_agent_chunk(chunk)[6:])
+    print("输出与旧实现语义一致 ✅")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ from pydantic import BaseModel, Field
 from difflib import SequenceMatcher
 import re
 
+from request_cancellation import cancellable_get
+
 class BusinessKnowledgeInput(BaseModel):
     query: str = Field(description="用户的业务相关问题")
 
@@ -92,7 +94,7 @@ class BusinessKnowledgeTool(BaseTool):
                 'Content-Type': 'application/json'
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = cancellable_get(url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             
             return response.json()
@@ -0,0 +1,104 @@
+import os
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+ConversationMessage = Tuple[str, str]
+
+
+def conversation_hash(messages: Sequence[ConversationMessage]) -> str:
+    """Hash a (role, content) conversation prefix; whitespace at the ends of each turn is ignored."""
+    digest = hashlib.sha256()
+    for role, content in messages:
+        digest.update(role.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(content.strip().encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+class ChatSessionCache:
+    """Keep agents of stateless chat clients, keyed by the hash of the conversation they have seen.
+
+    OpenAI-style clients resend the whole history on every turn. After a turn the
+    agent is checked in under hash(history + question + answer); when the next
+    request arrives its history hashes to the same key and the agent, with its
+    memory already built, is checked out again instead of being rebuilt.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("CHAT_SESSION_CACHE_MAX_ENTRIES", "256"))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("CHAT_SESSION_CACHE_TTL_SECONDS", "1800"))
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    def checkout(self, history: Sequence[ConversationMessage]) -> Optional[Any]:
+        """Take the agent whose memory matches history; it is removed so no other request can share it."""
+        if not history:
+            return None
+        key = conversation_hash(history)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._metrics.set_gauge("chat_sessions.cached", len(self._entries))
+        if entry is None or entry[0] < time.time():
+            self._metrics.increment("chat_sessions.misses")
+            return None
+        self._metrics.increment("chat_sessions.hits")
+        return entry[1]
+
+    def checkout_or_create(self, history: Sequence[ConversationMessage], create_agent: Callable[[], Any]) -> Any:
+        """Checkout the agent for history, or build a new one and replay history into its memory."""
+        agent = self.checkout(history)
+        if agent is None:
+            agent = create_agent()
+            agent.load_history(list(history))
+        return agent
+
+    def checkin(self, conversation: Sequence[ConversationMessage], agent: Any):
+        """Store an agent under the full conversation it has now seen."""
+        key = conversation_hash(conversation)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, agent)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._metrics.set_gauge("chat_sessions.cached", len(self._entries))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def split_chat_messages(messages: List[Any]) -> Tuple[List[ConversationMessage], Optional[str]]:
+    """Split OpenAI-style messages into (history, latest user question).
+
+    System messages are dropped because the router has its own prompt; the
+    history is every user/assistant turn before the latest user message.
+    """
+    turns = [(message.role, message.content) for message in messages if message.role in ("user", "assistant")]
+    for index in range(len(turns) - 1, -1, -1):
+        if turns[index][0] == "user":
+            return turns[:index], turns[index][1]
+    return turns, None
+
+
+chat_session_cache = None
+
+def get_chat_session_cache() -> ChatSessionCache:
+    """Get or create the shared chat session cache"""
+    global chat_session_cache
+    if chat_session_cache is None:
+        chat_session_cache = ChatSessionCache()
+    return chat_session_cache
@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_ACQUIRE_TIMEOUT_SECONDS."""
+
+
+class _ConnectionInfo:
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class DatabasePool:
+    """Thread-safe psycopg2 connection pool with bounded waits, health checks and recycling.
+
+    Sized per worker process (DB_POOL_MAX_SIZE, default matching the oct
+    admission limit), so a process never holds more connections than it can
+    use. With DB_STATEMENT_TIMEOUT_AT_STARTUP=true connections are opened with
+    a server-side statement_timeout (DB_STATEMENT_TIMEOUT_MS) as a startup
+    option. That is opt-in because transaction poolers such as Supabase's
+    pgbouncer on port 6543 reject startup options; generated SQL is bounded
+    per transaction by the SQL guard either way. Connections older than DB_POOL_MAX_LIFETIME_SECONDS are replaced, and ones
+    idle longer than DB_POOL_HEALTH_CHECK_SECONDS are probed with SELECT 1
+    before being handed out. Metrics are reported under db_pool.<name>.*.
+    """
+
+    def __init__(self, name: str, dsn: Optional[str] = None, connect_kwargs: Optional[Dict[str, Any]] = None,
+                 min_size: int = None, max_size: int = None, acquire_timeout_seconds: float = None,
+                 max_lifetime_seconds: float = None, health_check_seconds: float = None,
+                 statement_timeout_ms: int = None, statement_timeout_at_startup: bool = None):
+        if min_size is None:
+            min_size = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+        if max_size is None:
+            max_size = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+        if acquire_timeout_seconds is None:
+            acquire_timeout_seconds = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", "10"))
+        if max_lifetime_seconds is None:
+            max_lifetime_seconds = float(os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "1800"))
+        if health_check_seconds is None:
+            health_check_seconds = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30"))
+        if statement_timeout_ms is None:
+            statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+        if statement_timeout_at_startup is None:
+            statement_timeout_at_startup = os.getenv("DB_STATEMENT_TIMEOUT_AT_STARTUP", "false").lower() == "true"
+        self.name = name
+        self.max_size = max_size
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self.health_check_seconds = health_check_seconds
+        self.statement_timeout_ms = statement_timeout_ms
+        self.statement_timeout_at_startup = statement_timeout_at_startup
+
+        connect_kwargs = dict(connect_kwargs or {})
+        if statement_timeout_at_startup:
+            connect_kwargs["options"] = f"{connect_kwargs.get('options', '')} -c statement_timeout={statement_timeout_ms}".strip()
+        self._pool = ThreadedConnectionPool(min(min_size, max_size), max_size, dsn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._info: Dict[int, _ConnectionInfo] = {}
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+        self._prefix = f"db_pool.{name}"
+        self._update_gauges()
+
+    def _update_gauges(self):
+        self._metrics.set_gauge(f"{self._prefix}.in_use", self._in_use)
+        self._metrics.set_gauge(f"{self._prefix}.open", len(self._info))
+        self._metrics.set_gauge(f"{self._prefix}.utilization", round(self._in_use / self.max_size, 3))
+
+    def _discard(self, conn: Any, reason: str):
+        with self._lock:
+            self._info.pop(id(conn), None)
+        self._metrics.increment(f"{self._prefix}.discarded.{reason}")
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception as e:
+            logger.warning(f"Error closing {self.name} connection: {e}")
+
+    def _is_healthy(self, conn: Any, info: _ConnectionInfo) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - info.last_used < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Pooled {self.name} connection failed its health check: {e}")
+            self._metrics.increment(f"{self._prefix}.health_check_failures")
+            return False
+
+    def acquire(self) -> Any:
+        """Take a healthy connection, waiting up to acquire_timeout_seconds for a free one."""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout_seconds):
+            self._metrics.increment(f"{self._prefix}.timeouts")
+            raise DatabasePoolTimeout(f"No {self.name} database connection free after {self.acquire_timeout_seconds}s")
+        try:
+            while True:
+                conn = self._pool.getconn()
+                with self._lock:
+                    info = self._info.get(id(conn))
+                    if info is None:
+                        info = self._info[id(conn)] = _ConnectionInfo()
+                        self._metrics.increment(f"{self._prefix}.connections_opened")
+                if time.monotonic() - info.created_at > self.max_lifetime_seconds:
+                    self._discard(conn, "max_lifetime")
+                    continue
+                if not self._is_healthy(conn, info):
+                    self._discard(conn, "unhealthy")
+                    continue
+                break
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._update_gauges()
+        self._metrics.observe(f"{self._prefix}.wait", (time.perf_counter() - started) * 1000)
+        return conn
+
+    def release(self, conn: Any):
+        """Return a connection; open transactions are rolled back and broken connections dropped."""
+        try:
+            if conn.closed:
+                self._discard(conn, "closed")
+                return
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn, "broken")
+                return
+            with self._lock:
+                info = self._info.get(id(conn))
+                if info is not None:
+                    info.last_used = time.monotonic()
+            self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self._update_gauges()
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            self._info.clear()
+            self._update_gauges()
+        self._pool.closeall()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "open": len(self._info),
+                "in_use": self._in_use,
+                "utilization": round(self._in_use / self.max_size, 3),
+                "statement_timeout_ms": self.statement_timeout_ms if self.statement_timeout_at_startup else None
+            }
+
+
+db_pools: Dict[str, DatabasePool] = {}
+_db_pools_lock = threading.Lock()
+
+def get_db_pool(name: str, dsn: Optional[str] = None, **connect_kwargs: Any) -> DatabasePool:
+    """Get or create the named connection pool of this process"""
+    with _db_pools_lock:
+        if name not in db_pools:
+            db_pools[name] = DatabasePool(name, dsn, connect_kwargs)
+        return db_pools[name]
+
+
+def get_db_pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: pool.get_stats() for name, pool in db_pools.items()}
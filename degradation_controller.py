@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from service_metrics import get_metrics_registry
+from admission_control import get_admission_controller
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, ordered by how much answer quality they give up
+LEVEL_NORMAL = 0
+LEVEL_CAPPED_RAG = 1        # WeChat RAG retrieves fewer, shorter documents
+LEVEL_TEMPLATED_OCT = 2     # OCT answers are templated instead of a second Gemini call
+LEVEL_KEYWORD_ROUTER = 3    # The router skips the ReAct LLM loop and routes by keyword
+
+LEVEL_NAMES = {
+    LEVEL_NORMAL: "normal",
+    LEVEL_CAPPED_RAG: "capped_rag",
+    LEVEL_TEMPLATED_OCT: "templated_oct",
+    LEVEL_KEYWORD_ROUTER: "keyword_router",
+}
+
+
+def _thresholds(env_name: str, default: str) -> List[float]:
+    """Comma-separated thresholds that enter levels 1..3"""
+    return [float(value) for value in os.getenv(env_name, default).split(",")]
+
+
+class DegradationController:
+    """Pick a degradation level from live LLM latency and admission queue pressure.
+
+    Each signal maps to a pressure level through three ascending thresholds
+    (DEGRADATION_LLM_LATENCY_MS, DEGRADATION_QUEUE_RATIO); the higher one wins.
+    Escalation is immediate. Recovery goes down one level at a time, only once
+    the pressure stays below recover_factor x the level's thresholds and the
+    current level has been held for min_hold_seconds, so the mode does not flap.
+    A latency signal without fresh samples is ignored: while the router runs
+    without an LLM there are no samples, and the service must still recover.
+    """
+
+    def __init__(self):
+        self.latency_thresholds_ms = _thresholds("DEGRADATION_LLM_LATENCY_MS", "8000,15000,25000")
+        self.queue_ratio_thresholds = _thresholds("DEGRADATION_QUEUE_RATIO", "0.5,0.75,0.9")
+        self.recover_factor = float(os.getenv("DEGRADATION_RECOVER_FACTOR", "0.7"))
+        self.min_hold_seconds = float(os.getenv("DEGRADATION_MIN_HOLD_SECONDS", "30"))
+        self.latency_stale_seconds = float(os.getenv("DEGRADATION_LATENCY_STALE_SECONDS", "60"))
+        self.evaluate_interval_seconds = 1.0
+        forced_level = os.getenv("DEGRADATION_FORCE_LEVEL")
+        self.forced_level: Optional[int] = int(forced_level) if forced_level else None
+
+        self.level = LEVEL_NORMAL
+        self._level_since = time.time()
+        self._latency_ewma_ms: Optional[float] = None
+        self._last_latency_at = 0.0
+        self._last_evaluated = 0.0
+        self._queue_ratio = 0.0
+        self._transitions: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    def observe_llm_latency(self, latency_ms: float):
+        """Feed one LLM call latency into the EWMA"""
+        with self._lock:
+            if self._latency_ewma_ms is None:
+                self._latency_ewma_ms = latency_ms
+            else:
+                self._latency_ewma_ms = 0.8 * self._latency_ewma_ms + 0.2 * latency_ms
+            self._last_latency_at = time.time()
+
+    def _pressure_level(self, latency_ms: float, queue_ratio: float, factor: float) -> int:
+        level = LEVEL_NORMAL
+        for index, (latency_threshold, queue_threshold) in enumerate(zip(self.latency_thresholds_ms, self.queue_ratio_thresholds)):
+            if latency_ms >= latency_threshold * factor or queue_ratio >= queue_threshold * factor:
+                level = index + 1
+        return level
+
+    def _queue_pressure(self) -> float:
+        limiters = get_admission_controller().limiters.values()
+        return max((limiter.queue_ratio() for limiter in limiters), default=0.0)
+
+    def current_level(self) -> int:
+        """Current level, re-evaluated at most once per second"""
+        if self.forced_level is not None:
+            return self.forced_level
+        now = time.time()
+        if now - self._last_evaluated < self.evaluate_interval_seconds:
+            return self.level
+        queue_ratio = self._queue_pressure()
+
+        with self._lock:
+            self._last_evaluated = now
+            self._queue_ratio = queue_ratio
+            latency_ms = 0.0
+            if self._latency_ewma_ms is not None and now - self._last_latency_at <= self.latency_stale_seconds:
+                latency_ms = self._latency_ewma_ms
+
+            pressure = self._pressure_level(latency_ms, queue_ratio, 1.0)
+            if pressure > self.level:
+                self._transition(pressure, latency_ms, queue_ratio, now)
+            elif self.level > LEVEL_NORMAL and now - self._level_since >= self.min_hold_seconds:
+                if self._pressure_level(latency_ms, queue_ratio, self.recover_factor) < self.level:
+                    self._transition(self.level - 1, latency_ms, queue_ratio, now)
+            return self.level
+
+    def _transition(self, level: int, latency_ms: float, queue_ratio: float, now: float):
+        transition = {
+            "at": now,
+            "from": LEVEL_NAMES[self.level],
+            "to": LEVEL_NAMES[level],
+            "llm_latency_ewma_ms": round(latency_ms, 1),
+            "queue_ratio": round(queue_ratio, 2)
+        }
+        logger.warning(f"Degradation mode {transition['from']} -> {transition['to']} "
+                       f"(llm latency {latency_ms:.0f}ms, queue ratio {queue_ratio:.2f})")
+        self._transitions.append(transition)
+        self.level = level
+        self._level_since = now
+        self._metrics.increment(f"degradation.transitions.{LEVEL_NAMES[level]}")
+        self._metrics.set_gauge("degradation.level", level)
+
+    def is_active(self, level: int) -> bool:
+        """Whether the measures of the given level are in effect"""
+        return self.current_level() >= level
+
+    def get_status(self) -> Dict[str, Any]:
+        level = self.current_level()
+        with self._lock:
+            return {
+                "level": level,
+                "mode": LEVEL_NAMES[level],
+                "forced": self.forced_level is not None,
+                "llm_latency_ewma_ms": round(self._latency_ewma_ms, 1) if self._latency_ewma_ms is not None else None,
+                "queue_ratio": round(self._queue_ratio, 2),
+                "transitions": list(self._transitions)
+            }
+
+
+degradation_controller = None
+
+def get_degradation_controller() -> DegradationController:
+    """Get or create the shared degradation controller"""
+    global degradation_controller
+    if degradation_controller is None:
+        degradation_controller = DegradationController()
+    return degradation_controller
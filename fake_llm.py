@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent_tracing import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Same keyword routing as MainRouterAgent._mock_query_response, expressed as ReAct actions
+SCRIPTED_TOOL_KEYWORDS = [
+    ("query_photovoltaic_capacity", ["承载力", "可开放容量", "光伏承载"]),
+    ("query_electricity_price", ["电价", "上网电价", "工商电价", "脱硫煤电价"]),
+    ("query_power_generation_duration", ["发电小时", "发电时长", "有效发电"]),
+    ("query_policies", ["政策", "补贴", "法规", "标准", "并网"]),
+    ("query_business_knowledge_base", ["投资", "合作", "业务", "项目", "门槛", "周期", "模式", "地面", "屋顶"]),
+]
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "".join(str(message.content) for message in messages)
+
+
+def _split_tokens(text: str) -> List[str]:
+    """Split output into pseudo-tokens: single CJK characters or short runs of other characters."""
+    tokens = []
+    buffer = ""
+    for char in text:
+        if "\u4e00" <= char <= "\u9fff":
+            if buffer:
+                tokens.append(buffer)
+                buffer = ""
+            tokens.append(char)
+        else:
+            buffer += char
+            if len(buffer) >= 4:
+                tokens.append(buffer)
+                buffer = ""
+    if buffer:
+        tokens.append(buffer)
+    return tokens
+
+
+def _apply_stop(text: str, stop: Optional[List[str]]) -> str:
+    for stop_sequence in stop or []:
+        index = text.find(stop_sequence)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
+class OfflineChatModel(BaseChatModel):
+    """Base class for network-free chat models with simulated Gemini-like latency.
+
+    Subclasses implement _respond(prompt_text). Latency is first_token_latency_ms
+    plus per_token_latency_ms for every output token, and streaming yields the
+    tokens one by one at that rate.
+    """
+
+    per_token_latency_ms: float = 0.0
+    first_token_latency_ms: float = 0.0
+    model_name: str = "offline"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model_name}
+
+    def _respond(self, prompt_text: str) -> str:
+        raise NotImplementedError
+
+    def _build_result(self, text: str) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"model_name": self.model_name}
+        )
+
+    def _total_delay_seconds(self, text: str) -> float:
+        return (self.first_token_latency_ms + self.per_token_latency_ms * estimate_tokens(text)) / 1000
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = _apply_stop(self._respond(_prompt_text(messages)), stop)
+        delay = self._total_delay_seconds(text)
+        if delay > 0:
+            time.sleep(delay)
+        return self._build_result(text)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = _apply_stop(self._respond(_prompt_text(messages)), stop)
+        delay = self._total_delay_seconds(text)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._build_result(text)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        text = _apply_stop(self._respond(_prompt_text(messages)), stop)
+        if self.first_token_latency_ms > 0:
+            time.sleep(self.first_token_latency_ms / 1000)
+        for token in _split_tokens(text):
+            if self.per_token_latency_ms > 0:
+                time.sleep(self.per_token_latency_ms / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        text = _apply_stop(self._respond(_prompt_text(messages)), stop)
+        if self.first_token_latency_ms > 0:
+            await asyncio.sleep(self.first_token_latency_ms / 1000)
+        for token in _split_tokens(text):
+            if self.per_token_latency_ms > 0:
+                await asyncio.sleep(self.per_token_latency_ms / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class ScriptedReActChatModel(OfflineChatModel):
+    """Deterministic ReAct policy: pick a tool by keyword, then answer with its observation."""
+
+    model_name: str = "scripted-react"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-react"
+
+    def _respond(self, prompt_text: str) -> str:
+        # The ReAct prompt ends with "Question: {input}\nThought: {agent_scratchpad}"
+        question_and_scratchpad = prompt_text.rsplit("Question: ", 1)[-1]
+        question, _, scratchpad = question_and_scratchpad.partition("\nThought:")
+        question = question.strip()
+
+        if "\nObservation:" in scratchpad:
+            observation = scratchpad.rsplit("\nObservation:", 1)[-1].split("\nThought:", 1)[0].strip()
+            return f"我现在知道最终答案了\nFinal Answer: {observation}"
+
+        for tool_name, keywords in SCRIPTED_TOOL_KEYWORDS:
+            if any(keyword in question for keyword in keywords):
+                return f"我需要使用{tool_name}来回答这个问题\nAction: {tool_name}\nAction Input: {question}"
+
+        return "我无法确定需要使用哪个工具\nFinal Answer: 抱歉，我无法理解您的问题。请询问关于电价、发电小时数、光伏承载力、政策或业务相关的问题。"
+
+
+def prompt_fingerprint(prompt_text: str) -> str:
+    """Stable key for a prompt, used by recordings."""
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+
+
+class ReplayChatModel(OfflineChatModel):
+    """Replay recorded LLM outputs keyed by prompt fingerprint (JSONL: {"prompt_sha256", "output"})."""
+
+    model_name: str = "replay"
+    recordings: Dict[str, str] = {}
+    fallback: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "ReplayChatModel":
+        recordings = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings[record["prompt_sha256"]] = record["output"]
+        logger.info(f"Loaded {len(recordings)} recorded LLM responses from {path}")
+        return cls(recordings=recordings, **kwargs)
+
+    def _respond(self, prompt_text: str) -> str:
+        output = self.recordings.get(prompt_fingerprint(prompt_text))
+        if output is not None:
+            return output
+        if isinstance(self.fallback, OfflineChatModel):
+            return self.fallback._respond(prompt_text)
+        raise KeyError("No recorded response for prompt and no offline fallback configured")
+
+
+class RecordingChatModel(BaseChatModel):
+    """Wrap a real chat model and append every prompt/output pair to a JSONL recording."""
+
+    inner: BaseChatModel
+    path: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _write(self, messages: List[BaseMessage], result: ChatResult):
+        record = {
+            "prompt_sha256": prompt_fingerprint(_prompt_text(messages)),
+            "output": result.generations[0].text if result.generations else ""
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self.inner._generate(messages, stop=stop, **kwargs)
+        self._write(messages, result)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+        self._write(messages, result)
+        return result
+
+
+def create_offline_llm(backend: str) -> Optional[BaseChatModel]:
+    """Build the offline LLM selected by ROUTER_LLM_BACKEND ("scripted" or "replay")."""
+    per_token_latency_ms = float(os.getenv("FAKE_LLM_TOKEN_LATENCY_MS", "0"))
+    first_token_latency_ms = float(os.getenv("FAKE_LLM_FIRST_TOKEN_LATENCY_MS", "0"))
+    scripted = ScriptedReActChatModel(
+        per_token_latency_ms=per_token_latency_ms,
+        first_token_latency_ms=first_token_latency_ms
+    )
+
+    if backend == "scripted":
+        return scripted
+    if backend == "replay":
+        replay_path = os.getenv("FAKE_LLM_REPLAY_PATH")
+        if not replay_path:
+            raise ValueError("FAKE_LLM_REPLAY_PATH must be set for the replay LLM backend")
+        return ReplayChatModel.from_file(
+            replay_path,
+            fallback=scripted,
+            per_token_latency_ms=per_token_latency_ms,
+            first_token_latency_ms=first_token_latency_ms
+        )
+    return None
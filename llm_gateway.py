@@ -0,0 +1,474 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import threading
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai.chat_models import _response_to_result
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from agent_tracing import estimate_tokens
+from llm_usage import record_model_usage
+from llm_response_cache import get_llm_response_cache, make_cache_key
+from request_cancellation import raise_if_cancelled
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is served first
+PRIORITY_WECHAT = 0         # WeChat callbacks must be answered within 5 seconds
+PRIORITY_INTERACTIVE = 1    # Router, OCT and chat endpoints
+PRIORITY_BACKGROUND = 2     # Prefetching, benchmarks, batch jobs
+
+# How long each priority class may wait for its model's rate limit
+DEFAULT_MAX_WAIT_SECONDS = {
+    PRIORITY_WECHAT: 3.0,
+    PRIORITY_INTERACTIVE: 30.0,
+    PRIORITY_BACKGROUND: 60.0,
+}
+
+
+class LLMRateLimited(Exception):
+    """The model's rate limit could not be satisfied in time; callers should degrade, not error."""
+
+    def __init__(self, model: str, caller: str, reason: str):
+        super().__init__(f"LLM {model} rate limited for {caller}: {reason}")
+        self.model = model
+        self.caller = caller
+        self.reason = reason
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Quota/overload errors worth retrying after a backoff"""
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests,
+                          google_exceptions.ServiceUnavailable)):
+        return True
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+def _env_model_key(model: str) -> str:
+    return model.upper().replace("-", "_").replace(".", "_")
+
+
+class ModelRateLimiter:
+    """Token bucket of requests per minute for one model, served in priority order.
+
+    Waiters queue in a heap ordered by (priority, arrival); only the head may
+    take a token, so a WeChat request never waits behind router traffic that
+    arrived earlier. After a 429 the bucket is paused for the backoff so every
+    caller backs off together instead of hammering the quota.
+    """
+
+    def __init__(self, model: str, requests_per_minute: float, burst: float):
+        self.model = model
+        self.rate_per_second = requests_per_minute / 60
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[list] = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def enqueue(self, priority: int) -> list:
+        with self._lock:
+            self._sequence += 1
+            ticket = [priority, self._sequence, True]
+            heapq.heappush(self._waiters, ticket)
+            return ticket
+
+    def try_acquire(self, ticket: list) -> float:
+        """Take a token for ticket; returns 0 when granted, else how long to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            while self._waiters and not self._waiters[0][2]:
+                heapq.heappop(self._waiters)
+            if self._waiters[0] is not ticket:
+                return 0.02
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= 1:
+                heapq.heappop(self._waiters)
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_second
+
+    def abandon(self, ticket: list):
+        with self._lock:
+            ticket[2] = False
+
+    def pause(self, seconds: float):
+        """Stop granting tokens for a while after the API reported a rate limit"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "requests_per_minute": round(self.rate_per_second * 60, 1),
+                "available": round(self._tokens, 2),
+                "waiting": sum(1 for ticket in self._waiters if ticket[2])
+            }
+
+
+class LLMGateway:
+    """Single entry point for Gemini calls from every agent.
+
+    Configures google.generativeai once, applies per-model request limits
+    (LLM_RPM_<MODEL>, default LLM_RPM_DEFAULT) with priority queuing, retries
+    rate-limit errors with jittered exponential backoff, and accounts usage per
+    caller under llm_gateway.<caller>.*.
+    """
+
+    def __init__(self):
+        self.default_rpm = float(os.getenv("LLM_RPM_DEFAULT", "60"))
+        self.max_retries = int(os.getenv("LLM_GATEWAY_MAX_RETRIES", "3"))
+        self.backoff_base_seconds = float(os.getenv("LLM_GATEWAY_BACKOFF_SECONDS", "1.0"))
+        self._limiters: Dict[str, ModelRateLimiter] = {}
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._configured = False
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    def configure(self):
+        """Configure google.generativeai with GOOGLE_API_KEY (once per process)"""
+        with self._lock:
+            if self._configured:
+                return
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY environment variable not set")
+            genai.configure(api_key=api_key)
+            self._configured = True
+
+    def get_model(self, model: str) -> genai.GenerativeModel:
+        self.configure()
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = genai.GenerativeModel(model)
+            return self._models[model]
+
+    def client(self, caller: str, model: str, priority: int = PRIORITY_INTERACTIVE) -> "GatewayModelClient":
+        """A genai.GenerativeModel look-alike whose calls go through the gateway"""
+        self.get_model(model)
+        return GatewayModelClient(self, caller, model, priority)
+
+    def _limiter(self, model: str) -> ModelRateLimiter:
+        model = model.replace("models/", "")
+        with self._lock:
+            if model not in self._limiters:
+                rpm = float(os.getenv(f"LLM_RPM_{_env_model_key(model)}", str(self.default_rpm)))
+                self._limiters[model] = ModelRateLimiter(model, rpm, burst=max(1.0, rpm / 6))
+            return self._limiters[model]
+
+    def _max_wait(self, priority: int) -> float:
+        return float(os.getenv(f"LLM_GATEWAY_MAX_WAIT_SECONDS_P{priority}", str(DEFAULT_MAX_WAIT_SECONDS[priority])))
+
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_base_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def acquire(self, model: str, caller: str, priority: int = PRIORITY_INTERACTIVE):
+        """Block until the model's rate limit admits one request"""
+        limiter = self._limiter(model)
+        started = time.monotonic()
+        deadline = started + self._max_wait(priority)
+        ticket = limiter.enqueue(priority)
+        try:
+            while True:
+                wait = limiter.try_acquire(ticket)
+                if wait == 0:
+                    break
+                if time.monotonic() + min(wait, 0.05) > deadline:
+                    raise self._rate_limited(model, caller, "rate limit wait exceeded")
+                raise_if_cancelled()
+                time.sleep(min(wait, 0.05))
+        finally:
+            limiter.abandon(ticket)
+        self._metrics.observe(f"llm_gateway.{caller}.wait", (time.monotonic() - started) * 1000)
+
+    async def acquire_async(self, model: str, caller: str, priority: int = PRIORITY_INTERACTIVE):
+        """Async counterpart of acquire(); waits without blocking the event loop"""
+        limiter = self._limiter(model)
+        started = time.monotonic()
+        deadline = started + self._max_wait(priority)
+        ticket = limiter.enqueue(priority)
+        try:
+            while True:
+                wait = limiter.try_acquire(ticket)
+                if wait == 0:
+                    break
+                if time.monotonic() + min(wait, 0.05) > deadline:
+                    raise self._rate_limited(model, caller, "rate limit wait exceeded")
+                await asyncio.sleep(min(wait, 0.05))
+        finally:
+            limiter.abandon(ticket)
+        self._metrics.observe(f"llm_gateway.{caller}.wait", (time.monotonic() - started) * 1000)
+
+    def _rate_limited(self, model: str, caller: str, reason: str) -> LLMRateLimited:
+        self._metrics.increment(f"llm_gateway.{caller}.rate_limited")
+        logger.warning(f"LLM {model} rate limited for {caller}: {reason}")
+        return LLMRateLimited(model, caller, reason)
+
+    def _on_rate_limit_error(self, model: str, caller: str, attempt: int, error: Exception) -> float:
+        if attempt >= self.max_retries:
+            raise self._rate_limited(model, caller, f"{type(error).__name__} after {attempt + 1} attempts") from error
+        delay = self._backoff(attempt)
+        self._limiter(model).pause(delay)
+        self._metrics.increment(f"llm_gateway.{caller}.retries")
+        logger.warning(f"LLM {model} returned {type(error).__name__} for {caller}, retrying in {delay:.1f}s")
+        return delay
+
+    def run(self, model: str, caller: str, call: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """Run one blocking LLM call under the model's rate limit, retrying rate-limit errors"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(model, caller, priority)
+            try:
+                result = call()
+                self._metrics.increment(f"llm_gateway.{caller}.calls")
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    self._metrics.increment(f"llm_gateway.{caller}.errors")
+                    raise
+                time.sleep(self._on_rate_limit_error(model, caller, attempt, e))
+
+    async def arun(self, model: str, caller: str, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """Async counterpart of run()"""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(model, caller, priority)
+            try:
+                result = await call()
+                self._metrics.increment(f"llm_gateway.{caller}.calls")
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    self._metrics.increment(f"llm_gateway.{caller}.errors")
+                    raise
+                await asyncio.sleep(self._on_rate_limit_error(model, caller, attempt, e))
+
+    def record_usage(self, caller: str, model: str, latency_ms: float, tokens_in: int, tokens_out: int):
+        self._metrics.increment(f"llm_gateway.{caller}.tokens_in", tokens_in)
+        self._metrics.increment(f"llm_gateway.{caller}.tokens_out", tokens_out)
+        record_model_usage(model, latency_ms, tokens_in, tokens_out)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model: limiter.get_stats() for model, limiter in limiters.items()}
+
+
+def _response_token_counts(prompt: Any, response: Any) -> tuple:
+    """Token counts from the response's usage metadata, estimated when it is missing"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None):
+        return usage.prompt_token_count, getattr(usage, "candidates_token_count", 0)
+    try:
+        output_text = response.text
+    except Exception:
+        output_text = ""
+    return estimate_tokens(str(prompt)), estimate_tokens(output_text)
+
+
+class CachedGenerateContentResponse:
+    """Stand-in for a GenerateContentResponse served from the LLM response cache"""
+
+    usage_metadata = None
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _generation_cache_key(model: str, prompt: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+    """Cache key for a generate_content call, or None unless it runs at temperature 0"""
+    generation_config = kwargs.get("generation_config")
+    if not isinstance(generation_config, dict) or generation_config.get("temperature") != 0:
+        return None
+    return make_cache_key(model, prompt, kwargs)
+
+
+class GatewayModelClient:
+    """Drop-in for genai.GenerativeModel.generate_content(_async) routed through the gateway.
+
+    Deterministic calls (generation_config temperature 0) are answered from the
+    LLM response cache when the exact same request was made before.
+    """
+
+    def __init__(self, gateway: LLMGateway, caller: str, model: str, priority: int):
+        self.gateway = gateway
+        self.caller = caller
+        self.model_name = model
+        self.priority = priority
+
+    def _cached(self, cache_key: Optional[str]) -> Optional[CachedGenerateContentResponse]:
+        if cache_key is None:
+            return None
+        text = get_llm_response_cache().get(cache_key)
+        if text is None:
+            return None
+        self.gateway._metrics.increment(f"llm_gateway.{self.caller}.cache_hits")
+        return CachedGenerateContentResponse(text)
+
+    def _store(self, cache_key: Optional[str], response: Any):
+        if cache_key is None:
+            return
+        try:
+            text = response.text
+        except ValueError:
+            # Blocked or empty candidates have no text; never cache those
+            return
+        get_llm_response_cache().set(cache_key, text)
+
+    def generate_content(self, prompt: Any, **kwargs: Any) -> Any:
+        cache_key = _generation_cache_key(self.model_name, prompt, kwargs)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        model = self.gateway.get_model(self.model_name)
+        started = time.perf_counter()
+        response = self.gateway.run(self.model_name, self.caller, lambda: model.generate_content(prompt, **kwargs), self.priority)
+        self.gateway.record_usage(self.caller, self.model_name, (time.perf_counter() - started) * 1000,
+                                  *_response_token_counts(prompt, response))
+        self._store(cache_key, response)
+        return response
+
+    async def generate_content_async(self, prompt: Any, **kwargs: Any) -> Any:
+        cache_key = _generation_cache_key(self.model_name, prompt, kwargs)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        model = self.gateway.get_model(self.model_name)
+        started = time.perf_counter()
+        response = await self.gateway.arun(self.model_name, self.caller, lambda: model.generate_content_async(prompt, **kwargs), self.priority)
+        self.gateway.record_usage(self.caller, self.model_name, (time.perf_counter() - started) * 1000,
+                                  *_response_token_counts(prompt, response))
+        self._store(cache_key, response)
+        return response
+
+    async def stream_content_async(self, prompt: Any, **kwargs: Any) -> AsyncIterator[str]:
+        """Yield response text as Gemini produces it; a cached response arrives as one chunk.
+
+        Only the initial request is retried on rate limits; a stream that fails
+        midway raises to the caller.
+        """
+        cache_key = _generation_cache_key(self.model_name, prompt, kwargs)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            yield cached.text
+            return
+        model = self.gateway.get_model(self.model_name)
+        started = time.perf_counter()
+        response = await self.gateway.arun(
+            self.model_name, self.caller, lambda: model.generate_content_async(prompt, stream=True, **kwargs), self.priority
+        )
+        chunks = []
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            chunks.append(text)
+            yield text
+        output_text = "".join(chunks)
+        self.gateway.record_usage(self.caller, self.model_name, (time.perf_counter() - started) * 1000,
+                                  estimate_tokens(str(prompt)), estimate_tokens(output_text))
+        if cache_key is not None and output_text:
+            get_llm_response_cache().set(cache_key, output_text)
+
+
+class GatewayChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """ChatGoogleGenerativeAI whose requests go through the LLM gateway.
+
+    The stock class retries up to 10 times with un-jittered backoff on its own;
+    this subclass sends each request once and lets the gateway own rate
+    limiting and retries. At temperature 0, repeated prompts are served from
+    the LLM response cache (llm_output["llm_cache_hit"] marks those results).
+    Model usage is recorded by the router's callbacks.
+    """
+
+    caller: str = "router"
+    priority: int = PRIORITY_INTERACTIVE
+
+    def _cache_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Optional[str]:
+        if self.temperature != 0:
+            return None
+        prompt = [(message.type, message.content) for message in messages]
+        params = {"stop": stop, "top_p": self.top_p, "top_k": self.top_k,
+                  "max_output_tokens": self.max_output_tokens, **kwargs}
+        return make_cache_key(self.model, prompt, params)
+
+    def _cached_result(self, cache_key: Optional[str]) -> Optional[ChatResult]:
+        if cache_key is None:
+            return None
+        text = get_llm_response_cache().get(cache_key)
+        if text is None:
+            return None
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"model_name": self.model, "llm_cache_hit": True}
+        )
+
+    def _store_result(self, cache_key: Optional[str], result: ChatResult) -> ChatResult:
+        if cache_key is not None and result.generations:
+            get_llm_response_cache().set(cache_key, result.generations[0].text)
+        return result
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cache_key = self._cache_key(messages, stop, kwargs)
+        cached = self._cached_result(cache_key)
+        if cached is not None:
+            return cached
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        response = get_llm_gateway().run(
+            self.model, self.caller, lambda: chat.send_message(content=message, **params), self.priority
+        )
+        return self._store_result(cache_key, _response_to_result(response))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cache_key = self._cache_key(messages, stop, kwargs)
+        cached = self._cached_result(cache_key)
+        if cached is not None:
+            return cached
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        response = await get_llm_gateway().arun(
+            self.model, self.caller, lambda: chat.send_message_async(content=message, **params), self.priority
+        )
+        return self._store_result(cache_key, _response_to_result(response))
+
+
+llm_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Get or create the shared LLM gateway"""
+    global llm_gateway
+    with _gateway_lock:
+        if llm_gateway is None:
+            llm_gateway = LLMGateway()
+        return llm_gateway
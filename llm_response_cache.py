@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, prompt: Any, params: Dict[str, Any]) -> str:
+    """Content address of one LLM request: sha256 over model, prompt and generation params"""
+    payload = json.dumps(
+        {"model": model.replace("models/", ""), "prompt": prompt, "params": params},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Exact-prompt cache for deterministic (temperature 0) LLM calls.
+
+    Responses live in an in-memory LRU and, when LLM_CACHE_SQLITE_PATH is set,
+    in a SQLite file shared across restarts and worker processes. Entries
+    expire after LLM_CACHE_TTL_SECONDS; disk hits are promoted to memory.
+    """
+
+    def __init__(self, enabled: bool = None, max_entries: int = None, ttl_seconds: int = None, sqlite_path: str = None):
+        if enabled is None:
+            enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        if max_entries is None:
+            max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+        if sqlite_path is None:
+            sqlite_path = os.getenv("LLM_CACHE_SQLITE_PATH")
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+        self._db: Optional[sqlite3.Connection] = None
+        if enabled and sqlite_path:
+            self._open_sqlite(sqlite_path)
+
+    def _open_sqlite(self, path: str):
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"LLM response cache persisted to {path}")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open LLM cache database {path}, using memory only: {e}")
+            self._db = None
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                self._metrics.increment("llm_cache.hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM llm_responses WHERE key = ? AND expires_at >= ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    self._store_in_memory(key, row[0], row[1])
+                    self._metrics.increment("llm_cache.hits")
+                    self._metrics.increment("llm_cache.disk_hits")
+                    return row[0]
+
+        self._metrics.increment("llm_cache.misses")
+        return None
+
+    def set(self, key: str, response: str):
+        if not self.enabled or not response:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store_in_memory(key, response, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO llm_responses (key, response, expires_at) VALUES (?, ?, ?)",
+                        (key, response, expires_at)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not persist LLM cache entry: {e}")
+
+    def _store_in_memory(self, key: str, response: str, expires_at: float):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._metrics.set_gauge("llm_cache.entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_responses")
+                self._db.commit()
+            self._metrics.set_gauge("llm_cache.entries", 0)
+
+
+llm_response_cache = None
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """Get or create the shared LLM response cache"""
+    global llm_response_cache
+    if llm_response_cache is None:
+        llm_response_cache = LLMResponseCache()
+    return llm_response_cache
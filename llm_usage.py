@@ -0,0 +1,31 @@
+from typing import Dict, Tuple
+
+from service_metrics import get_metrics_registry
+from degradation_controller import get_degradation_controller
+
+# USD per million tokens (input, output); used for relative cost tracking only
+MODEL_PRICING_PER_MILLION: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-flash-latest": (0.075, 0.30),
+}
+
+
+def estimate_cost_usd(model: str, tokens_in: int, tokens_out: int) -> float:
+    """Estimate the cost of one call from the pricing table (0 for unknown models)."""
+    price_in, price_out = MODEL_PRICING_PER_MILLION.get(model, (0.0, 0.0))
+    return (tokens_in * price_in + tokens_out * price_out) / 1_000_000
+
+
+def record_model_usage(model: str, latency_ms: float, tokens_in: int, tokens_out: int):
+    """Record latency, token and cost metrics for one LLM call under llm.<model>.*"""
+    metrics = get_metrics_registry()
+    metrics.observe(f"llm.{model}.latency", latency_ms)
+    metrics.increment(f"llm.{model}.calls")
+    metrics.increment(f"llm.{model}.tokens_in", tokens_in)
+    metrics.increment(f"llm.{model}.tokens_out", tokens_out)
+    metrics.increment(f"llm.{model}.cost_usd", estimate_cost_usd(model, tokens_in, tokens_out))
+    get_degradation_controller().observe_llm_latency(latency_ms)
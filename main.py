@@ -1,8 +1,7 @@
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 import asyncio
-import json
 import uuid
 import time
 from typing import Dict, Optional, List
@@ -17,6 +16,19 @@ from main_router_agent import create_main_router_agent, MainRouterAgent
 from oct_database_agent import get_oct_agent
 from wechat_rag_agent import get_wechat_rag_agent
 from wechat_api_handler import get_wechat_api_handler
+from agent_worker_pool import get_agent_worker_pool
+from service_metrics import get_metrics_registry
+from agent_tracing import RequestIdMiddleware, get_trace_store
+from chat_session_cache import get_chat_session_cache, split_chat_messages
+from sse_encoder import AgentStreamEncoder, OCTStreamEncoder, OpenAIStreamEncoder, DONE_EVENT
+from request_cancellation import CancellationToken, cancel_on_disconnect
+from resumable_stream import get_stream_registry
+from admission_control import AdmissionRejected, AdmittedStreamingResponse, get_admission_controller
+from degradation_controller import get_degradation_controller
+from llm_gateway import get_llm_gateway
+from tool_prefetch import get_tool_prefetcher
+from db_pool import get_db_pool_stats
+from oct_local_replica import get_local_replica_stats, local_replicas
 from pydantic import BaseModel
 from fastapi import Request, Form, Query, HTTPException
 
@@ -41,6 +53,16 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Fast 429 with Retry-After when a route class is saturated"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "route_class": exc.route_class},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 electricity_tool = create_electricity_price_tool()
 power_generation_tool = create_power_generation_duration_tool()
@@ -83,42 +105,46 @@ async def root():
 @app.post("/query_electricity_price", response_model=QueryResponse)
 async def query_electricity_price(request: QueryRequest):
     """查询电价接口"""
-    try:
-        result = electricity_tool._run(request.query)
-        success = not result.startswith("电价查询失败")
-        return QueryResponse(result=result, success=success)
-    except Exception as e:
-        return QueryResponse(result=f"系统错误: {str(e)}", success=False)
+    async with get_admission_controller().limit("tool"):
+        try:
+            result = await asyncio.to_thread(electricity_tool._run, request.query)
+            success = not result.startswith("电价查询失败")
+            return QueryResponse(result=result, success=success)
+        except Exception as e:
+            return QueryResponse(result=f"系统错误: {str(e)}", success=False)
 
 @app.post("/query_power_generation_duration", response_model=QueryResponse)
 async def query_power_generation_duration(request: QueryRequest):
     """查询有效发电小时数接口"""
-    try:
-        result = power_generation_tool._run(request.query)
-        success = not result.startswith("有效发电小时数查询失败")
-        return QueryResponse(result=result, success=success)
-    except Exception as e:
-        return QueryResponse(result=f"系统错误: {str(e)}", success=False)
+    async with get_admission_controller().limit("tool"):
+        try:
+            result = await asyncio.to_thread(power_generation_tool._run, request.query)
+            success = not result.startswith("有效发电小时数查询失败")
+            return QueryResponse(result=result, success=success)
+        except Exception as e:
+            return QueryResponse(result=f"系统错误: {str(e)}", success=False)
 
 @app.post("/query_photovoltaic_capacity", response_model=QueryResponse)
 async def query_photovoltaic_capacity(request: QueryRequest):
     """查询光伏承载力接口"""
-    try:
-        result = photovoltaic_tool._run(request.query)
-        success = not result.startswith("光伏承载力查询失败")
-        return QueryResponse(result=result, success=success)
-    except Exception as e:
-        return QueryResponse(result=f"系统错误: {str(e)}", success=False)
+    async with get_admission_controller().limit("tool"):
+        try:
+            result = await asyncio.to_thread(photovoltaic_tool._run, request.query)
+            success = not result.startswith("光伏承载力查询失败")
+            return QueryResponse(result=result, success=success)
+        except Exception as e:
+            return QueryResponse(result=f"系统错误: {str(e)}", success=False)
 
 @app.post("/query_policies", response_model=QueryResponse)
 async def query_policies(request: QueryRequest):
     """查询政策接口"""
-    try:
-        result = policy_tool._run(request.query)
-        success = not result.startswith("政策查询失败")
-        return QueryResponse(result=result, success=success)
-    except Exception as e:
-        return QueryResponse(result=f"系统错误: {str(e)}", success=False)
+    async with get_admission_controller().limit("tool"):
+        try:
+            result = await asyncio.to_thread(policy_tool._run, request.query)
+            success = not result.startswith("政策查询失败")
+            return QueryResponse(result=result, success=success)
+        except Exception as e:
+            return QueryResponse(result=f"系统错误: {str(e)}", success=False)
 
 def get_or_create_agent(session_id: Optional[str]) -> tuple[MainRouterAgent, str]:
     """Get or create agent for session with memory management."""
@@ -131,51 +157,63 @@ def get_or_create_agent(session_id: Optional[str]) -> tuple[MainRouterAgent, str
     return session_agents[session_id], session_id
 
 @app.post("/ask_agent", response_model=QueryResponse)
-async def ask_agent(request: QueryRequest):
+async def ask_agent(request: QueryRequest, http_request: Request):
     """智能问答接口 - 主路由Agent (非流式)"""
-    try:
-        agent, session_id = get_or_create_agent(request.session_id)
-        result = agent.query(request.query)
-        success = not any(error_phrase in result for error_phrase in ["出现错误", "无法处理", "无法理解"])
-        return QueryResponse(result=result, success=success)
-    except Exception as e:
-        return QueryResponse(result=f"系统错误: {str(e)}", success=False)
+    async with get_admission_controller().limit("agent"):
+        try:
+            agent, session_id = get_or_create_agent(request.session_id)
+            result = await agent.aquery(request.query, http_request.state.request_id)
+            success = not any(error_phrase in result for error_phrase in ["出现错误", "无法处理", "无法理解"])
+            return QueryResponse(result=result, success=success)
+        except Exception as e:
+            return QueryResponse(result=f"系统错误: {str(e)}", success=False)
 
 @app.post("/ask_agent_stream")
-async def ask_agent_stream(request: QueryRequest):
-    """智能问答接口 - 主路由Agent (流式响应) with session memory"""
+async def ask_agent_stream(request: QueryRequest, http_request: Request):
+    """智能问答接口 - 主路由Agent (流式响应) with session memory
     
-    async def generate_stream():
+    Every event carries an SSE id "<stream_id>:<seq>" with a server-issued stream id;
+    reconnecting with a Last-Event-ID header resumes the buffered stream instead of
+    starting a new agent run.
+    """
+    
+    async def generate_stream(slot):
         """Generate Server-Sent Events stream with session management"""
+        encoder = AgentStreamEncoder()
         try:
             agent, session_id = get_or_create_agent(request.session_id)
             
-            session_data = json.dumps({'session_id': session_id, 'type': 'session'}, ensure_ascii=False)
-            yield f"data: {session_data}\n\n".encode('utf-8')
+            yield encoder.session(session_id)
             
-            async for chunk in agent.query_stream(request.query):
+            async for chunk in agent.query_stream(request.query, http_request.state.request_id):
                 if chunk:
-                    chunk_escaped = chunk.replace('\n', '\\n').replace('\r', '\\r')
-                    data = json.dumps({'chunk': chunk_escaped, 'type': 'content'}, ensure_ascii=False)
-                    yield f"data: {data}\n\n".encode('utf-8')
+                    yield encoder.content(chunk)
                     
-            done_data = json.dumps({'type': 'done'}, ensure_ascii=False)
-            yield f"data: {done_data}\n\n".encode('utf-8')
+            yield encoder.done()
             
         except Exception as e:
-            error_msg = f"系统错误: {str(e)}"
-            error_data = json.dumps({'chunk': error_msg, 'type': 'error'}, ensure_ascii=False)
-            yield f"data: {error_data}\n\n".encode('utf-8')
-            done_data = json.dumps({'type': 'done'}, ensure_ascii=False)
-            yield f"data: {done_data}\n\n".encode('utf-8')
+            yield encoder.error(f"系统错误: {str(e)}")
+            yield encoder.done()
+        finally:
+            slot.release()
+    
+    stream_registry = get_stream_registry()
+    resumed = stream_registry.resume(http_request.headers.get("last-event-id"))
+    if resumed is not None:
+        stream_run, after_seq = resumed
+    else:
+        # The slot is held by the agent run itself, which outlives any one connection
+        slot = await get_admission_controller().admit("agent")
+        stream_run, after_seq = stream_registry.start(generate_stream(slot)), 0
     
     return StreamingResponse(
-        generate_stream(),
+        stream_run.follow(http_request, after_seq),
         media_type="text/event-stream; charset=utf-8",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "Content-Type": "text/event-stream; charset=utf-8",
+            "X-Accel-Buffering": "no",
         }
     )
 
@@ -191,32 +229,76 @@ async def clear_session(request: dict):
 @app.post("/ask_oct")
 async def ask_oct_question(request: QueryRequest):
     """OCT database Q&A endpoint"""
-    try:
-        oct_agent = get_oct_agent()
+    async with get_admission_controller().limit("oct"):
+        try:
+            oct_agent = get_oct_agent()
         
-        result = await oct_agent.ask_question(request.query)
+            result = await oct_agent.ask_question(request.query)
         
-        return {
-            "question": request.query,
-            "answer": result.get("answer", ""),
-            "status": result.get("status", "error"),
-            "success": result.get("status") == "success"
-        }
+            return {
+                "question": request.query,
+                "answer": result.get("answer", ""),
+                "status": result.get("status", "error"),
+                "success": result.get("status") == "success",
+                "timings": result.get("timings", {})
+            }
         
-    except Exception as e:
-        return {
-            "question": request.query,
-            "answer": f"系统错误: {str(e)}",
-            "status": "error",
-            "success": False
+        except Exception as e:
+            return {
+                "question": request.query,
+                "answer": f"系统错误: {str(e)}",
+                "status": "error",
+                "success": False
+            }
+
+@app.post("/ask_oct_stream")
+async def ask_oct_question_stream(request: QueryRequest, http_request: Request):
+    """OCT database Q&A endpoint (流式响应)
+    
+    Emits one SSE event per stage as soon as it completes: "sql" with the statement,
+    "rows" with the row count and a preview, "answer" deltas, then "done" with stage
+    timings (or "error").
+    """
+    
+    async def generate_oct_stream():
+        encoder = OCTStreamEncoder()
+        try:
+            oct_agent = get_oct_agent()
+            token = CancellationToken(http_request.state.request_id)
+            async for event in cancel_on_disconnect(http_request, oct_agent.ask_question_stream(request.query), token):
+                yield encoder.event(event)
+        except Exception as e:
+            yield encoder.event({"type": "error", "message": f"系统错误: {str(e)}"})
+    
+    slot = await get_admission_controller().admit("oct")
+    return AdmittedStreamingResponse(
+        generate_oct_stream(),
+        slot,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
         }
+    )
 
 @app.get("/oct/database_info")
 async def get_oct_database_info():
     """Get OCT database schema information"""
     try:
         oct_agent = get_oct_agent()
-        return oct_agent.get_database_info()
+        return await asyncio.to_thread(oct_agent.get_database_info)
+    except Exception as e:
+        return {"error": str(e), "status": "error"}
+
+@app.post("/oct/replica/refresh")
+async def refresh_oct_replicas():
+    """Reload the in-process OCT replicas now, e.g. when the OCT tables were just updated"""
+    try:
+        reloaded = {}
+        for name, replica in list(local_replicas.items()):
+            reloaded[name] = await asyncio.to_thread(replica.refresh, True)
+        return {"reloaded": reloaded, "status": "success"}
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
@@ -234,9 +316,31 @@ async def health_check():
             "wechat_rag_agent": "企业微信RAG智能体",
             "wechat_api_handler": "企业微信API处理器"
         },
-        "active_sessions": len(session_agents)
+        "active_sessions": len(session_agents),
+        "cached_chat_sessions": len(get_chat_session_cache()),
+        "buffered_streams": len(get_stream_registry()),
+        "agent_pool": get_agent_worker_pool().get_stats(),
+        "admission": get_admission_controller().get_stats(),
+        "degradation": get_degradation_controller().get_status(),
+        "llm_gateway": get_llm_gateway().get_stats(),
+        "tool_prefetch": get_tool_prefetcher().get_stats(),
+        "db_pools": get_db_pool_stats(),
+        "oct_replicas": get_local_replica_stats()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """In-process service metrics (counters, gauges, latency summaries)"""
+    return get_metrics_registry().snapshot()
+
+@app.get("/traces/{request_id}")
+async def get_agent_trace(request_id: str):
+    """Per-step timing trace of an agent run, looked up by the X-Request-ID the server returned"""
+    trace = get_trace_store().get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {request_id} not found")
+    return trace
+
 @app.get("/v1/models")
 async def list_models():
     """OpenAI-compatible models endpoint"""
@@ -252,86 +356,53 @@ async def list_models():
         ]
     }
 
+def checkout_chat_agent(history: List[tuple]) -> MainRouterAgent:
+    """Reuse the agent that already saw this conversation, or rebuild memory from the client history."""
+    return get_chat_session_cache().checkout_or_create(history, create_main_router_agent)
+
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+async def chat_completions(request: ChatCompletionRequest, http_request: Request):
     """OpenAI-compatible chat completions endpoint"""
+    slot = await get_admission_controller().admit("agent")
     try:
-        user_message = None
-        for message in reversed(request.messages):
-            if message.role == "user":
-                user_message = message.content
-                break
+        history, user_message = split_chat_messages(request.messages)
         
         if not user_message:
             user_message = "你好"
         
-        agent, session_id = get_or_create_agent(None)
+        agent = checkout_chat_agent(history)
         
         if request.stream:
             async def generate_openai_stream():
+                encoder = OpenAIStreamEncoder(f"chatcmpl-{uuid.uuid4().hex[:8]}", int(time.time()), request.model)
                 try:
-                    response_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
-                    created = int(time.time())
+                    streamed_content = []
                     
-                    initial_chunk = {
-                        "id": response_id,
-                        "object": "chat.completion.chunk",
-                        "created": created,
-                        "model": request.model,
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"role": "assistant", "content": ""},
-                            "finish_reason": None
-                        }]
-                    }
-                    yield f"data: {json.dumps(initial_chunk, ensure_ascii=False)}\n\n"
+                    yield encoder.role()
                     
-                    async for chunk in agent.query_stream(user_message):
+                    token = CancellationToken(http_request.state.request_id)
+                    async for chunk in cancel_on_disconnect(http_request, agent.query_stream(user_message, token.request_id), token):
                         if chunk:
-                            content_chunk = {
-                                "id": response_id,
-                                "object": "chat.completion.chunk",
-                                "created": created,
-                                "model": request.model,
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {"content": chunk},
-                                    "finish_reason": None
-                                }]
-                            }
-                            yield f"data: {json.dumps(content_chunk, ensure_ascii=False)}\n\n"
+                            streamed_content.append(chunk)
+                            yield encoder.content(chunk)
+                    if token.cancelled:
+                        return
+                    
+                    get_chat_session_cache().checkin(
+                        history + [("user", user_message), ("assistant", "".join(streamed_content))],
+                        agent
+                    )
                     
-                    final_chunk = {
-                        "id": response_id,
-                        "object": "chat.completion.chunk",
-                        "created": created,
-                        "model": request.model,
-                        "choices": [{
-                            "index": 0,
-                            "delta": {},
-                            "finish_reason": "stop"
-                        }]
-                    }
-                    yield f"data: {json.dumps(final_chunk, ensure_ascii=False)}\n\n"
-                    yield "data: [DONE]\n\n"
+                    yield encoder.stop()
+                    yield DONE_EVENT
                     
                 except Exception as e:
-                    error_chunk = {
-                        "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": request.model,
-                        "choices": [{
-                            "index": 0,
-                            "delta": {"content": f"系统错误: {str(e)}"},
-                            "finish_reason": "stop"
-                        }]
-                    }
-                    yield f"data: {json.dumps(error_chunk, ensure_ascii=False)}\n\n"
-                    yield "data: [DONE]\n\n"
+                    yield encoder.error(f"系统错误: {str(e)}")
+                    yield DONE_EVENT
             
-            return StreamingResponse(
+            return AdmittedStreamingResponse(
                 generate_openai_stream(),
+                slot,
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -339,7 +410,11 @@ async def chat_completions(request: ChatCompletionRequest):
                 }
             )
         else:
-            result = agent.query(user_message)
+            try:
+                result = await agent.aquery(user_message, http_request.state.request_id)
+            finally:
+                slot.release()
+            get_chat_session_cache().checkin(history + [("user", user_message), ("assistant", result)], agent)
             response = {
                 "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
                 "object": "chat.completion",
@@ -362,6 +437,7 @@ async def chat_completions(request: ChatCompletionRequest):
             return response
             
     except Exception as e:
+        slot.release()
         return {
             "error": {
                 "message": f"系统错误: {str(e)}",
@@ -402,12 +478,21 @@ async def wechat_webhook(
             return Response(content="success", media_type="text/plain")
         
         rag_agent = get_wechat_rag_agent()
-        response_data = await rag_agent.process_message(
-            user_message['content'], 
-            user_message['from_user']
-        )
+        try:
+            async with get_admission_controller().limit("wechat"):
+                response_data = await rag_agent.process_message(
+                    user_message['content'], 
+                    user_message['from_user']
+                )
+        except AdmissionRejected:
+            busy_response = wechat_handler.create_response_xml(
+                user_message['from_user'],
+                user_message['to_user'],
+                "当前咨询人数较多，请稍后再试。"
+            )
+            return Response(content=busy_response, media_type="application/xml")
         
-        if response_data['status'] == 'success':
+        if response_data['status'] in ('success', 'rate_limited'):
             response_xml = wechat_handler.create_response_xml(
                 user_message['from_user'],
                 user_message['to_user'], 
@@ -444,13 +529,14 @@ async def send_wechat_message(request: WeChatMessageRequest):
 @app.post("/wechat/rag-chat")
 async def wechat_rag_chat(request: WeChatRAGRequest):
     """企业微信RAG对话接口"""
-    try:
-        rag_agent = get_wechat_rag_agent()
-        result = await rag_agent.process_message(request.message, request.user_id)
-        return result
-    except Exception as e:
-        logger.error(f"Error in WeChat RAG chat: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission_controller().limit("wechat"):
+        try:
+            rag_agent = get_wechat_rag_agent()
+            result = await rag_agent.process_message(request.message, request.user_id)
+            return result
+        except Exception as e:
+            logger.error(f"Error in WeChat RAG chat: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/wechat/knowledge-base-info")
 async def get_wechat_knowledge_base_info():
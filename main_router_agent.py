@@ -1,8 +1,9 @@
 import os
-from typing import List, Any
+import asyncio
+from typing import List, Any, Optional
 from langchain.agents import create_react_agent, AgentExecutor
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models import BaseChatModel
 from langchain.tools import BaseTool
 from langchain.memory import ConversationBufferMemory
 from dotenv import load_dotenv
@@ -12,15 +13,29 @@ from power_generation_duration_tool import create_power_generation_duration_tool
 from photovoltaic_capacity_tool import create_photovoltaic_capacity_tool
 from policy_query_tool import create_policy_query_tool
 from business_knowledge_tool import create_business_knowledge_tool
+from agent_worker_pool import get_agent_worker_pool
+from answer_cache import get_answer_cache
+from agent_tracing import AgentTraceCallbackHandler
+from model_cascade import CascadeChatModel, SCRATCHPAD_MARKER
+from fake_llm import create_offline_llm, RecordingChatModel
+from request_cancellation import CancellationCallbackHandler, RequestCancelled, get_cancellation_token
+from degradation_controller import get_degradation_controller, LEVEL_KEYWORD_ROUTER
+from llm_gateway import GatewayChatGoogleGenerativeAI, LLMRateLimited
+from tool_prefetch import get_tool_prefetcher
 
 load_dotenv()
 
+PARSE_ERROR_MESSAGE = "Check your output and make sure it conforms to the expected format. Try again."
+
+# Default for query()'s cache_key: the answer cache has not been consulted yet
+CACHE_NOT_CHECKED = object()
+
 class MainRouterAgent:
     """Main Router Agent that intelligently routes queries to appropriate tools with conversation memory."""
     
-    def __init__(self):
+    def __init__(self, llm: Optional[BaseChatModel] = None):
         self.tools = self._load_tools()
-        self.llm = self._setup_llm()
+        self.llm = llm if llm is not None else self._setup_llm()
         self.memory = self._setup_memory()
         self.agent_executor = self._create_agent_executor()
     
@@ -43,33 +58,67 @@ class MainRouterAgent:
             output_key="output"
         )
     
-    def _setup_llm(self) -> ChatGoogleGenerativeAI:
+    def _setup_llm(self) -> Optional[BaseChatModel]:
+        """Setup the router LLM: Gemini by default, or an offline backend for benchmarks."""
+        backend = os.getenv("ROUTER_LLM_BACKEND", "gemini").lower()
+        if backend != "gemini":
+            print(f"Using offline {backend} LLM backend")
+            return create_offline_llm(backend)
+        
+        llm = self._setup_gemini_llm()
+        record_path = os.getenv("ROUTER_LLM_RECORD_PATH")
+        if llm is not None and record_path:
+            return RecordingChatModel(inner=llm, path=record_path)
+        return llm
+    
+    def _setup_gemini_llm(self) -> Optional[BaseChatModel]:
         """Setup the Google Gemini language model with fallback logic."""
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             print("Warning: GOOGLE_API_KEY not found, using mock setup")
             return None
         
+        strong_model_name = os.getenv("ROUTER_STRONG_MODEL", "gemini-2.5-flash")
         try:
-            print("Attempting to initialize Gemini 2.5 Flash model...")
-            return ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                temperature=0,
-                google_api_key=api_key
-            )
+            print(f"Attempting to initialize {strong_model_name} model...")
+            strong_llm = self._create_gemini_model(strong_model_name, api_key)
         except Exception as e:
-            print(f"Failed to initialize gemini-2.5-flash: {str(e)}")
+            print(f"Failed to initialize {strong_model_name}: {str(e)}")
             print("Falling back to gemini-1.5-flash-latest...")
             try:
-                return ChatGoogleGenerativeAI(
-                    model="gemini-1.5-flash-latest",
-                    temperature=0,
-                    google_api_key=api_key
-                )
+                strong_model_name = "gemini-1.5-flash-latest"
+                strong_llm = self._create_gemini_model(strong_model_name, api_key)
             except Exception as fallback_e:
                 print(f"Fallback model also failed: {str(fallback_e)}")
                 print("Using mock setup due to model initialization failures")
                 return None
+        
+        fast_model_name = os.getenv("ROUTER_FAST_MODEL")
+        if not fast_model_name or fast_model_name == strong_model_name:
+            return strong_llm
+        
+        try:
+            fast_llm = self._create_gemini_model(fast_model_name, api_key)
+        except Exception as e:
+            print(f"Failed to initialize fast model {fast_model_name}: {str(e)}, using {strong_model_name} only")
+            return strong_llm
+        
+        print(f"Using model cascade: {fast_model_name} for routing, {strong_model_name} for synthesis")
+        return CascadeChatModel(
+            fast_llm=fast_llm,
+            strong_llm=strong_llm,
+            fast_model_name=fast_model_name,
+            strong_model_name=strong_model_name,
+            parse_error_marker=PARSE_ERROR_MESSAGE
+        )
+    
+    def _create_gemini_model(self, model_name: str, api_key: str) -> GatewayChatGoogleGenerativeAI:
+        """Create a deterministic Gemini chat model whose calls go through the shared LLM gateway."""
+        return GatewayChatGoogleGenerativeAI(
+            model=model_name,
+            temperature=0,
+            google_api_key=api_key
+        )
     
     def _create_main_prompt(self) -> PromptTemplate:
         """Create the main prompt template for the agent with conversation memory."""
@@ -123,9 +172,7 @@ Final Answer: 给用户的最终回答
 - 保持格式严格一致，避免格式错误
 - 充分利用对话历史来理解用户的指代和上下文
 
-开始！
-
-Question: {input}
+""" + SCRATCHPAD_MARKER + """{input}
 Thought: {agent_scratchpad}"""
 
         return PromptTemplate(
@@ -145,28 +192,108 @@ Thought: {agent_scratchpad}"""
             agent=agent,
             tools=self.tools,
             memory=self.memory,
-            verbose=True,
-            handle_parsing_errors="Check your output and make sure it conforms to the expected format. Try again.",
+            verbose=os.getenv("AGENT_VERBOSE", "true").lower() == "true",
+            handle_parsing_errors=PARSE_ERROR_MESSAGE,
             max_iterations=10,
             max_execution_time=30,
             early_stopping_method="force"
         )
     
-    def query(self, user_input: str) -> str:
-        """Process user query and return response."""
+    def _lookup_cached_answer(self, user_input: str) -> tuple:
+        """Return (cache_key, cached_answer); the key is None when the cache is bypassed."""
+        answer_cache = get_answer_cache()
+        cache_key = answer_cache.lookup_key(user_input, self.tools)
+        if cache_key is None:
+            return None, None
+        return cache_key, answer_cache.get(cache_key)
+    
+    def _serve_cached_answer(self, user_input: str, answer: str) -> str:
+        """Record a cached answer in memory so follow-up turns still see it."""
+        self.memory.save_context({"input": user_input}, {"output": answer})
+        self._prefetch_followups(user_input)
+        return answer
+    
+    def _prefetch_followups(self, user_input: str):
+        """Warm the tool cache for what users usually ask next about the location this turn resolved."""
+        get_tool_prefetcher().prefetch_followups(user_input, self.tools)
+    
+    def _keyword_route_response(self, user_input: str, trace: AgentTraceCallbackHandler) -> str:
+        """Degraded mode: answer through the keyword router without any LLM call."""
+        result = self._mock_query_response(user_input, tag="快速路由")
+        self.memory.save_context({"input": user_input}, {"output": result})
+        trace.finish("degraded")
+        return result
+    
+    def _run_callbacks(self, trace: AgentTraceCallbackHandler) -> list:
+        """Callbacks for one agent run; a cancellable request also stops at its next LLM or tool step."""
+        callbacks = [trace]
+        token = get_cancellation_token()
+        if token is not None:
+            callbacks.append(CancellationCallbackHandler(token))
+        return callbacks
+    
+    def query(self, user_input: str, request_id: Optional[str] = None, cache_key: Any = CACHE_NOT_CHECKED) -> str:
+        """Process user query and return response.
+        
+        A caller that already missed the answer cache passes the key it computed
+        (None when the cache was bypassed), so the lookup is not repeated.
+        """
+        trace = AgentTraceCallbackHandler(request_id, user_input)
         if not self.agent_executor:
-            return self._mock_query_response(user_input)
+            result = self._mock_query_response(user_input)
+            trace.finish("mock")
+            return result
         
+        if cache_key is CACHE_NOT_CHECKED:
+            cache_key, cached_answer = self._lookup_cached_answer(user_input)
+            if cached_answer is not None:
+                trace.mark_cache_hit()
+                trace.finish()
+                return self._serve_cached_answer(user_input, cached_answer)
+        
+        if get_degradation_controller().is_active(LEVEL_KEYWORD_ROUTER):
+            return self._keyword_route_response(user_input, trace)
+        
+        # Start the tool call the agent is likely to make while its first LLM step runs
+        speculation = get_tool_prefetcher().speculate(user_input, self.tools)
         try:
-            result = self.agent_executor.invoke({"input": user_input})
-            return result.get("output", "抱歉，我无法处理您的问题。")
+            result = self.agent_executor.invoke({"input": user_input}, config={"callbacks": self._run_callbacks(trace)})
+            output = result.get("output", "抱歉，我无法处理您的问题。")
+            if cache_key is not None:
+                get_answer_cache().set(cache_key, output)
+            trace.finish()
+            self._prefetch_followups(user_input)
+            return output
+        except RequestCancelled:
+            trace.finish("cancelled")
+            raise
+        except LLMRateLimited:
+            return self._keyword_route_response(user_input, trace)
         except Exception as e:
+            trace.finish("error")
             return f"处理查询时出现错误：{str(e)}"
+        finally:
+            if speculation is not None:
+                speculation.settle()
+    
+    async def aquery(self, user_input: str, request_id: Optional[str] = None) -> str:
+        """Process user query on the agent worker pool without blocking the event loop."""
+        if not self.agent_executor:
+            return await get_agent_worker_pool().run(self.query, user_input, request_id)
+        cache_key, cached_answer = self._lookup_cached_answer(user_input)
+        if cached_answer is not None:
+            trace = AgentTraceCallbackHandler(request_id, user_input)
+            trace.mark_cache_hit()
+            trace.finish()
+            return self._serve_cached_answer(user_input, cached_answer)
+        return await get_agent_worker_pool().run(self.query, user_input, request_id, cache_key)
     
-    async def query_stream(self, user_input: str):
+    async def query_stream(self, user_input: str, request_id: Optional[str] = None):
         """Process user query and return streaming response with improved error handling, deduplication, and memory."""
+        trace = AgentTraceCallbackHandler(request_id, user_input)
         if not self.agent_executor:
             mock_response = self._mock_query_response(user_input)
+            trace.finish("mock")
             words = mock_response.split()
             for i, word in enumerate(words):
                 if i == 0:
@@ -175,10 +302,23 @@ Thought: {agent_scratchpad}"""
                     yield f" {word}"
             return
         
+        cache_key, cached_answer = self._lookup_cached_answer(user_input)
+        if cached_answer is not None:
+            trace.mark_cache_hit()
+            trace.finish()
+            yield f"\nFinal Answer: {self._serve_cached_answer(user_input, cached_answer)}"
+            return
+        
+        if get_degradation_controller().is_active(LEVEL_KEYWORD_ROUTER):
+            result = await get_agent_worker_pool().run(self._keyword_route_response, user_input, trace)
+            yield f"\nFinal Answer: {result}"
+            return
+        
         yielded_content = set()
+        speculation = get_tool_prefetcher().speculate(user_input, self.tools)
         
         try:
-            async for event in self.agent_executor.astream({"input": user_input}):
+            async for event in self.agent_executor.astream({"input": user_input}, config={"callbacks": self._run_callbacks(trace)}):
                 if isinstance(event, dict):
                     for key, value in event.items():
                         if key == "agent" and isinstance(value, dict):
@@ -201,22 +341,46 @@ Thought: {agent_scratchpad}"""
                                             yield obs_content
                         
                         elif key == "output" and isinstance(value, str):
+                            if cache_key is not None:
+                                get_answer_cache().set(cache_key, value)
                             final_content = f"\nFinal Answer: {value}"
                             if final_content not in yielded_content:
                                 yielded_content.add(final_content)
                                 yield final_content
                                 
+            trace.finish()
+            self._prefetch_followups(user_input)
+                                
+        except (asyncio.CancelledError, RequestCancelled):
+            # The client went away; nobody is left to read an error message
+            trace.finish("cancelled")
+            raise
+        except LLMRateLimited:
+            result = await get_agent_worker_pool().run(self._keyword_route_response, user_input, trace)
+            yield f"\nFinal Answer: {result}"
         except Exception as e:
+            trace.finish("error")
             error_msg = f"处理查询时出现错误：{str(e)}"
             if error_msg not in yielded_content:
                 yield error_msg
+        finally:
+            if speculation is not None:
+                speculation.settle()
     
     def clear_memory(self):
         """Clear conversation memory for a new session."""
         self.memory.clear()
     
-    def _mock_query_response(self, user_input: str) -> str:
-        """Mock response for testing without OpenAI API."""
+    def load_history(self, history: List[tuple]):
+        """Rebuild conversation memory from (role, content) turns without calling the LLM."""
+        for role, content in history:
+            if role == "user":
+                self.memory.chat_memory.add_user_message(content)
+            elif role == "assistant":
+                self.memory.chat_memory.add_ai_message(content)
+    
+    def _mock_query_response(self, user_input: str, tag: str = "模拟路由") -> str:
+        """Mock response for testing without OpenAI API; also the keyword router used in degraded mode."""
         user_input_lower = user_input.lower()
         
         has_capacity = any(keyword in user_input for keyword in ["承载力", "可开放容量", "光伏承载"])
@@ -225,27 +389,27 @@ Thought: {agent_scratchpad}"""
         if has_capacity and has_policy:
             capacity_result = self.tools[2]._run(user_input)
             policy_result = self.tools[3]._run(user_input)
-            return f"[模拟路由] 检测到多工具查询需求：\n\n📊 光伏承载力信息：\n{capacity_result}\n\n📋 相关政策信息：\n{policy_result}"
+            return f"[{tag}] 检测到多工具查询需求：\n\n📊 光伏承载力信息：\n{capacity_result}\n\n📋 相关政策信息：\n{policy_result}"
         
         elif any(keyword in user_input for keyword in ["电价", "上网电价", "工商电价", "脱硫煤电价"]):
             tool = self.tools[0]  # electricity_price_tool
-            return f"[模拟路由] 检测到电价查询，调用电价工具：\n{tool._run(user_input)}"
+            return f"[{tag}] 检测到电价查询，调用电价工具：\n{tool._run(user_input)}"
         
         elif any(keyword in user_input for keyword in ["发电小时", "发电时长", "有效发电"]):
             tool = self.tools[1]  # power_generation_duration_tool
-            return f"[模拟路由] 检测到发电小时数查询，调用发电小时数工具：\n{tool._run(user_input)}"
+            return f"[{tag}] 检测到发电小时数查询，调用发电小时数工具：\n{tool._run(user_input)}"
         
         elif has_capacity:
             tool = self.tools[2]  # photovoltaic_capacity_tool
-            return f"[模拟路由] 检测到光伏承载力查询，调用光伏承载力工具：\n{tool._run(user_input)}"
+            return f"[{tag}] 检测到光伏承载力查询，调用光伏承载力工具：\n{tool._run(user_input)}"
         
         elif has_policy or any(keyword in user_input for keyword in ["并网"]):
             tool = self.tools[3]  # policy_query_tool
-            return f"[模拟路由] 检测到政策查询，调用政策工具：\n{tool._run(user_input)}"
+            return f"[{tag}] 检测到政策查询，调用政策工具：\n{tool._run(user_input)}"
         
         elif any(keyword in user_input for keyword in ["投资", "合作", "业务", "项目", "门槛", "周期", "模式", "地面", "屋顶"]):
             tool = self.tools[4]  # business_knowledge_tool
-            return f"[模拟路由] 检测到业务咨询，调用业务知识库工具：\n{tool._run(user_input)}"
+            return f"[{tag}] 检测到业务咨询，调用业务知识库工具：\n{tool._run(user_input)}"
         
         else:
             return "抱歉，我无法理解您的问题。请询问关于电价、发电小时数、光伏承载力、政策或业务相关的问题。"
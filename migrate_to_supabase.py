@@ -2,8 +2,14 @@
 """
 Migration script to transfer OCT data from local PostgreSQL to Supabase
 """
+import argparse
+import io
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import logging
 
@@ -12,46 +18,82 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_local_data():
-    """Extract data from local PostgreSQL database"""
-    local_db_params = {
-        'host': 'localhost',
-        'port': 5432,
-        'user': 'oct_user',
-        'password': 'oct_password',
-        'database': 'oct_poc'
-    }
-    
+LOCAL_DB_PARAMS = {
+    'host': 'localhost',
+    'port': 5432,
+    'user': 'oct_user',
+    'password': 'oct_password',
+    'database': 'oct_poc'
+}
+
+MIGRATION_TABLES = ["h1_carry_over_performance", "h1_collections_performance"]
+
+# Rows read from the local cursor and written to Supabase per round trip
+MIGRATION_CHUNK_ROWS = int(os.getenv("MIGRATION_CHUNK_ROWS", "10000"))
+# "copy" (COPY FROM STDIN) or "values" (batched INSERT ... VALUES via execute_values)
+MIGRATION_LOAD_METHOD = os.getenv("MIGRATION_LOAD_METHOD", "copy")
+# Tables synced at the same time, each on its own connections
+MIGRATION_PARALLEL_TABLES = int(os.getenv("MIGRATION_PARALLEL_TABLES", "4"))
+
+def get_local_connection():
+    """Connect to the local PostgreSQL database"""
     try:
-        conn = psycopg2.connect(**local_db_params)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM h1_carry_over_performance ORDER BY id")
-        carry_over_data = cursor.fetchall()
-        carry_over_columns = [desc[0] for desc in cursor.description]
-        
-        cursor.execute("SELECT * FROM h1_collections_performance ORDER BY id")
-        collections_data = cursor.fetchall()
-        collections_columns = [desc[0] for desc in cursor.description]
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            'carry_over': {
-                'columns': carry_over_columns,
-                'data': carry_over_data
-            },
-            'collections': {
-                'columns': collections_columns,
-                'data': collections_data
-            }
-        }
-        
+        return psycopg2.connect(**LOCAL_DB_PARAMS)
     except Exception as e:
-        logger.error(f"Error extracting local data: {e}")
+        logger.error(f"Error connecting to local database: {e}")
         raise
 
+def stream_local_rows(local_conn, table, chunk_rows=None):
+    """Yield (columns, rows) chunks of a local table through a server-side cursor.
+
+    Only one chunk is held in memory at a time, however large the table is.
+    """
+    if chunk_rows is None:
+        chunk_rows = MIGRATION_CHUNK_ROWS
+    cursor = local_conn.cursor(name=f"migrate_{table}")
+    cursor.itersize = chunk_rows
+    try:
+        cursor.execute(sql.SQL("SELECT * FROM {} ORDER BY id").format(sql.Identifier(table)))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [desc[0] for desc in cursor.description], rows
+    finally:
+        cursor.close()
+
+def _copy_text(value):
+    """One field in COPY text format"""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def load_chunk(cursor, table, columns, rows, method=None):
+    """Write one chunk of rows to the target table with COPY or a batched INSERT"""
+    if method is None:
+        method = MIGRATION_LOAD_METHOD
+    column_list = sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+    if method == "values":
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(sql.Identifier(table), column_list)
+        execute_values(cursor, query.as_string(cursor), rows, page_size=len(rows))
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    query = sql.SQL("COPY {} ({}) FROM STDIN").format(sql.Identifier(table), column_list)
+    cursor.copy_expert(query.as_string(cursor), buffer)
+
+def _reset_id_sequence(cursor, table):
+    """Move the SERIAL sequence past the copied ids so later inserts do not collide"""
+    cursor.execute(
+        sql.SQL("SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {}")
+        .format(sql.Identifier(table)),
+        (table,)
+    )
+
 def create_supabase_tables(supabase_url):
     """Create tables in Supabase database"""
     try:
@@ -101,38 +143,173 @@ def create_supabase_tables(supabase_url):
         logger.error(f"Error creating Supabase tables: {e}")
         raise
 
-def migrate_data(supabase_url, local_data):
-    """Migrate data to Supabase"""
+def migrate_table(local_conn, target_conn, table, chunk_rows=None, method=None):
+    """Replace a Supabase table with the local one, streaming it across in chunks.
+
+    The delete and all chunks are one transaction, so readers see either the
+    old or the new table contents. Returns row count, duration and throughput.
+    """
+    started = time.perf_counter()
+    copied = 0
     try:
-        conn = psycopg2.connect(supabase_url)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM h1_carry_over_performance")
-        cursor.execute("DELETE FROM h1_collections_performance")
-        
-        carry_over_columns = local_data['carry_over']['columns']
-        for row in local_data['carry_over']['data']:
-            placeholders = ','.join(['%s'] * len(row))
-            columns_str = ','.join(carry_over_columns)
-            cursor.execute(
-                f"INSERT INTO h1_carry_over_performance ({columns_str}) VALUES ({placeholders})",
-                row
-            )
-        
-        collections_columns = local_data['collections']['columns']
-        for row in local_data['collections']['data']:
-            placeholders = ','.join(['%s'] * len(row))
-            columns_str = ','.join(collections_columns)
-            cursor.execute(
-                f"INSERT INTO h1_collections_performance ({columns_str}) VALUES ({placeholders})",
-                row
-            )
-        
-        conn.commit()
+        with target_conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table)))
+            for columns, rows in stream_local_rows(local_conn, table, chunk_rows):
+                load_chunk(cursor, table, columns, rows, method)
+                copied += len(rows)
+                elapsed = time.perf_counter() - started
+                logger.info(f"  {table}: {copied} rows copied ({copied / elapsed:,.0f} rows/s)")
+            _reset_id_sequence(cursor, table)
+        target_conn.commit()
+    except Exception:
+        target_conn.rollback()
+        raise
+    finally:
+        local_conn.rollback()
+
+    elapsed = time.perf_counter() - started
+    stats = {"rows": copied, "seconds": round(elapsed, 3), "rows_per_second": round(copied / elapsed, 1) if elapsed else None}
+    logger.info(f"  {table}: done, {copied} rows in {elapsed:.2f}s")
+    return stats
+
+def _table_checksum(conn, table):
+    """md5 over the per-row md5s of a table in id order; equal on both sides means nothing to sync"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            sql.SQL("SELECT md5(COALESCE(string_agg(md5(t::text), '' ORDER BY id), '')) FROM {} t")
+            .format(sql.Identifier(table))
+        )
+        return cursor.fetchone()[0]
+
+def row_checksums(conn, table, chunk_rows=None):
+    """Yield (id, md5 of the row) in id order through a server-side cursor"""
+    if chunk_rows is None:
+        chunk_rows = MIGRATION_CHUNK_ROWS
+    cursor = conn.cursor(name=f"checksum_{table}")
+    cursor.itersize = chunk_rows
+    try:
+        cursor.execute(sql.SQL("SELECT id, md5(t::text) FROM {} t ORDER BY id").format(sql.Identifier(table)))
+        for row in cursor:
+            yield row
+    finally:
         cursor.close()
-        conn.close()
+
+def diff_checksums(local_rows, target_rows):
+    """Merge two id-ordered (id, checksum) streams into (ids to upsert, ids to delete).
+
+    Only the differing ids are kept in memory.
+    """
+    changed, deleted = [], []
+    local_rows, target_rows = iter(local_rows), iter(target_rows)
+    local_row, target_row = next(local_rows, None), next(target_rows, None)
+    while local_row is not None or target_row is not None:
+        if target_row is None or (local_row is not None and local_row[0] < target_row[0]):
+            changed.append(local_row[0])
+            local_row = next(local_rows, None)
+        elif local_row is None or target_row[0] < local_row[0]:
+            deleted.append(target_row[0])
+            target_row = next(target_rows, None)
+        else:
+            if local_row[1] != target_row[1]:
+                changed.append(local_row[0])
+            local_row, target_row = next(local_rows, None), next(target_rows, None)
+    return changed, deleted
+
+def upsert_rows(cursor, table, columns, rows):
+    """INSERT ... ON CONFLICT (id) DO UPDATE for one chunk of rows; returns how many were sent"""
+    if not rows:
+        return 0
+    updates = sql.SQL(", ").join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column)) for column in columns if column != "id"
+    )
+    query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT (id) DO UPDATE SET {}").format(
+        sql.Identifier(table), sql.SQL(", ").join(sql.Identifier(column) for column in columns), updates
+    )
+    execute_values(cursor, query.as_string(cursor), rows, page_size=len(rows))
+    return len(rows)
+
+def sync_table_incremental(local_conn, target_conn, table, chunk_rows=None):
+    """Bring a Supabase table in line with the local one by copying only what changed.
+
+    Whole-table checksums are compared first, so an unchanged table costs one
+    query per side. Otherwise per-row checksums are merged in id order. Only
+    new or changed rows are read and upserted, and deleted ids are removed, in
+    one transaction. The tables carry no updated_at column, so an id/created_at
+    watermark would miss updates; row checksums catch inserts, updates and
+    deletes alike.
+    """
+    if chunk_rows is None:
+        chunk_rows = MIGRATION_CHUNK_ROWS
+    started = time.perf_counter()
+    try:
+        if _table_checksum(local_conn, table) == _table_checksum(target_conn, table):
+            logger.info(f"  {table}: unchanged")
+            return {"upserted": 0, "deleted": 0, "seconds": round(time.perf_counter() - started, 3)}
+
+        changed, deleted = diff_checksums(row_checksums(local_conn, table, chunk_rows),
+                                          row_checksums(target_conn, table, chunk_rows))
+        logger.info(f"  {table}: {len(changed)} rows to upsert, {len(deleted)} to delete")
+        upserted = 0
+        with local_conn.cursor() as local_cursor, target_conn.cursor() as cursor:
+            for offset in range(0, len(deleted), chunk_rows):
+                cursor.execute(sql.SQL("DELETE FROM {} WHERE id = ANY(%s)").format(sql.Identifier(table)),
+                               (deleted[offset:offset + chunk_rows],))
+            for offset in range(0, len(changed), chunk_rows):
+                ids = changed[offset:offset + chunk_rows]
+                local_cursor.execute(
+                    sql.SQL("SELECT * FROM {} WHERE id = ANY(%s) ORDER BY id").format(sql.Identifier(table)), (ids,)
+                )
+                columns = [desc[0] for desc in local_cursor.description]
+                rows = local_cursor.fetchall()
+                # Rows deleted locally after the checksums were read are removed by the next sync
+                if len(rows) < len(ids):
+                    logger.warning(f"  {table}: {len(ids) - len(rows)} changed rows vanished during sync")
+                upserted += upsert_rows(cursor, table, columns, rows)
+                logger.info(f"  {table}: {min(offset + chunk_rows, len(changed))}/{len(changed)} rows upserted")
+            _reset_id_sequence(cursor, table)
+        target_conn.commit()
+    except Exception:
+        target_conn.rollback()
+        raise
+    finally:
+        local_conn.rollback()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"  {table}: synced in {elapsed:.2f}s")
+    return {"upserted": upserted, "deleted": len(deleted), "seconds": round(elapsed, 3)}
+
+def _sync_one_table(supabase_url, table, mode, chunk_rows, method):
+    """Sync one table on its own pair of connections, so tables can run in parallel"""
+    local_conn = get_local_connection()
+    try:
+        target_conn = psycopg2.connect(supabase_url)
+        try:
+            if mode == "full":
+                return migrate_table(local_conn, target_conn, table, chunk_rows, method)
+            return sync_table_incremental(local_conn, target_conn, table, chunk_rows)
+        finally:
+            target_conn.close()
+    finally:
+        local_conn.close()
+
+def migrate_data(supabase_url, tables=None, mode="incremental", chunk_rows=None, method=None, parallel=None):
+    """Migrate data to Supabase, all tables in parallel
+
+    mode "full" deletes and reloads every table; "incremental" copies only
+    changed rows. Each table is its own transaction.
+    """
+    tables = tables or MIGRATION_TABLES
+    if parallel is None:
+        parallel = MIGRATION_PARALLEL_TABLES
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(tables))), thread_name_prefix="migrate") as executor:
+            futures = {table: executor.submit(_sync_one_table, supabase_url, table, mode, chunk_rows, method)
+                       for table in tables}
+            stats = {table: future.result() for table, future in futures.items()}
         
-        logger.info("Data migration completed successfully")
+        logger.info(f"Data migration ({mode}) completed successfully in {time.perf_counter() - started:.2f}s: {stats}")
+        return stats
         
     except Exception as e:
         logger.error(f"Error migrating data: {e}")
@@ -165,6 +342,11 @@ def verify_migration(supabase_url):
 
 def main():
     """Main migration function"""
+    parser = argparse.ArgumentParser(description="Sync the OCT tables from local PostgreSQL to Supabase")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="incremental",
+                        help="full: delete and reload every table; incremental: copy only changed rows (default)")
+    args = parser.parse_args()
+    
     supabase_url = os.getenv('SUPABASE_DATABASE_URL')
     if not supabase_url:
         logger.error("SUPABASE_DATABASE_URL environment variable not set")
@@ -173,14 +355,11 @@ def main():
     try:
         logger.info("Starting OCT data migration to Supabase...")
         
-        logger.info("Extracting data from local PostgreSQL...")
-        local_data = get_local_data()
-        
         logger.info("Creating tables in Supabase...")
         create_supabase_tables(supabase_url)
         
-        logger.info("Migrating data to Supabase...")
-        migrate_data(supabase_url, local_data)
+        logger.info(f"Migrating data to Supabase ({args.mode}, {MIGRATION_CHUNK_ROWS} rows per chunk)...")
+        migrate_data(supabase_url, mode=args.mode)
         
         logger.info("Verifying migration...")
         verify_migration(supabase_url)
@@ -0,0 +1,173 @@
+import re
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.agents import AgentFinish
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+
+from agent_tracing import estimate_tokens
+from llm_usage import record_model_usage
+from request_cancellation import raise_if_cancelled
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+STAGE_ROUTE = "route"
+STAGE_SYNTHESIS = "synthesis"
+STAGE_ESCALATED = "escalated"
+
+# Text right before {input} in the router's ReAct prompt; the scratchpad follows the input line
+SCRATCHPAD_MARKER = "开始！\n\nQuestion: "
+
+# A direct Final Answer from the fast model is re-run on the strong model when it hedges
+LOW_CONFIDENCE_MARKERS = ["无法确定", "不确定", "无法回答", "无法提供", "不清楚", "不知道", "抱歉",
+                          "not sure", "don't know", "cannot answer"]
+_DIGIT_PATTERN = re.compile(r"\d")
+
+_react_parser = ReActSingleInputOutputParser()
+
+
+def parse_react_output(text: str) -> Optional[Any]:
+    """Parse a ReAct step the same way the agent will; None if it would be a parse error."""
+    try:
+        return _react_parser.parse(text)
+    except OutputParserException:
+        return None
+
+
+class CascadeChatModel(BaseChatModel):
+    """Route ReAct steps to a fast model and final-answer synthesis to a stronger one.
+
+    Routing and tool-argument steps (no Observation in the scratchpad yet) go to
+    fast_llm. Once tool results are present, or after a parse-error retry, the
+    step goes to strong_llm. A fast-model step that would fail to parse is
+    re-run on strong_llm straight away. A direct Final Answer from fast_llm
+    (greetings, clarifying questions) is kept unless it looks unreliable: empty,
+    hedging, or quoting figures before any tool has run.
+    """
+
+    fast_llm: BaseChatModel
+    strong_llm: BaseChatModel
+    fast_model_name: str
+    strong_model_name: str
+    parse_error_marker: str = "Check your output and make sure it conforms to the expected format"
+    scratchpad_marker: str = SCRATCHPAD_MARKER
+    low_confidence_markers: List[str] = LOW_CONFIDENCE_MARKERS
+
+    @property
+    def _llm_type(self) -> str:
+        return "model-cascade"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"fast_model": self.fast_model_name, "strong_model": self.strong_model_name}
+
+    def _scratchpad(self, messages: List[BaseMessage]) -> Optional[str]:
+        """The agent scratchpad of a ReAct prompt, or None if the prompt does not contain scratchpad_marker."""
+        prompt_text = "".join(str(message.content) for message in messages)
+        if self.scratchpad_marker not in prompt_text:
+            return None
+        question_and_scratchpad = prompt_text.split(self.scratchpad_marker, 1)[1]
+        # Skip the "{input}\nThought:" line(s); what follows is the scratchpad
+        return question_and_scratchpad.split("\nThought:", 1)[-1]
+
+    def _select_stage(self, messages: List[BaseMessage]) -> str:
+        scratchpad = self._scratchpad(messages)
+        if scratchpad is None:
+            # The router prompt changed; routing blind would be wrong, so use the strong model
+            get_metrics_registry().increment("cascade.scratchpad_marker_missing")
+            logger.warning("Cascade prompt has no scratchpad marker %r, using the strong model", self.scratchpad_marker)
+            return STAGE_ESCALATED
+        if self.parse_error_marker in scratchpad:
+            return STAGE_ESCALATED
+        if "\nObservation:" in scratchpad:
+            return STAGE_SYNTHESIS
+        return STAGE_ROUTE
+
+    def _is_low_confidence(self, answer: str) -> bool:
+        answer = answer.strip()
+        if not answer:
+            return True
+        if any(marker in answer for marker in self.low_confidence_markers):
+            return True
+        # No tool has run in a route step, so any figure in the answer is unsourced
+        return bool(_DIGIT_PATTERN.search(answer))
+
+    def _escalation_stage(self, result: ChatResult) -> Optional[str]:
+        """Stage to re-run a fast-model step under, or None if its output can be used."""
+        parsed = parse_react_output(result.generations[0].text if result.generations else "")
+        if parsed is None:
+            get_metrics_registry().increment("cascade.escalation.parse_error")
+            return STAGE_ESCALATED
+        if isinstance(parsed, AgentFinish):
+            if self._is_low_confidence(str(parsed.return_values.get("output", ""))):
+                get_metrics_registry().increment("cascade.escalation.low_confidence")
+                return STAGE_SYNTHESIS
+            get_metrics_registry().increment("cascade.fast_finish_accepted")
+        return None
+
+    def _record(self, model_name: str, stage: str, messages: List[BaseMessage], result: ChatResult, started: float):
+        get_metrics_registry().increment(f"cascade.stage.{stage}")
+        if (result.llm_output or {}).get("llm_cache_hit"):
+            return
+        latency_ms = (time.perf_counter() - started) * 1000
+        prompt_text = "".join(str(message.content) for message in messages)
+        output_text = result.generations[0].text if result.generations else ""
+        record_model_usage(model_name, latency_ms, estimate_tokens(prompt_text), estimate_tokens(output_text))
+
+    def _finalize(self, result: ChatResult, model_name: str, stage: str) -> ChatResult:
+        llm_output = dict(result.llm_output or {})
+        llm_output.update({"model_name": model_name, "cascade_stage": stage})
+        return ChatResult(generations=result.generations, llm_output=llm_output)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        stage = self._select_stage(messages)
+        if stage == STAGE_ROUTE:
+            started = time.perf_counter()
+            result = self.fast_llm._generate(messages, stop=stop, **kwargs)
+            self._record(self.fast_model_name, stage, messages, result, started)
+            escalation_stage = self._escalation_stage(result)
+            if escalation_stage is None:
+                return self._finalize(result, self.fast_model_name, stage)
+            stage = escalation_stage
+            raise_if_cancelled()
+
+        started = time.perf_counter()
+        result = self.strong_llm._generate(messages, stop=stop, **kwargs)
+        self._record(self.strong_model_name, stage, messages, result, started)
+        return self._finalize(result, self.strong_model_name, stage)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        stage = self._select_stage(messages)
+        if stage == STAGE_ROUTE:
+            started = time.perf_counter()
+            result = await self.fast_llm._agenerate(messages, stop=stop, **kwargs)
+            self._record(self.fast_model_name, stage, messages, result, started)
+            escalation_stage = self._escalation_stage(result)
+            if escalation_stage is None:
+                return self._finalize(result, self.fast_model_name, stage)
+            stage = escalation_stage
+            raise_if_cancelled()
+
+        started = time.perf_counter()
+        result = await self.strong_llm._agenerate(messages, stop=stop, **kwargs)
+        self._record(self.strong_model_name, stage, messages, result, started)
+        return self._finalize(result, self.strong_model_name, stage)
@@ -0,0 +1,161 @@
+import os
+import re
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from oct_semantic_layer import TemplateQuery
+from sql_guard import LITERAL, SYMBOL, WORD, QUOTED_IDENTIFIER, UnsafeSQLError, tokenize
+
+TABLE_DESCRIPTIONS = {
+    "h1_carry_over_performance": "上半年经营指标完成情况(结转)",
+    "h1_collections_performance": "上半年经营指标完成情况(回款)",
+}
+
+# column -> (label, unit); amounts in the OCT tables are stored in 万元
+COLUMN_LABELS: Dict[str, Tuple[str, str]] = {
+    "units_transferred": ("结转套数", "套"),
+    "revenue": ("结转收入", "万元"),
+    "gross_profit": ("毛利", "万元"),
+    "taxes_and_surcharges": ("税金及附加", "万元"),
+    "period_expenses": ("期间费用", "万元"),
+    "net_profit": ("净利润", "万元"),
+    "annual_target": ("全年目标", "万元"),
+    "h1_budget": ("上半年预算", "万元"),
+    "h1_actual": ("上半年实际回款", "万元"),
+    "h1_completion_rate": ("上半年完成率", ""),
+    "annual_completion_rate": ("年度完成率", ""),
+}
+DIMENSION_COLUMNS = {"project_name": "项目", "period": "期间", "table_name": "数据表"}
+
+MAX_TEMPLATED_ROWS = int(os.getenv("OCT_FORMATTER_MAX_ROWS", "6"))
+MAX_TEMPLATED_COLUMNS = 4
+
+
+def format_amount(value: Any, unit: str) -> str:
+    """Render a value with its unit; amounts of 1亿 or more are shown in 亿元 as well."""
+    if value is None:
+        return "暂无数据"
+    if not isinstance(value, (int, float, Decimal)):
+        return f"{value}{unit}"
+    if unit == "万元":
+        if abs(value) >= 10000:
+            return f"{Decimal(value) / 10000:,.2f}亿元（{value:,.2f}万元）"
+        return f"{value:,.2f}万元"
+    if isinstance(value, float) or (isinstance(value, Decimal) and value != value.to_integral_value()):
+        return f"{value:,.2f}{unit}"
+    return f"{int(value):,}{unit}"
+
+
+def _column_label(column: str) -> Optional[Tuple[str, str]]:
+    """Label and unit of a result column; SUM aliases like total_revenue are labelled 合计 + metric."""
+    if column in COLUMN_LABELS:
+        return COLUMN_LABELS[column]
+    for prefix in ("total_", "sum_"):
+        if column.startswith(prefix) and column[len(prefix):] in COLUMN_LABELS:
+            label, unit = COLUMN_LABELS[column[len(prefix):]]
+            return f"{label}合计", unit
+    return None
+
+
+def _is_total_column(column: str) -> bool:
+    return column.startswith(("total_", "sum_"))
+
+
+def where_literals(sql_query: str, column: str) -> List[str]:
+    """String values column is filtered on in the WHERE clause (column = '...' or column IN ('...', ...))."""
+    try:
+        tokens = tokenize(sql_query or "")
+    except UnsafeSQLError:
+        return []
+    where_at = next((index for index, token in enumerate(tokens) if token[:2] == (WORD, "WHERE")), None)
+    if where_at is None:
+        return []
+    values = []
+    for index in range(where_at + 1, len(tokens) - 2):
+        kind, value, _, _ = tokens[index]
+        if not ((kind == WORD and value == column.upper()) or (kind == QUOTED_IDENTIFIER and value == column)):
+            continue
+        operator = tokens[index + 1][:2]
+        if operator == (SYMBOL, "=") and tokens[index + 2][0] == LITERAL:
+            candidates = [tokens[index + 2]]
+        elif operator == (WORD, "IN") and tokens[index + 2][:2] == (SYMBOL, "("):
+            candidates = []
+            for token in tokens[index + 3:]:
+                if token[0] == LITERAL:
+                    candidates.append(token)
+                elif token[:2] == (SYMBOL, ")"):
+                    break
+                elif token[:2] != (SYMBOL, ","):
+                    candidates = []
+                    break
+        else:
+            continue
+        values.extend(token[1][1:-1].replace("''", "'") for token in candidates if token[1].startswith("'"))
+    return list(dict.fromkeys(values))
+
+
+def source_tables(sql_query: str, template: Optional[TemplateQuery] = None) -> List[str]:
+    if template is not None:
+        return [template.table]
+    tables = re.findall(r"\b(?:FROM|JOIN)\s+([a-z_0-9]+)", sql_query or "", flags=re.IGNORECASE)
+    return [table for table in dict.fromkeys(table.lower() for table in tables) if table in TABLE_DESCRIPTIONS]
+
+
+def provenance(tables: List[str]) -> str:
+    return "数据来自 " + "、".join(f"{table}（{TABLE_DESCRIPTIONS[table]}）" for table in tables) + "。"
+
+
+def format_answer(results: List[Dict[str, Any]], sql_query: str, template: Optional[TemplateQuery] = None,
+                  fully_consumed: Optional[bool] = None) -> Optional[str]:
+    """Phrase scalar, single-row and small-table OCT results without an LLM.
+
+    Only questions the semantic layer understood completely are phrased here:
+    fully_consumed defaults to the template's flag and must be given for
+    generated SQL (see question_fully_consumed).
+    Returns None for results that need real summarizing (many rows or columns,
+    or columns whose meaning and unit are unknown) and for rows whose subject
+    is neither in the rows, the template nor the WHERE clause; those go to Gemini.
+    """
+    if fully_consumed is None:
+        fully_consumed = template is not None and template.fully_consumed
+    if not fully_consumed or not results or len(results) > MAX_TEMPLATED_ROWS:
+        return None
+    columns = list(results[0].keys())
+    metric_columns = [column for column in columns if column not in DIMENSION_COLUMNS]
+    if not metric_columns or len(columns) > MAX_TEMPLATED_COLUMNS:
+        return None
+    labels = {column: _column_label(column) for column in metric_columns}
+    if any(label is None for label in labels.values()):
+        return None
+    tables = source_tables(sql_query, template)
+    if not tables:
+        return None
+
+    if template is not None:
+        projects, period = template.projects, template.period or ""
+    else:
+        # Generated SQL: the rows may not say which project and period they are about, the filter does
+        projects = where_literals(sql_query, "project_name")
+        periods = where_literals(sql_query, "period") if "period" not in columns else []
+        period = periods[0] if len(periods) == 1 else ""
+
+    lines = []
+    if not any(column in DIMENSION_COLUMNS for column in columns):
+        # Without a subject "结转收入为4,953.00万元" would not say whose revenue it is
+        if len(results) != 1 or not projects:
+            return None
+        if len(projects) > 1 and not all(_is_total_column(column) for column in metric_columns):
+            return None
+        subject = "、".join(projects)
+        values = "，".join(f"{labels[column][0]}为{format_amount(results[0][column], labels[column][1])}" for column in metric_columns)
+        lines.append(f"{subject}{period}的{values}。")
+    else:
+        for row in results:
+            subject = "，".join(str(row[column]) for column in columns if column in DIMENSION_COLUMNS)
+            values = "，".join(f"{labels[column][0]}为{format_amount(row[column], labels[column][1])}" for column in metric_columns)
+            prefix = f"{subject}{period}" if subject else period
+            lines.append(f"{prefix}：{values}。" if prefix else f"{values}。")
+    if len(lines) > 1:
+        lines = [f"- {line}" for line in lines]
+    lines.append(provenance(tables))
+    return "\n".join(lines)
@@ -0,0 +1,443 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from db_pool import DatabasePool
+from service_metrics import get_metrics_registry
+from sql_guard import QUOTED_IDENTIFIER, RowSet, SEMICOLON, SYMBOL, WORD, get_sql_guard, tokenize
+
+logger = logging.getLogger(__name__)
+
+OCT_TABLES = ("h1_carry_over_performance", "h1_collections_performance")
+
+# Postgres information_schema data_type -> SQLite column type
+_SQLITE_TYPES = {
+    "smallint": "INTEGER", "integer": "INTEGER", "bigint": "INTEGER", "boolean": "INTEGER",
+    "numeric": "REAL", "real": "REAL", "double precision": "REAL",
+}
+
+# Postgres constructs SQLite lacks or evaluates differently; queries using them go to the remote database
+UNSUPPORTED_WORDS = {
+    "INTERVAL", "ARRAY", "LATERAL", "SIMILAR", "ILIKE", "FULL", "TABLESAMPLE", "SOME", "CURRENT_DATE",
+    "CURRENT_TIMESTAMP",
+}
+UNSUPPORTED_FUNCTIONS = {
+    "DATE_TRUNC", "DATE_PART", "EXTRACT", "TO_CHAR", "TO_DATE", "TO_NUMBER", "NOW", "AGE", "STRING_AGG", "ARRAY_AGG",
+    "GENERATE_SERIES", "PERCENTILE_CONT", "PERCENTILE_DISC", "MODE", "REGEXP_REPLACE", "REGEXP_MATCH", "SPLIT_PART",
+    "POSITION", "LEFT", "RIGHT", "GREATEST", "LEAST", "CONCAT", "CONCAT_WS", "DIV", "MOD", "POWER", "SQRT", "CEIL",
+    "CEILING", "FLOOR", "TRUNC", "ROLLUP", "CUBE", "GROUPING", "INITCAP", "LPAD", "RPAD", "BTRIM", "MD5",
+    # NUMERIC is stored as REAL: CAST truncates to INTEGER where Postgres rounds, and casts to TEXT print floats
+    "CAST",
+}
+UNSUPPORTED_SYMBOLS = {"~", "[", "]", "@", "#", "^"}
+# Words that end an ORDER BY list
+_ORDER_BY_END = {"LIMIT", "OFFSET", "FETCH", "UNION", "INTERSECT", "EXCEPT", "FOR"}
+# Words that end the select list of a query
+_SELECT_LIST_END = {"FROM", "WHERE", "GROUP", "HAVING", "WINDOW", "ORDER", "LIMIT", "OFFSET", "FETCH", "UNION",
+                    "INTERSECT", "EXCEPT", "INTO", "FOR"}
+
+
+class ReplicaIncompatible(Exception):
+    """A query uses Postgres-only syntax and has to run on the remote database."""
+
+
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        # Postgres' text form, so comparisons with literals like '2025-07-29 10:00' order the same way
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, dt_time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def translate_to_sqlite(sql: str, params: Optional[tuple] = None) -> Tuple[str, tuple]:
+    """Rewrite a validated Postgres SELECT for SQLite, or raise ReplicaIncompatible.
+
+    Only the dialect the OCT templates and typical generated SQL use is
+    translated: %s placeholders, "= ANY(%s)" over a list parameter, and
+    Postgres' NULL placement in ORDER BY (last ascending, first descending).
+    Casts (:: and CAST), the % operator, Postgres-only functions and
+    operators, DISTINCT ON, ILIKE (SQLite's LOWER only folds ASCII) and
+    non-list ANY are refused rather than guessed at. Text sorts by code
+    point, as under the C collation.
+    """
+    tokens = [token for token in tokenize(sql) if token[0] != SEMICOLON]
+    params = list(params or ())
+    out: List[str] = []
+    out_params: List[Any] = []
+    position = 0
+    index = 0
+    depth = 0
+    # Open ORDER BY lists: [paren depth, item has NULLS, item is DESC]
+    order_by: List[List[Any]] = []
+
+    def take_param() -> Any:
+        if not params:
+            raise ReplicaIncompatible("more placeholders than parameters")
+        return params.pop(0)
+
+    def close_order_item(at: int):
+        nonlocal position
+        item = order_by[-1]
+        if not item[1]:
+            item_end = position + len(sql[position:at].rstrip())
+            out.append(sql[position:item_end] + (" NULLS FIRST" if item[2] else " NULLS LAST"))
+            position = item_end
+        item[1] = item[2] = False
+
+    while index < len(tokens):
+        kind, value, start, end = tokens[index]
+        following = [token[1] for token in tokens[index + 1:index + 5]]
+        if kind == SYMBOL and value == ":" and following[:1] == [":"]:
+            raise ReplicaIncompatible("type cast")
+        if kind == SYMBOL and value in UNSUPPORTED_SYMBOLS:
+            raise ReplicaIncompatible(f"operator {value}")
+        if kind == SYMBOL and value == "$":
+            raise ReplicaIncompatible("positional parameter")
+        if kind == SYMBOL and value == "%" and following[:1] != ["S"]:
+            # Modulo on numeric values stored as REAL does not match Postgres
+            raise ReplicaIncompatible("operator %")
+        if kind == WORD and (value in UNSUPPORTED_WORDS or (value in UNSUPPORTED_FUNCTIONS and following[:1] == ["("])):
+            raise ReplicaIncompatible(value)
+        if kind == WORD and value == "DISTINCT" and following[:1] == ["ON"]:
+            raise ReplicaIncompatible("DISTINCT ON")
+
+        if order_by and order_by[-1][0] == depth:
+            if (kind == SYMBOL and value in (",", ")")) or (kind == WORD and value in _ORDER_BY_END):
+                close_order_item(start)
+                if value != ",":
+                    order_by.pop()
+            elif kind == WORD and value == "NULLS":
+                order_by[-1][1] = True
+            elif kind == WORD and value in ("ASC", "DESC"):
+                order_by[-1][2] = value == "DESC"
+        if kind == SYMBOL and value == "(":
+            depth += 1
+        elif kind == SYMBOL and value == ")":
+            depth -= 1
+        elif kind == WORD and value == "ORDER" and following[:1] == ["BY"]:
+            order_by.append([depth, False, False])
+            index += 2
+            continue
+
+        if kind == SYMBOL and value == "%" and following[:1] == ["S"]:
+            out.append(sql[position:start] + "?")
+            out_params.append(take_param())
+            index += 2
+            position = tokens[index - 1][3]
+            continue
+        if kind == WORD and value == "ANY":
+            # "= ANY(%s)" with a list parameter -> "IN (?, ?, ...)"
+            if following != ["(", "%", "S", ")"] or not sql[position:start].rstrip().endswith("="):
+                raise ReplicaIncompatible("ANY without a list parameter")
+            values = take_param()
+            if not isinstance(values, (list, tuple)) or not values:
+                raise ReplicaIncompatible("ANY without a list parameter")
+            prefix = sql[position:start].rstrip()[:-1]
+            out.append(f"{prefix}IN ({', '.join('?' for _ in values)})")
+            out_params.extend(values)
+            index += 5
+            position = tokens[index - 1][3]
+            continue
+        index += 1
+
+    if params:
+        raise ReplicaIncompatible("more parameters than placeholders")
+    end_of_sql = tokens[-1][3] if tokens else 0
+    while order_by:
+        close_order_item(end_of_sql)
+        order_by.pop()
+    out.append(sql[position:end_of_sql])
+    return "".join(out), tuple(_sqlite_value(value) for value in out_params)
+
+
+def _identifier_name(sql: str, token: Tuple[str, str, int, int]) -> str:
+    """Name of an identifier token as Postgres reports it: unquoted names fold to lower case."""
+    kind, value, start, end = token
+    return value if kind == QUOTED_IDENTIFIER else sql[start:end].lower()
+
+
+def _select_item_name(sql: str, item: List[Tuple[str, str, int, int]]) -> Optional[str]:
+    """Postgres' output name for one select-list item; None for * (named after the table's columns)."""
+    kinds = [token[0] for token in item]
+    values = [token[1] for token in item]
+    if values[-1] == "*" and (len(item) == 1 or values[-2] == "."):
+        return None
+    if values[0] == "(":
+        raise ReplicaIncompatible("parenthesized select item")
+    if len(item) >= 2 and values[-2] == "AS" and kinds[-2] == WORD and kinds[-1] in (WORD, QUOTED_IDENTIFIER):
+        return _identifier_name(sql, item[-1])
+    # Column reference, possibly qualified: revenue, t.revenue, "t"."revenue"
+    if all(kind in (WORD, QUOTED_IDENTIFIER) if i % 2 == 0 else value == "."
+           for i, (kind, value) in enumerate(zip(kinds, values))) and len(item) % 2 == 1 \
+            and values[-1] not in ("NULL", "TRUE", "FALSE"):
+        return _identifier_name(sql, item[-1])
+    if len(item) >= 2 and kinds[-1] in (WORD, QUOTED_IDENTIFIER) and values[-1] != "END" \
+            and (kinds[-2] in (WORD, QUOTED_IDENTIFIER) or values[-2] == ")"):
+        raise ReplicaIncompatible("select item alias without AS")
+    # A function call spanning the whole item is named after the function: SUM(revenue), SUM(x) OVER (...) -> sum
+    if kinds[0] == WORD and values[1:2] == ["("] and values[-1] == ")":
+        depth = 0
+        for index, value in enumerate(values[1:], start=1):
+            depth += {"(": 1, ")": -1}.get(value, 0) if item[index][0] == SYMBOL else 0
+            if depth == 0:
+                if index == len(item) - 1 or item[index + 1][:2] in ((WORD, "OVER"), (WORD, "FILTER")):
+                    return _identifier_name(sql, item[0])
+                break
+    if values[0] == "CASE" and values[-1] == "END":
+        return "case"
+    return "?column?"
+
+
+def result_column_names(sql: str) -> List[Optional[str]]:
+    """Column names Postgres gives the result of a SELECT, with None where a * expands to table columns.
+
+    SQLite names unaliased expressions after their text ("SUM(revenue)") and
+    keeps unquoted aliases in the case they were written; Postgres folds
+    unquoted names to lower case and names expressions "sum", "case" or
+    "?column?". Raises ReplicaIncompatible for select lists it cannot name.
+    """
+    tokens = [token for token in tokenize(sql) if token[0] != SEMICOLON]
+    depth = 0
+    start = None
+    for index, (kind, value, _, _) in enumerate(tokens):
+        if kind == SYMBOL and value in "()":
+            depth += 1 if value == "(" else -1
+        elif depth == 0 and kind == WORD and value == "SELECT":
+            start = index + 1
+            break
+    if start is None:
+        raise ReplicaIncompatible("no SELECT list")
+    if start < len(tokens) and tokens[start][:2] in ((WORD, "DISTINCT"), (WORD, "ALL")):
+        start += 1
+
+    items: List[List[Tuple[str, str, int, int]]] = [[]]
+    depth = 0
+    for token in tokens[start:]:
+        kind, value, _, _ = token
+        if depth == 0 and kind == WORD and value in _SELECT_LIST_END:
+            break
+        if kind == SYMBOL and value in "()":
+            depth += 1 if value == "(" else -1
+        if depth == 0 and kind == SYMBOL and value == ",":
+            items.append([])
+            continue
+        items[-1].append(token)
+    if any(not item for item in items):
+        raise ReplicaIncompatible("empty select item")
+    return [_select_item_name(sql, item) for item in items]
+
+
+def _postgres_columns(names: List[Optional[str]], sqlite_columns: List[str]) -> List[str]:
+    """Replace SQLite's result column names with Postgres'; a single * takes the columns SQLite expanded it to."""
+    if names.count(None) > 1:
+        raise ReplicaIncompatible("more than one * in the select list")
+    if None not in names:
+        if len(names) != len(sqlite_columns):
+            raise ReplicaIncompatible("select list not understood")
+        return names
+    star = names.index(None)
+    expanded = len(sqlite_columns) - len(names) + 1
+    return names[:star] + sqlite_columns[star:star + expanded] + names[star + 1:]
+
+
+class OCTLocalReplica:
+    """In-memory SQLite copy of the OCT tables, so most questions skip the remote round trip.
+
+    The tables are a few dozen rows; the replica is loaded when the agent
+    starts and re-checked every OCT_REPLICA_REFRESH_SECONDS. A refresh first
+    compares a per-table checksum computed on the server and only reloads when
+    the data changed; refresh() can also be called on a change notification.
+    Queries the replica cannot answer faithfully (Postgres-only syntax, SQLite
+    errors, or a replica that is not loaded) return None and the caller falls
+    back to the remote database. Metrics are reported under oct_replica.<name>.*.
+    """
+
+    def __init__(self, name: str, pool: DatabasePool, tables: Tuple[str, ...] = OCT_TABLES,
+                 refresh_seconds: float = None, max_rows: int = None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("OCT_REPLICA_REFRESH_SECONDS", "300"))
+        if max_rows is None:
+            max_rows = int(os.getenv("OCT_REPLICA_MAX_ROWS", "100000"))
+        self.name = name
+        self.pool = pool
+        self.tables = tables
+        self.refresh_seconds = refresh_seconds
+        self.max_rows = max_rows
+        self._db: Optional[sqlite3.Connection] = None
+        self._checksums: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._row_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics = get_metrics_registry()
+        self._prefix = f"oct_replica.{name}"
+
+    def start(self):
+        """Load the replica now (failures only disable it until the next refresh) and keep it fresh."""
+        self.refresh()
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name=f"oct-replica-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def _remote_checksums(self, cursor: Any) -> Dict[str, str]:
+        checksums = {}
+        for table in self.tables:
+            cursor.execute(f"SELECT md5(COALESCE(string_agg(t::text, '|' ORDER BY t::text), '')) FROM {table} t")
+            checksums[table] = cursor.fetchone()[0]
+        return checksums
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the tables whose server-side checksum changed; returns True when the replica was rebuilt."""
+        with self._refresh_lock:
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cursor:
+                        checksums = self._remote_checksums(cursor)
+                        if not force and self._db is not None and checksums == self._checksums:
+                            conn.rollback()
+                            return False
+                        db, row_counts = self._load(cursor)
+                    conn.rollback()
+            except Exception as e:
+                self._metrics.increment(f"{self._prefix}.refresh_errors")
+                logger.warning(f"OCT replica {self.name} refresh failed, queries use the remote database: {e}")
+                return False
+
+            with self._lock:
+                old, self._db = self._db, db
+                self._checksums = checksums
+                self._row_counts = row_counts
+                self._loaded_at = time.time()
+            if old is not None:
+                old.close()
+            self._metrics.increment(f"{self._prefix}.reloads")
+            logger.info(f"OCT replica {self.name} loaded: {row_counts}")
+            return True
+
+    def _load(self, cursor: Any) -> Tuple[sqlite3.Connection, Dict[str, int]]:
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        row_counts = {}
+        total = 0
+        try:
+            for table in self.tables:
+                cursor.execute(
+                    "SELECT column_name, data_type FROM information_schema.columns "
+                    "WHERE table_name = %s ORDER BY ordinal_position", (table,)
+                )
+                columns = cursor.fetchall()
+                if not columns:
+                    raise RuntimeError(f"table {table} not found")
+                names = [column for column, _ in columns]
+                definition = ", ".join(f'"{column}" {_SQLITE_TYPES.get(data_type, "TEXT")}' for column, data_type in columns)
+                db.execute(f'CREATE TABLE "{table}" ({definition})')
+
+                cursor.execute(f"SELECT {', '.join(names)} FROM {table}")
+                insert = f'INSERT INTO "{table}" VALUES ({", ".join("?" for _ in names)})'
+                row_counts[table] = 0
+                while True:
+                    rows = cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    total += len(rows)
+                    if total > self.max_rows:
+                        raise RuntimeError(f"more than {self.max_rows} rows, too large for the in-process replica")
+                    db.executemany(insert, [tuple(_sqlite_value(value) for value in row) for row in rows])
+                    row_counts[table] += len(rows)
+            db.commit()
+            # Postgres LIKE is case-sensitive; SQLite's is not by default
+            db.execute("PRAGMA case_sensitive_like = ON")
+            db.execute("PRAGMA query_only = ON")
+        except BaseException:
+            db.close()
+            raise
+        return db, row_counts
+
+    def query(self, sql: str, params: Optional[tuple] = None) -> Optional[RowSet]:
+        """Run a guard-validated SELECT locally; None means the remote database has to answer it."""
+        if self._db is None:
+            return None
+        try:
+            local_sql, local_params = translate_to_sqlite(sql, params)
+            column_names = result_column_names(sql)
+        except ReplicaIncompatible as e:
+            self._metrics.increment(f"{self._prefix}.fallbacks.incompatible")
+            logger.info(f"OCT replica {self.name} cannot run query ({e}), using the remote database")
+            return None
+
+        sql_guard = get_sql_guard()
+        started = time.perf_counter()
+        deadline = started + sql_guard.statement_timeout_ms / 1000
+        with self._lock:
+            db = self._db
+            if db is None:
+                return None
+            # Abort runaway queries after the guard's statement timeout, as Postgres would
+            db.set_progress_handler(lambda: int(time.perf_counter() > deadline), 10000)
+            try:
+                cursor = db.execute(local_sql, local_params)
+                rows = cursor.fetchmany(sql_guard.max_rows + 1)
+                columns = _postgres_columns(column_names, [desc[0] for desc in cursor.description])
+            except ReplicaIncompatible as e:
+                self._metrics.increment(f"{self._prefix}.fallbacks.incompatible")
+                logger.info(f"OCT replica {self.name} cannot name the result columns ({e}), using the remote database")
+                return None
+            except sqlite3.Error as e:
+                self._metrics.increment(f"{self._prefix}.fallbacks.error")
+                logger.info(f"OCT replica {self.name} query failed ({e}), using the remote database")
+                return None
+            finally:
+                db.set_progress_handler(None, 0)
+
+        self._metrics.increment(f"{self._prefix}.hits")
+        self._metrics.observe(f"{self._prefix}.query", (time.perf_counter() - started) * 1000)
+        truncated = len(rows) > sql_guard.max_rows
+        return RowSet([dict(zip(columns, row)) for row in rows[:sql_guard.max_rows]], truncated, sql_guard.max_rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._db is not None,
+            "loaded_at": self._loaded_at,
+            "rows": dict(self._row_counts),
+            "refresh_seconds": self.refresh_seconds,
+            "hits": int(self._metrics.get_counter(f"{self._prefix}.hits")),
+            "fallbacks": int(self._metrics.get_counter(f"{self._prefix}.fallbacks.incompatible")
+                             + self._metrics.get_counter(f"{self._prefix}.fallbacks.error"))
+        }
+
+
+local_replicas: Dict[str, OCTLocalReplica] = {}
+_local_replicas_lock = threading.Lock()
+
+def get_local_replica(name: str, pool: DatabasePool) -> Optional[OCTLocalReplica]:
+    """Get or start the named replica of the OCT tables; None when OCT_LOCAL_REPLICA_ENABLED is false"""
+    if os.getenv("OCT_LOCAL_REPLICA_ENABLED", "true").lower() != "true":
+        return None
+    with _local_replicas_lock:
+        if name not in local_replicas:
+            replica = OCTLocalReplica(name, pool)
+            replica.start()
+            local_replicas[name] = replica
+        return local_replicas[name]
+
+
+def get_local_replica_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: replica.get_stats() for name, replica in local_replicas.items()}
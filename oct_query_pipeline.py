@@ -0,0 +1,338 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sql_guard import get_sql_guard
+from service_metrics import get_metrics_registry
+from oct_semantic_layer import TemplateQuery, build_template_query, normalize_question, question_fully_consumed
+from oct_sql_cache import SQLCache, get_sql_cache, schema_fingerprint
+from oct_answer_formatter import format_answer
+from degradation_controller import get_degradation_controller, LEVEL_TEMPLATED_OCT
+
+logger = logging.getLogger(__name__)
+
+
+class OCTQueryPipeline:
+    """Question -> SQL -> rows -> answer pipeline shared by the OCT database agents.
+
+    Subclasses connect to their database and set self.llm, self.db_pool and
+    self.local_replica; metrics_prefix names their metrics. SQL comes from a
+    template, the SQL cache or Gemini (in that order), runs through the SQL
+    guard, and is answered locally when the formatter can, by Gemini otherwise.
+    """
+
+    metrics_prefix = "oct"
+
+    def __init__(self):
+        self.llm = None
+        self.local_replica = None
+        self.schema_check_seconds = float(os.getenv("OCT_SCHEMA_CHECK_SECONDS", "300"))
+        self._schema_version: Optional[str] = None
+        self._schema_checked_at = 0.0
+
+    def _execute_sql_query(self, query: str, params: Optional[tuple] = None) -> list:
+        """Execute SQL query (with optional bound parameters) and return results
+    
+        Only single read-only SELECT statements run, with a statement timeout
+        and a row cap (see sql_guard); rejected SQL raises UnsafeSQLError.
+        Queries the in-process replica can answer skip the database round trip.
+        """
+        try:
+            sql_guard = get_sql_guard()
+            query = sql_guard.validate(query)
+            if self.local_replica is not None:
+                results = self.local_replica.query(query, params)
+                if results is not None:
+                    return results
+            with self.db_pool.connection() as conn:
+                return sql_guard.execute(conn, query, params)
+            
+        except Exception as e:
+            logger.error(f"SQL execution error: {e}")
+            raise e
+    
+    async def _generate_sql_from_question(self, question: str) -> str:
+        """Generate SQL query from natural language question using Gemini"""
+        try:
+            schema_info = """
+数据库包含以下表格：
+1. h1_carry_over_performance - 上半年经营指标完成情况(结转)
+   - project_name: 项目名称 (VARCHAR)
+   - period: 期间 (VARCHAR) - '上半年实际' 或 '下半年预计'
+   - units_transferred: 结转套数 (INTEGER)
+   - revenue: 收入(万元) (DECIMAL)
+   - gross_profit: 毛利(万元) (DECIMAL)
+   - taxes_and_surcharges: 税金及附加(万元) (DECIMAL)
+   - period_expenses: 期间费用(万元) (DECIMAL)
+   - net_profit: 净利润(万元) (DECIMAL)
+
+2. h1_collections_performance - 上半年经营指标完成情况(回款)
+   - project_name: 项目名称 (VARCHAR)
+   - annual_target: 全年目标(万元) (DECIMAL)
+   - h1_budget: 上半年预算(万元) (DECIMAL)
+   - h1_actual: 上半年实际(万元) (DECIMAL)
+   - h1_completion_rate: 上半年完成率 (VARCHAR)
+   - annual_completion_rate: 年度完成率 (VARCHAR)
+"""
+            
+            prompt = f"""你是一个专业的华侨城集团数据分析师。根据用户问题生成PostgreSQL查询语句。
+
+{schema_info}
+
+用户问题: {question}
+
+请生成一个PostgreSQL查询语句来回答这个问题。只返回SQL语句，不要包含任何解释或其他文本。
+如果问题涉及多个项目的汇总，请使用SUM函数。
+如果问题询问数据来源，请在查询中包含表名信息。
+
+SQL查询:"""
+    
+            response = await self.llm.generate_content_async(prompt, generation_config={"temperature": 0})
+            sql_query = response.text.strip()
+            
+            sql_query = re.sub(r'```sql\s*', '', sql_query)
+            sql_query = re.sub(r'```\s*$', '', sql_query)
+            sql_query = sql_query.strip()
+            
+            return sql_query
+            
+        except Exception as e:
+            logger.error(f"Error generating SQL: {e}")
+            raise e
+    
+    def _record_stage(self, timings: Dict[str, float], stage: str, started: float) -> float:
+        """Record how long a pipeline stage took; returns the start time of the next stage"""
+        now = time.perf_counter()
+        timings[f"{stage}_ms"] = round((now - started) * 1000, 1)
+        get_metrics_registry().observe(f"{self.metrics_prefix}.stage.{stage}", (now - started) * 1000)
+        return now
+    
+    def _current_schema_version(self) -> Optional[str]:
+        """Schema fingerprint for the SQL cache, re-read from the database every schema_check_seconds"""
+        if time.time() - self._schema_checked_at < self.schema_check_seconds:
+            return self._schema_version
+        info = self.get_database_info()
+        if info.get("status") == "success":
+            self._schema_version = schema_fingerprint(info["tables"])
+            self._schema_checked_at = time.time()
+        return self._schema_version
+    
+    async def _sql_cache_key(self, question: str) -> Optional[str]:
+        schema_version = await asyncio.to_thread(self._current_schema_version)
+        if schema_version is None:
+            return None
+        return SQLCache.make_key(normalize_question(question), schema_version)
+    
+    async def _plan_sql(self, question: str) -> Dict[str, Any]:
+        """Pick the SQL for a question: a template, a cached statement, or a new one from Gemini"""
+        # Common metric-by-project questions map straight onto parameterized SQL
+        template = build_template_query(question)
+        if template is not None:
+            plan = {"sql_query": template.sql, "sql_params": template.params, "sql_source": "template",
+                    "template": template, "cache_key": None}
+        else:
+            cache_key = await self._sql_cache_key(question)
+            sql_query = get_sql_cache().get(cache_key) if cache_key else None
+            plan = {"sql_query": sql_query, "sql_params": None, "sql_source": "cache" if sql_query else "llm",
+                    "template": None, "cache_key": cache_key}
+            if sql_query is None:
+                plan["sql_query"] = await self._generate_sql_from_question(question)
+        logger.info(f"Generated SQL ({plan['sql_source']}): {plan['sql_query']} {plan['sql_params'] or ''}")
+        get_metrics_registry().increment(f"{self.metrics_prefix}.sql_source.{plan['sql_source']}")
+        return plan
+    
+    async def _execute_plan(self, question: str, plan: Dict[str, Any]) -> list:
+        """Run the planned SQL on a worker thread; Gemini's SQL is cached once it has executed"""
+        sql_cache = get_sql_cache()
+        try:
+            results = await asyncio.to_thread(self._execute_sql_query, plan["sql_query"], plan["sql_params"])
+        except Exception:
+            if plan["sql_source"] == "llm":
+                raise
+            # The cached or templated statement does not run; drop it and ask Gemini
+            if plan["cache_key"]:
+                sql_cache.invalidate(plan["cache_key"])
+            else:
+                plan["cache_key"] = await self._sql_cache_key(question)
+            plan.update(sql_query=await self._generate_sql_from_question(question), sql_params=None,
+                        sql_source="llm", template=None)
+            results = await asyncio.to_thread(self._execute_sql_query, plan["sql_query"], None)
+        if plan["sql_source"] == "llm" and plan["cache_key"]:
+            sql_cache.set(plan["cache_key"], plan["sql_query"])
+        return results
+    
+    async def ask_question(self, question: str) -> Dict[str, Any]:
+        """Process user question and return answer.
+    
+        LLM calls are awaited and the SQL runs on a worker thread, so concurrent
+        questions overlap instead of blocking the event loop.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            plan = await self._plan_sql(question)
+            stage_started = self._record_stage(timings, "generate_sql", started)
+            
+            results = await self._execute_plan(question, plan)
+            stage_started = self._record_stage(timings, "execute_sql", stage_started)
+            
+            answer = await self._format_answer(question, plan["sql_query"], results, plan["template"])
+            self._record_stage(timings, "format_answer", stage_started)
+            self._record_stage(timings, "total", started)
+            
+            return {
+                "question": question,
+                "sql_query": plan["sql_query"],
+                "sql_params": list(plan["sql_params"]) if plan["sql_params"] else [],
+                "sql_source": plan["sql_source"],
+                "raw_results": results,
+                "answer": answer,
+                "timings": timings,
+                "status": "success"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error processing question: {e}")
+            return {
+                "question": question,
+                "answer": f"抱歉，处理您的问题时出现错误：{str(e)}",
+                "timings": timings,
+                "status": "error"
+            }
+    
+    async def ask_question_stream(self, question: str, preview_rows: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """Process a question stage by stage, yielding an event as each stage completes.
+    
+        Events: {"type": "sql"}, {"type": "rows"} with a row count and preview,
+        {"type": "answer"} deltas, then {"type": "done"} with timings, or
+        {"type": "error"}. A retried SQL statement produces a second "sql" event.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            plan = await self._plan_sql(question)
+            stage_started = self._record_stage(timings, "generate_sql", started)
+            yield {"type": "sql", "sql_query": plan["sql_query"], "sql_source": plan["sql_source"]}
+            
+            planned_sql = plan["sql_query"]
+            results = await self._execute_plan(question, plan)
+            if plan["sql_query"] != planned_sql:
+                yield {"type": "sql", "sql_query": plan["sql_query"], "sql_source": plan["sql_source"]}
+            stage_started = self._record_stage(timings, "execute_sql", stage_started)
+            yield {"type": "rows", "row_count": len(results), "truncated": getattr(results, "truncated", False),
+                   "preview": results[:preview_rows]}
+            
+            async for delta in self._format_answer_stream(question, plan["sql_query"], results, plan["template"]):
+                yield {"type": "answer", "content": delta}
+            self._record_stage(timings, "format_answer", stage_started)
+            self._record_stage(timings, "total", started)
+            yield {"type": "done", "timings": timings}
+            
+        except Exception as e:
+            logger.error(f"Error processing question: {e}")
+            yield {"type": "error", "message": f"抱歉，处理您的问题时出现错误：{str(e)}", "timings": timings}
+    
+    def _local_answer(self, question: str, sql_query: str, results: list, template: Optional[TemplateQuery]) -> Optional[str]:
+        """An answer that needs no LLM call, or None when the results need Gemini to summarize them"""
+        if not results:
+            return "抱歉，没有找到相关数据。"
+        # Phrasing locally is only safe when every word of the question was understood
+        fully_consumed = template.fully_consumed if template is not None else question_fully_consumed(question)
+        formatted = format_answer(results, sql_query, template, fully_consumed)
+        if formatted is not None:
+            get_metrics_registry().increment(f"{self.metrics_prefix}.answers.templated")
+            return formatted
+        if get_degradation_controller().is_active(LEVEL_TEMPLATED_OCT):
+            return self._template_answer(results)
+        return None
+    
+    def _answer_prompt(self, question: str, sql_query: str, results: list) -> str:
+        results_text = get_sql_guard().results_for_prompt(results)
+        
+        return f"""作为华侨城集团数据分析师，请根据以下查询结果回答用户问题。
+
+用户问题: {question}
+执行的SQL查询: {sql_query}
+查询结果: {results_text}
+
+请用中文提供专业、清晰的回答。如果涉及金额，请使用合适的单位（万元、亿元等）。
+如果用户询问数据来源，请说明数据来自相应的数据表。
+
+回答:"""
+    
+    async def _format_answer(self, question: str, sql_query: str, results: list, template: Optional[TemplateQuery] = None) -> str:
+        """Format the query results into a user-friendly answer; only complex results cost an LLM call"""
+        try:
+            local_answer = self._local_answer(question, sql_query, results, template)
+            if local_answer is not None:
+                return local_answer
+            
+            prompt = self._answer_prompt(question, sql_query, results)
+            response = await self.llm.generate_content_async(prompt, generation_config={"temperature": 0})
+            return response.text.strip()
+            
+        except Exception as e:
+            logger.error(f"Error formatting answer: {e}")
+            return self._template_answer(results)
+    
+    async def _format_answer_stream(self, question: str, sql_query: str, results: list,
+                                    template: Optional[TemplateQuery] = None) -> AsyncIterator[str]:
+        """Streaming counterpart of _format_answer: Gemini's answer is relayed as it is generated"""
+        streamed = False
+        try:
+            local_answer = self._local_answer(question, sql_query, results, template)
+            if local_answer is not None:
+                yield local_answer
+                return
+            
+            prompt = self._answer_prompt(question, sql_query, results)
+            async for delta in self.llm.stream_content_async(prompt, generation_config={"temperature": 0}):
+                streamed = True
+                yield delta
+            
+        except Exception as e:
+            logger.error(f"Error formatting answer: {e}")
+            if not streamed:
+                yield self._template_answer(results)
+    
+    def _template_answer(self, results: list) -> str:
+        """Answer without an LLM call, used on errors and in degraded mode"""
+        if len(results) == 1:
+            result = results[0]
+            return f"查询结果：{result}"
+        else:
+            return f"查询到 {len(results)} 条记录：{results}"
+    
+    def get_database_info(self) -> Dict[str, Any]:
+        """Get database schema information"""
+        try:
+            with self.db_pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT table_name, column_name, data_type 
+                        FROM information_schema.columns 
+                        WHERE table_name IN ('h1_carry_over_performance', 'h1_collections_performance')
+                        ORDER BY table_name, ordinal_position
+                    """)
+                    schema_info = cursor.fetchall()
+            
+            tables = {}
+            for table_name, column_name, data_type in schema_info:
+                if table_name not in tables:
+                    tables[table_name] = []
+                tables[table_name].append(f"{column_name} ({data_type})")
+            
+            return {
+                "tables": tables,
+                "status": "success"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error getting database info: {e}")
+            return {
+                "error": str(e),
+                "status": "error"
+            }
@@ -0,0 +1,221 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# Canonical metric term -> wordings users use for it. Only true synonyms belong
+# here: two questions that normalize alike share one cached SQL statement.
+METRIC_SYNONYMS: Dict[str, List[str]] = {
+    "结转收入": ["营业收入", "销售收入", "营收"],
+    "毛利": ["毛利润", "毛利额"],
+    "净利润": ["净利", "纯利润", "纯利"],
+    "税金及附加": ["税金及附加费", "税费及附加"],
+    "结转套数": ["结转数量"],
+    "回款": ["回款额", "回款金额", "收款额"],
+    "全年目标": ["年度目标", "全年回款目标", "年度回款目标", "回款目标"],
+    "上半年完成率": ["半年完成率", "上半年回款完成率", "半年回款完成率"],
+    "年度完成率": ["全年完成率", "年度回款完成率", "全年回款完成率"],
+}
+
+# Canonical project_name in the OCT tables -> short names used in questions
+PROJECT_ALIASES: Dict[str, List[str]] = {
+    "水月周庄": ["周庄"],
+    "水月源岸": ["源岸"],
+    "铂尔曼酒店": ["铂尔曼"],
+    "欢乐明湖F03源庭": ["欢乐明湖", "F03源庭", "明湖源庭"],
+    "酒店": [],
+}
+
+CARRY_OVER_TABLE = "h1_carry_over_performance"
+COLLECTIONS_TABLE = "h1_collections_performance"
+
+# Metric term (after normalization) -> (table, column, unit); longest term wins
+METRIC_COLUMNS: Dict[str, Tuple[str, str, str]] = {
+    "结转收入": (CARRY_OVER_TABLE, "revenue", "万元"),
+    "收入": (CARRY_OVER_TABLE, "revenue", "万元"),
+    "毛利": (CARRY_OVER_TABLE, "gross_profit", "万元"),
+    "净利润": (CARRY_OVER_TABLE, "net_profit", "万元"),
+    "税金及附加": (CARRY_OVER_TABLE, "taxes_and_surcharges", "万元"),
+    "期间费用": (CARRY_OVER_TABLE, "period_expenses", "万元"),
+    "结转套数": (CARRY_OVER_TABLE, "units_transferred", "套"),
+    "套数": (CARRY_OVER_TABLE, "units_transferred", "套"),
+    "回款": (COLLECTIONS_TABLE, "h1_actual", "万元"),
+    "全年目标": (COLLECTIONS_TABLE, "annual_target", "万元"),
+    "上半年预算": (COLLECTIONS_TABLE, "h1_budget", "万元"),
+    "预算": (COLLECTIONS_TABLE, "h1_budget", "万元"),
+    "上半年完成率": (COLLECTIONS_TABLE, "h1_completion_rate", ""),
+    "年度完成率": (COLLECTIONS_TABLE, "annual_completion_rate", ""),
+}
+
+# Columns stored as text (e.g. '25%') that cannot be summed
+TEXT_COLUMNS = {"h1_completion_rate", "annual_completion_rate"}
+
+# project_name values present in each table
+PROJECTS_BY_TABLE: Dict[str, List[str]] = {
+    CARRY_OVER_TABLE: ["水月周庄", "水月源岸", "酒店"],
+    COLLECTIONS_TABLE: ["水月周庄", "水月源岸", "铂尔曼酒店", "欢乐明湖F03源庭"],
+}
+
+# Period words -> h1_carry_over_performance.period; h1_collections_performance only holds H1 figures
+CARRY_OVER_PERIODS = {"上半年": "上半年实际", "下半年": "下半年预计"}
+# The qualifier each period's figures carry; the other one contradicts it
+PERIOD_QUALIFIERS = {"上半年实际": "实际", "下半年预计": "预计", None: "实际"}
+# The tables hold one year of figures and have no year column
+RELATIVE_YEAR_WORDS = ["去年", "今年", "前年", "明年"]
+# A metric term followed by one of these names a different figure (毛利率 is not 毛利, 回款完成率 not 回款)
+METRIC_SUFFIXES = ["完成率", "率", "目标", "占比", "比例", "预算"]
+# Words that may be left over once projects, metrics and periods are taken out of a question
+CONNECTIVE_WORDS = ["以及", "还有", "和", "与", "跟", "及", "项目"]
+
+AGGREGATE_WORDS = ["总", "合计", "一共", "总共", "加起来", "之和", "合起来"]
+# Anything beyond "metric of projects (summed)" goes to Gemini
+UNSUPPORTED_WORDS = ["平均", "最高", "最低", "最大", "最小", "排名", "排序", "对比", "比较", "增长", "同比", "环比",
+                     "占比", "比例", "差", "哪个", "哪些", "每个", "各个", "所有", "全部", "除了", "以上", "以下", "超过", "低于"]
+
+QUESTION_PREFIXES = ["请问一下", "请问", "我想知道", "我想了解一下", "我想了解", "帮我查一下", "帮我查", "查一下", "告诉我"]
+QUESTION_SUFFIXES = ["是多少呢", "是多少", "有多少", "为多少", "多少钱", "多少"]
+
+
+def _alias_pattern(aliases: Dict[str, List[str]]) -> tuple:
+    """One alternation over canonical names and aliases, longest first, so 水月周庄 wins over 周庄."""
+    lookup = {}
+    for canonical, names in aliases.items():
+        lookup[canonical] = canonical
+        for name in names:
+            lookup[name] = canonical
+    pattern = re.compile("|".join(re.escape(name) for name in sorted(lookup, key=len, reverse=True)))
+    return pattern, lookup
+
+
+_METRIC_PATTERN, _METRIC_LOOKUP = _alias_pattern(METRIC_SYNONYMS)
+_PROJECT_PATTERN, _PROJECT_LOOKUP = _alias_pattern(PROJECT_ALIASES)
+
+
+def canonical_project_names(text: str) -> List[str]:
+    """Canonical project names mentioned in text, in order of appearance."""
+    names = []
+    for match in _PROJECT_PATTERN.finditer(text):
+        name = _PROJECT_LOOKUP[match.group(0)]
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def normalize_question(question: str) -> str:
+    """Reduce an OCT question to a canonical form for caching.
+
+    Full-width characters, whitespace, punctuation, polite prefixes, trailing
+    "是多少" and the particle 的 are dropped; project aliases and metric
+    synonyms are mapped to their canonical names. Wording differences go away
+    while anything that changes the SQL (projects, metrics, periods) stays.
+    """
+    text = unicodedata.normalize("NFKC", question).strip()
+    text = re.sub(r"[\s?？!！。,，、:：;；\"'“”‘’]+", "", text)
+    for prefix in QUESTION_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    for suffix in QUESTION_SUFFIXES:
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+            break
+    text = text.replace("的", "")
+    text = _PROJECT_PATTERN.sub(lambda match: _PROJECT_LOOKUP[match.group(0)], text)
+    text = _METRIC_PATTERN.sub(lambda match: _METRIC_LOOKUP[match.group(0)], text)
+    return text.upper()
+
+
+_METRIC_TERM_PATTERN = re.compile("|".join(re.escape(term) for term in sorted(METRIC_COLUMNS, key=len, reverse=True)))
+_FILLER_PATTERN = re.compile("|".join(
+    re.escape(word) for word in sorted(list(CARRY_OVER_PERIODS) + ["实际", "预计"] + AGGREGATE_WORDS + CONNECTIVE_WORDS,
+                                       key=len, reverse=True)
+))
+
+
+def _leftover(text: str) -> str:
+    """What remains of a normalized question once projects, metrics, periods and connectives are removed."""
+    text = _METRIC_TERM_PATTERN.sub("", text)
+    text = _PROJECT_PATTERN.sub("", text)
+    return _FILLER_PATTERN.sub("", text)
+
+
+class TemplateQuery:
+    """Parameterized SQL for a metric-by-project question, with what the answer formatter needs."""
+
+    def __init__(self, sql: str, params: tuple, table: str, column: str, metric: str, unit: str,
+                 projects: List[str], period: Optional[str], aggregate: bool, fully_consumed: bool = False):
+        self.sql = sql
+        self.params = params
+        self.table = table
+        self.column = column
+        self.metric = metric
+        self.unit = unit
+        self.projects = projects
+        self.period = period
+        self.aggregate = aggregate
+        # Every word of the question was understood; only then may the answer be phrased without an LLM
+        self.fully_consumed = fully_consumed
+
+
+def _fully_consumed(text: str) -> bool:
+    """A normalized question made only of projects, unambiguous metric terms, periods and connectives."""
+    if any(word in text for word in UNSUPPORTED_WORDS + RELATIVE_YEAR_WORDS):
+        return False
+    matches = list(_METRIC_TERM_PATTERN.finditer(text))
+    if not matches or any(text.startswith(tuple(METRIC_SUFFIXES), match.end()) for match in matches):
+        return False
+    return not _leftover(text)
+
+
+def question_fully_consumed(question: str) -> bool:
+    """Whether the semantic layer understood every word of question, so its answer needs no LLM to phrase."""
+    return _fully_consumed(normalize_question(question))
+
+
+def build_template_query(question: str) -> Optional[TemplateQuery]:
+    """Map "project X's metric Y (for period Z)" and "sum of Y over A and B" onto parameterized SQL.
+
+    Returns None unless exactly one metric, known projects of the metric's
+    table and an unambiguous period are found, and nothing else is left in the
+    question; those questions go to Gemini.
+    """
+    text = normalize_question(question)
+    if not _fully_consumed(text):
+        return None
+
+    metrics = {METRIC_COLUMNS[match.group(0)] for match in _METRIC_TERM_PATTERN.finditer(text)}
+    if len(metrics) != 1:
+        return None
+    table, column, unit = metrics.pop()
+    metric = next(term for term, target in METRIC_COLUMNS.items() if target[:2] == (table, column))
+
+    projects = canonical_project_names(text)
+    if not projects or any(project not in PROJECTS_BY_TABLE[table] for project in projects):
+        return None
+
+    periods = [period for word, period in CARRY_OVER_PERIODS.items() if word in text]
+    if table == CARRY_OVER_TABLE:
+        if len(periods) != 1:
+            return None
+        period = periods[0]
+    else:
+        if "下半年" in text:
+            return None
+        period = None
+    contradicting = "预计" if PERIOD_QUALIFIERS[period] == "实际" else "实际"
+    if contradicting in text:
+        return None
+
+    aggregate = len(projects) > 1 and any(word in text for word in AGGREGATE_WORDS)
+    if aggregate and column in TEXT_COLUMNS:
+        return None
+
+    where = "project_name = ANY(%s)"
+    params: tuple = (projects,)
+    if period is not None:
+        where += " AND period = %s"
+        params += (period,)
+    if aggregate:
+        sql = f"SELECT SUM({column}) AS total_{column} FROM {table} WHERE {where}"
+    else:
+        sql = f"SELECT project_name, {column} FROM {table} WHERE {where} ORDER BY project_name"
+    return TemplateQuery(sql, params, table, column, metric, unit, projects, period, aggregate, fully_consumed=True)
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+def schema_fingerprint(tables: Dict[str, Any]) -> str:
+    """Short hash of the OCT table/column layout; any schema change yields a new cache version."""
+    version = os.getenv("OCT_SQL_CACHE_VERSION", "1")
+    payload = json.dumps({"version": version, "tables": tables}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SQLCache:
+    """Normalized OCT question -> SQL that generated and executed successfully.
+
+    Keys carry the schema fingerprint, so entries written against an older
+    schema are never served after a migration. Only validated SQL is stored;
+    callers invalidate an entry whose SQL stops executing.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None, enabled: bool = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("OCT_SQL_CACHE_MAX_ENTRIES", "512"))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("OCT_SQL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        if enabled is None:
+            enabled = os.getenv("OCT_SQL_CACHE_ENABLED", "true").lower() == "true"
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    @staticmethod
+    def make_key(normalized_question: str, schema_version: str) -> str:
+        return f"{schema_version}|{normalized_question}"
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._metrics.increment("oct_sql_cache.hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._metrics.increment("oct_sql_cache.misses")
+        return None
+
+    def set(self, key: str, sql_query: str):
+        if not self.enabled or not sql_query:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, sql_query)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._metrics.set_gauge("oct_sql_cache.entries", len(self._entries))
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._metrics.increment("oct_sql_cache.invalidations")
+                self._metrics.set_gauge("oct_sql_cache.entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._metrics.set_gauge("oct_sql_cache.entries", 0)
+
+
+sql_cache = None
+
+def get_sql_cache() -> SQLCache:
+    """Get or create the shared OCT NL-to-SQL cache"""
+    global sql_cache
+    if sql_cache is None:
+        sql_cache = SQLCache()
+    return sql_cache
@@ -6,6 +6,8 @@ from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+from tool_result_cache import cached_get
+
 load_dotenv()
 
 USE_MOCK_DATA = True
@@ -218,7 +220,7 @@ class PolicyQueryTool(BaseTool):
             print(f"请求参数: {clean_params}")
             print(f"请求头: {headers}")
             
-            response = requests.get(url, headers=headers, params=clean_params)
+            response = cached_get("policy", url, headers=headers, params=clean_params)
             
             print(f"HTTP状态码: {response.status_code} {response.reason}")
             print(f"原始JSON响应: {response.text}")
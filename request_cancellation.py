@@ -0,0 +1,154 @@
+import os
+import asyncio
+import logging
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import requests
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+TOOL_HTTP_TIMEOUT_SECONDS = float(os.getenv("TOOL_HTTP_TIMEOUT_SECONDS", "15"))
+DISCONNECT_POLL_INTERVAL_SECONDS = float(os.getenv("DISCONNECT_POLL_INTERVAL_SECONDS", "0.5"))
+
+
+class RequestCancelled(Exception):
+    """Raised inside agent work whose client has gone away."""
+
+
+class CancellationToken:
+    """Thread-safe cancel flag shared by a request's event-loop task and its worker threads."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "client_disconnect"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled(f"Request {self.request_id} cancelled ({self.reason})")
+
+
+# Context variables follow the agent into run_in_executor and the agent worker pool
+_current_token: contextvars.ContextVar = contextvars.ContextVar("cancellation_token", default=None)
+
+
+def get_cancellation_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def bind_cancellation_token(token: CancellationToken):
+    """Make token the current cancellation token for this task/context and everything it spawns."""
+    _current_token.set(token)
+
+
+def raise_if_cancelled():
+    """Abort the current unit of work if the request it belongs to was cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def cancellable_get(url: str, **kwargs: Any) -> requests.Response:
+    """requests.get for tool API calls: skipped once the request is cancelled and always bounded by a timeout."""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        get_metrics_registry().increment("tool.http_calls_cancelled")
+        token.raise_if_cancelled()
+    kwargs.setdefault("timeout", TOOL_HTTP_TIMEOUT_SECONDS)
+    return requests.get(url, **kwargs)
+
+
+class CancellationCallbackHandler(BaseCallbackHandler):
+    """Stop the agent loop before its next LLM or tool step once the token is cancelled."""
+
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, token: CancellationToken):
+        self.token = token
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any):
+        self.token.raise_if_cancelled()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs: Any):
+        self.token.raise_if_cancelled()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any):
+        self.token.raise_if_cancelled()
+
+
+_STREAM_END = object()
+_CLIENT_GONE = object()
+
+
+class _StreamFailure:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def cancel_on_disconnect(http_request: Any, stream: AsyncIterator[Any], token: CancellationToken,
+                               poll_interval: float = None) -> AsyncIterator[Any]:
+    """Relay items from stream, cancelling the work behind it as soon as the client disconnects.
+
+    The stream is driven by its own task with the token installed as the current
+    cancellation token, so tool threads and LLM steps it starts can see it. A
+    watcher polls http_request.is_disconnected(); when the client is gone, or
+    when the response itself is torn down, the token is cancelled and the
+    producing task is cancelled, which aborts in-flight async LLM calls.
+    """
+    if poll_interval is None:
+        poll_interval = DISCONNECT_POLL_INTERVAL_SECONDS
+    metrics = get_metrics_registry()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        bind_cancellation_token(token)
+        try:
+            async for item in stream:
+                queue.put_nowait(item)
+        except Exception as e:
+            queue.put_nowait(_StreamFailure(e))
+        finally:
+            queue.put_nowait(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+
+    async def watch_disconnect():
+        while not producer.done():
+            if await http_request.is_disconnected():
+                queue.put_nowait(_CLIENT_GONE)
+                return
+            await asyncio.sleep(poll_interval)
+
+    watcher = asyncio.create_task(watch_disconnect())
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END or item is _CLIENT_GONE:
+                break
+            if isinstance(item, _StreamFailure):
+                raise item.error
+            yield item
+    finally:
+        watcher.cancel()
+        if not producer.done():
+            logger.info(f"Client of request {token.request_id} disconnected, cancelling agent run")
+            metrics.increment("stream.client_disconnects")
+            token.cancel("client_disconnect")
+            producer.cancel()
@@ -0,0 +1,201 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from service_metrics import get_metrics_registry
+from request_cancellation import CancellationToken, bind_cancellation_token, DISCONNECT_POLL_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_EVENT = b": ping\n\n"
+
+
+class StreamRun:
+    """One agent stream, decoupled from the HTTP connection that started it.
+
+    Events are produced by a background task and kept, with sequential SSE ids
+    "<stream_id>:<seq>", in a replay buffer. Connections follow the run from any
+    sequence number, so a client that reconnects with Last-Event-ID picks up
+    where it left off. When the last connection goes away the run is only
+    cancelled after a grace period, giving the client time to come back.
+    """
+
+    def __init__(self, stream_id: str, grace_seconds: float):
+        self.stream_id = stream_id
+        self.grace_seconds = grace_seconds
+        self.token = CancellationToken(stream_id)
+        self.events: List[bytes] = []
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.created_at = time.time()
+        self._changed = asyncio.Event()
+        self._followers = 0
+        self._pending_cancel: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._metrics = get_metrics_registry()
+
+    def start(self, source: AsyncIterator[bytes]):
+        self._task = asyncio.create_task(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator[bytes]):
+        bind_cancellation_token(self.token)
+        try:
+            async for event in source:
+                self._publish(event)
+        except Exception:
+            logger.exception(f"Stream {self.stream_id} failed")
+        finally:
+            self.finished = True
+            self.finished_at = time.time()
+            self._notify()
+
+    def _publish(self, event: bytes):
+        event_id = f"{self.stream_id}:{len(self.events) + 1}".encode("utf-8")
+        self.events.append(b"id: " + event_id + b"\n" + event)
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self, http_request: Any, after_seq: int = 0, heartbeat_seconds: float = None) -> AsyncIterator[bytes]:
+        """Yield events after after_seq, then live events, with heartbeat comments while the run is quiet."""
+        if heartbeat_seconds is None:
+            heartbeat_seconds = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+        self._attach()
+        sent = after_seq
+        last_write = time.monotonic()
+        try:
+            while True:
+                while sent < len(self.events):
+                    sent += 1
+                    last_write = time.monotonic()
+                    yield self.events[sent - 1]
+                if self.finished:
+                    return
+                if await http_request.is_disconnected():
+                    return
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), DISCONNECT_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - last_write >= heartbeat_seconds:
+                        last_write = time.monotonic()
+                        self._metrics.increment("stream.heartbeats")
+                        yield HEARTBEAT_EVENT
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self._followers += 1
+        if self._pending_cancel is not None:
+            self._pending_cancel.cancel()
+            self._pending_cancel = None
+
+    def _detach(self):
+        self._followers -= 1
+        if self._followers > 0 or self.finished:
+            return
+        self._metrics.increment("stream.client_disconnects")
+        if self.grace_seconds > 0:
+            logger.info(f"Client of stream {self.stream_id} disconnected, waiting {self.grace_seconds}s for a resume")
+            self._pending_cancel = asyncio.get_running_loop().call_later(self.grace_seconds, self.cancel)
+        else:
+            self.cancel()
+
+    def cancel(self):
+        """Cancel the agent run behind this stream (tool threads see the token, async LLM calls are aborted)."""
+        self._pending_cancel = None
+        if self.finished or self._followers > 0:
+            return
+        logger.info(f"Cancelling abandoned stream {self.stream_id}")
+        self.abort("client_disconnect")
+
+    def abort(self, reason: str):
+        """Cancel the agent run now, whether or not anyone is following it."""
+        if self._pending_cancel is not None:
+            self._pending_cancel.cancel()
+            self._pending_cancel = None
+        if self.finished:
+            return
+        self.token.cancel(reason)
+        if self._task is not None:
+            self._task.cancel()
+
+
+class StreamRegistry:
+    """Recent StreamRuns by stream id; finished runs stay replayable for STREAM_REPLAY_TTL_SECONDS.
+
+    Stream ids are random and issued here, never taken from the client, so a
+    Last-Event-ID can only resume a stream its holder was sent the id of.
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_streams: int = None, grace_seconds: float = None):
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("STREAM_REPLAY_TTL_SECONDS", "60"))
+        if max_streams is None:
+            max_streams = int(os.getenv("STREAM_REPLAY_MAX_STREAMS", "256"))
+        if grace_seconds is None:
+            grace_seconds = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "15"))
+        self.ttl_seconds = ttl_seconds
+        self.max_streams = max_streams
+        self.grace_seconds = grace_seconds
+        self._runs: "OrderedDict[str, StreamRun]" = OrderedDict()
+        self._metrics = get_metrics_registry()
+
+    def start(self, source: AsyncIterator[bytes], stream_id: Optional[str] = None) -> StreamRun:
+        """Run source in the background under a new stream id (a random one unless given)."""
+        self._prune()
+        if stream_id is None:
+            stream_id = uuid.uuid4().hex
+        previous = self._runs.pop(stream_id, None)
+        if previous is not None:
+            # Never leave an agent run behind without a way to reach or cancel it
+            logger.warning(f"Stream id {stream_id} reused, cancelling the earlier run")
+            self._metrics.increment("stream.id_collisions")
+            previous.abort("stream_replaced")
+        run = StreamRun(stream_id, self.grace_seconds)
+        self._runs[stream_id] = run
+        run.start(source)
+        self._metrics.set_gauge("stream.buffered_streams", len(self._runs))
+        return run
+
+    def resume(self, last_event_id: Optional[str]) -> Optional[Tuple[StreamRun, int]]:
+        """Find the run and sequence number a Last-Event-ID header refers to."""
+        if not last_event_id:
+            return None
+        stream_id, _, seq = last_event_id.strip().rpartition(":")
+        self._prune()
+        run = self._runs.get(stream_id)
+        if run is None or not seq.isdigit():
+            self._metrics.increment("stream.resume_misses")
+            return None
+        self._metrics.increment("stream.resumes")
+        return run, int(seq)
+
+    def _prune(self):
+        now = time.time()
+        for stream_id in [sid for sid, run in self._runs.items()
+                          if run.finished and now - run.finished_at > self.ttl_seconds]:
+            del self._runs[stream_id]
+        while len(self._runs) > self.max_streams:
+            _, run = self._runs.popitem(last=False)
+            run.cancel()
+        self._metrics.set_gauge("stream.buffered_streams", len(self._runs))
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+
+stream_registry = None
+
+def get_stream_registry() -> StreamRegistry:
+    """Get or create the shared stream registry"""
+    global stream_registry
+    if stream_registry is None:
+        stream_registry = StreamRegistry()
+    return stream_registry
@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+class _Timing:
+    """Running count/sum/max summary for a latency metric (milliseconds)."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg, 2),
+            "max_ms": round(self.max, 2),
+            "total_ms": round(self.total, 2)
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe in-process registry of counters, gauges and timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, _Timing] = {}
+        self._started_at = time.time()
+
+    def increment(self, name: str, value: float = 1):
+        """Increase a counter by value."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to its current value."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value_ms: float):
+        """Record a latency observation in milliseconds."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _Timing()
+            timing.observe(value_ms)
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_gauge(self, name: str) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view of all metrics."""
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self._started_at, 1),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {name: timing.snapshot() for name, timing in self._timings.items()}
+            }
+
+
+metrics_registry = None
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Get or create the process-wide metrics registry"""
+    global metrics_registry
+    if metrics_registry is None:
+        metrics_registry = MetricsRegistry()
+    return metrics_registry
@@ -0,0 +1,243 @@
+import os
+import uuid
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent_tracing import estimate_tokens
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class UnsafeSQLError(ValueError):
+    """Generated SQL is not a single read-only SELECT statement."""
+
+
+# Keywords that have no place in a read-only query; SELECT ... INTO creates a table,
+# FOR UPDATE/SHARE takes row locks
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "DROP", "ALTER", "CREATE", "TRUNCATE", "GRANT", "REVOKE",
+    "COPY", "CALL", "DO", "EXECUTE", "PREPARE", "DEALLOCATE", "LOCK", "VACUUM", "ANALYZE", "REINDEX", "CLUSTER",
+    "REFRESH", "COMMENT", "SET", "RESET", "DISCARD", "LISTEN", "NOTIFY", "UNLISTEN", "IMPORT", "INTO", "SHARE",
+}
+# Functions with side effects or access outside the OCT tables
+FORBIDDEN_FUNCTIONS = {
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file",
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "pg_rotate_logfile", "set_config",
+    "lo_import", "lo_export", "dblink", "dblink_exec", "dblink_connect", "query_to_xml",
+}
+FORBIDDEN_FUNCTION_PREFIXES = ("pg_advisory", "pg_try_advisory")
+
+# Token kinds
+WORD = "word"
+QUOTED_IDENTIFIER = "quoted_identifier"
+LITERAL = "literal"
+SEMICOLON = "semicolon"
+SYMBOL = "symbol"
+
+
+def _skip_quoted(sql: str, start: int, quote: str, backslash_escapes: bool = False) -> int:
+    """Index just past the literal/identifier opened at start; doubled quotes are escapes."""
+    i = start + 1
+    while i < len(sql):
+        char = sql[i]
+        if backslash_escapes and char == "\\":
+            i += 2
+            continue
+        if char == quote:
+            if i + 1 < len(sql) and sql[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    raise UnsafeSQLError("SQL 中存在未闭合的引号")
+
+
+def tokenize(sql: str) -> List[Tuple[str, str, int, int]]:
+    """Split PostgreSQL text into (kind, value, start, end) tokens, dropping comments.
+
+    String literals, dollar-quoted strings and quoted identifiers are single
+    tokens, so keywords inside them are never mistaken for SQL.
+    """
+    tokens = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if char.isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = length if newline == -1 else newline + 1
+        elif sql.startswith("/*", i):
+            depth, i = 1, i + 2
+            while depth:
+                if i >= length:
+                    raise UnsafeSQLError("SQL 中存在未闭合的注释")
+                if sql.startswith("/*", i):
+                    depth, i = depth + 1, i + 2
+                elif sql.startswith("*/", i):
+                    depth, i = depth - 1, i + 2
+                else:
+                    i += 1
+        elif char == "'":
+            end = _skip_quoted(sql, i, "'")
+            tokens.append((LITERAL, sql[i:end], i, end))
+            i = end
+        elif char == '"':
+            end = _skip_quoted(sql, i, '"')
+            tokens.append((QUOTED_IDENTIFIER, sql[i + 1:end - 1].replace('""', '"'), i, end))
+            i = end
+        elif char == "$" and i + 1 < length and not sql[i + 1].isdigit():
+            tag_end = sql.find("$", i + 1)
+            tag = sql[i:tag_end + 1] if tag_end != -1 else ""
+            if not tag or not (tag[1:-1] == "" or tag[1:-1].replace("_", "a").isalnum()):
+                tokens.append((SYMBOL, char, i, i + 1))
+                i += 1
+                continue
+            close = sql.find(tag, tag_end + 1)
+            if close == -1:
+                raise UnsafeSQLError("SQL 中存在未闭合的 $ 引号字符串")
+            end = close + len(tag)
+            tokens.append((LITERAL, sql[i:end], i, end))
+            i = end
+        elif char.isalpha() or char == "_":
+            end = i + 1
+            while end < length and (sql[end].isalnum() or sql[end] in "_$"):
+                end += 1
+            if sql[i:end] in ("E", "e") and end < length and sql[end] == "'":
+                end = _skip_quoted(sql, end, "'", backslash_escapes=True)
+                tokens.append((LITERAL, sql[i:end], i, end))
+            else:
+                tokens.append((WORD, sql[i:end].upper(), i, end))
+            i = end
+        elif char == ";":
+            tokens.append((SEMICOLON, char, i, i + 1))
+            i += 1
+        else:
+            tokens.append((SYMBOL, char, i, i + 1))
+            i += 1
+    return tokens
+
+
+def validate_read_only_sql(sql: str) -> str:
+    """Check that sql is one SELECT (or WITH ... SELECT) statement; returns it without trailing semicolons.
+
+    Raises UnsafeSQLError for anything else: several statements, DML/DDL,
+    SELECT INTO, row locks or side-effecting functions. Execution still runs in
+    a read-only transaction, so this is the first of two barriers.
+    """
+    tokens = tokenize(sql or "")
+    while tokens and tokens[-1][0] == SEMICOLON:
+        tokens.pop()
+    if not tokens:
+        raise UnsafeSQLError("SQL 为空")
+    if any(kind == SEMICOLON for kind, _, _, _ in tokens):
+        raise UnsafeSQLError("只允许执行单条 SQL 语句")
+
+    first_word = next((value for kind, value, _, _ in tokens if kind != SYMBOL or value != "("), None)
+    if first_word not in ("SELECT", "WITH"):
+        raise UnsafeSQLError(f"只允许执行 SELECT 查询，收到: {first_word}")
+
+    for index, (kind, value, _, _) in enumerate(tokens):
+        if kind != WORD:
+            continue
+        if value in FORBIDDEN_KEYWORDS:
+            raise UnsafeSQLError(f"SQL 中包含不允许的关键字: {value}")
+        is_call = index + 1 < len(tokens) and tokens[index + 1][1] == "("
+        name = value.lower()
+        if is_call and (name in FORBIDDEN_FUNCTIONS or name.startswith(FORBIDDEN_FUNCTION_PREFIXES)):
+            raise UnsafeSQLError(f"SQL 中包含不允许的函数: {name}")
+    return sql[:tokens[-1][3]]
+
+
+class RowSet(list):
+    """Query rows as dicts; truncated is set when the query returned more than the row cap."""
+
+    def __init__(self, rows: List[Dict[str, Any]], truncated: bool = False, row_cap: Optional[int] = None):
+        super().__init__(rows)
+        self.truncated = truncated
+        self.row_cap = row_cap
+
+
+class SQLGuard:
+    """Read-only, bounded execution of generated SQL.
+
+    Statements are validated before a connection is taken, then run in a
+    READ ONLY transaction with SET LOCAL statement_timeout (OCT_SQL_STATEMENT_TIMEOUT_MS,
+    tighter than the pool's session default) through a named server-side cursor.
+    At most OCT_SQL_MAX_ROWS rows are fetched; the rest stay on the server. Rows
+    sent back into an LLM prompt are cut to OCT_PROMPT_RESULT_TOKENS.
+    """
+
+    def __init__(self, max_rows: int = None, statement_timeout_ms: int = None, prompt_token_budget: int = None):
+        if max_rows is None:
+            max_rows = int(os.getenv("OCT_SQL_MAX_ROWS", "500"))
+        if statement_timeout_ms is None:
+            statement_timeout_ms = int(os.getenv("OCT_SQL_STATEMENT_TIMEOUT_MS", "5000"))
+        if prompt_token_budget is None:
+            prompt_token_budget = int(os.getenv("OCT_PROMPT_RESULT_TOKENS", "1500"))
+        self.max_rows = max_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self.prompt_token_budget = prompt_token_budget
+        self._metrics = get_metrics_registry()
+
+    def validate(self, sql: str) -> str:
+        try:
+            return validate_read_only_sql(sql)
+        except UnsafeSQLError as e:
+            self._metrics.increment("sql_guard.rejected")
+            logger.warning(f"Rejected SQL ({e}): {sql}")
+            raise
+
+    def execute(self, conn: Any, sql: str, params: Optional[tuple] = None) -> RowSet:
+        """Run a validated query on conn (not in autocommit mode); the transaction is rolled back afterwards."""
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute("SET LOCAL statement_timeout = %s", (self.statement_timeout_ms,))
+            cursor = conn.cursor(name=f"sql_guard_{uuid.uuid4().hex[:12]}")
+            try:
+                cursor.itersize = self.max_rows + 1
+                cursor.execute(sql, params)
+                rows = cursor.fetchmany(self.max_rows + 1)
+                columns = [desc[0] for desc in cursor.description]
+            finally:
+                cursor.close()
+        finally:
+            conn.rollback()
+
+        truncated = len(rows) > self.max_rows
+        if truncated:
+            rows = rows[:self.max_rows]
+            self._metrics.increment("sql_guard.truncated")
+            logger.warning(f"SQL result capped at {self.max_rows} rows: {sql}")
+        return RowSet([dict(zip(columns, row)) for row in rows], truncated, self.max_rows)
+
+    def results_for_prompt(self, results: List[Dict[str, Any]]) -> str:
+        """Rows as prompt text, cut to the token budget with a note on what was left out."""
+        parts, used = [], 0
+        for row in results:
+            text = str(row)
+            cost = estimate_tokens(text) + 1
+            if used + cost > self.prompt_token_budget:
+                break
+            parts.append(text)
+            used += cost
+        text = "[" + ", ".join(parts) + "]"
+        if len(parts) < len(results):
+            self._metrics.increment("sql_guard.prompt_truncated")
+            text += f"\n（共 {len(results)} 行，仅列出前 {len(parts)} 行）"
+        if getattr(results, "truncated", False):
+            text += f"\n（查询结果超过 {results.row_cap} 行，已截断）"
+        return text
+
+
+sql_guard = None
+
+def get_sql_guard() -> SQLGuard:
+    """Get or create the shared SQL guard"""
+    global sql_guard
+    if sql_guard is None:
+        sql_guard = SQLGuard()
+    return sql_guard
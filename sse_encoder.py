@@ -0,0 +1,96 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json_bytes(value: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def _database_value(value: Any) -> Any:
+    """JSON form of psycopg2 values the encoders do not know (Decimal amounts, dates)."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+# /ask_agent_stream clients expect newlines inside chunks as literal "\n" / "\r" sequences
+_CHUNK_ESCAPES = str.maketrans({"\n": "\\n", "\r": "\\r"})
+
+DONE_EVENT = b"data: [DONE]\n\n"
+
+
+class OpenAIStreamEncoder:
+    """SSE framing for OpenAI chat.completion.chunk events.
+
+    The id/object/created/model envelope is serialized once per response; each
+    content chunk only serializes its delta string between precomputed bytes.
+    """
+
+    def __init__(self, response_id: str, created: int, model: str):
+        envelope = dumps_json_bytes({
+            "id": response_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model
+        })[:-1]
+        self._content_prefix = b"data: " + envelope + b',"choices":[{"index":0,"delta":{"content":'
+        self._content_suffix = b'},"finish_reason":null}]}\n\n'
+        self._role_event = b"data: " + envelope + b',"choices":[{"index":0,"delta":{"role":"assistant","content":""},"finish_reason":null}]}\n\n'
+        self._stop_event = b"data: " + envelope + b',"choices":[{"index":0,"delta":{},"finish_reason":"stop"}]}\n\n'
+
+    def role(self) -> bytes:
+        return self._role_event
+
+    def content(self, text: str) -> bytes:
+        return self._content_prefix + dumps_json_bytes(text) + self._content_suffix
+
+    def stop(self) -> bytes:
+        return self._stop_event
+
+    def error(self, message: str) -> bytes:
+        """Final chunk carrying an error message, as the legacy stream did."""
+        return self._content_prefix + dumps_json_bytes(message) + b'},"finish_reason":"stop"}]}\n\n'
+
+
+class AgentStreamEncoder:
+    """SSE framing for /ask_agent_stream events ({"chunk": ..., "type": ...})."""
+
+    _content_prefix = b'data: {"chunk":'
+    _content_suffix = b',"type":"content"}\n\n'
+    _error_suffix = b',"type":"error"}\n\n'
+    done_event = b'data: {"type":"done"}\n\n'
+
+    def session(self, session_id: str) -> bytes:
+        return b'data: {"session_id":' + dumps_json_bytes(session_id) + b',"type":"session"}\n\n'
+
+    def content(self, chunk: str) -> bytes:
+        return self._content_prefix + dumps_json_bytes(chunk.translate(_CHUNK_ESCAPES)) + self._content_suffix
+
+    def error(self, message: str) -> bytes:
+        return self._content_prefix + dumps_json_bytes(message) + self._error_suffix
+
+    def done(self) -> bytes:
+        return self.done_event
+
+
+class OCTStreamEncoder:
+    """SSE framing for /ask_oct_stream stage events; the event type is also the SSE event name.
+
+    Row previews hold database values, so Decimal and date values are
+    converted instead of failing serialization.
+    """
+
+    def event(self, event: Dict[str, Any]) -> bytes:
+        return b"event: " + event["type"].encode("ascii") + b"\ndata: " + dumps_json_bytes(event, _database_value) + b"\n\n"
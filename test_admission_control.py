@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Test script for per-route-class admission control (bounded queues, fast 429)."""
+
+import asyncio
+
+from admission_control import AdmissionLimiter, AdmissionRejected
+
+def test_full_queue_rejects_immediately():
+    """Requests beyond max_concurrent + max_queue are rejected without waiting"""
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=1, max_wait_seconds=5)
+        first = await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        try:
+            await limiter.acquire()
+            raise AssertionError("third request should have been rejected")
+        except AdmissionRejected as e:
+            print(f"拒绝: {e}")
+            assert e.retry_after >= 1
+
+        first.release()
+        second = await queued
+        assert limiter.get_stats() == {"max_concurrent": 1, "max_queue": 1, "active": 1, "queue_depth": 0}
+        second.release()
+        second.release()
+        assert limiter.get_stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+def test_queue_wait_times_out():
+    """A queued request gives up after max_wait_seconds and leaves the queue"""
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=4, max_wait_seconds=0.05)
+        slot = await limiter.acquire()
+        try:
+            await limiter.acquire()
+            raise AssertionError("queued request should have timed out")
+        except AdmissionRejected as e:
+            assert e.reason == "queue wait timed out"
+        assert limiter.get_stats()["queue_depth"] == 0
+        slot.release()
+        assert limiter.get_stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_full_queue_rejects_immediately()
+    test_queue_wait_times_out()
+    print("准入控制测试完成")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Test script for request ids and agent trace storage."""
+
+import asyncio
+
+from agent_tracing import AgentTraceCallbackHandler, RequestIdMiddleware, get_trace_store
+
+def _call(headers):
+    """Send one request through the middleware to an app that records a trace; returns (state, response headers)"""
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen.update(scope["state"])
+        AgentTraceCallbackHandler(scope["state"]["request_id"], "秘密问题").finish()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {"type": "http", "headers": headers}
+    asyncio.run(RequestIdMiddleware(app)(scope, receive, send))
+    return seen, dict(sent[0]["headers"])
+
+def test_trace_ids_are_issued_by_server():
+    """A client X-Request-ID is kept for correlation but never becomes the trace id"""
+    victim_state, victim_headers = _call([])
+    victim_id = victim_state["request_id"]
+    assert victim_headers[b"x-request-id"] == victim_id.encode("latin-1")
+
+    # Reusing someone else's id neither overwrites nor exposes their trace
+    state, headers = _call([(b"x-request-id", victim_id.encode("latin-1"))])
+    assert state["request_id"] != victim_id
+    assert state["client_request_id"] == victim_id
+    assert headers[b"x-request-id"] == state["request_id"].encode("latin-1")
+
+    store = get_trace_store()
+    assert store.get(victim_id)["client_request_id"] is None
+    trace = store.get(state["request_id"])
+    assert trace["client_request_id"] == victim_id
+    print(f"服务端 ID: {state['request_id']}, 客户端 ID: {trace['client_request_id']}")
+
+if __name__ == "__main__":
+    test_trace_ids_are_issued_by_server()
+    print("✅ 请求 ID 测试通过")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Test script for the router answer cache (intent + entity keys)."""
+
+import os
+import asyncio
+
+os.environ.setdefault("AUTHORIZATION_TOKEN", "test-token")
+
+from electricity_price_tool import create_electricity_price_tool
+from power_generation_duration_tool import create_power_generation_duration_tool
+from photovoltaic_capacity_tool import create_photovoltaic_capacity_tool
+from policy_query_tool import create_policy_query_tool
+from answer_cache import AnswerCache
+from service_metrics import get_metrics_registry
+
+def _create_tools():
+    return [
+        create_electricity_price_tool(),
+        create_power_generation_duration_tool(),
+        create_photovoltaic_capacity_tool(),
+        create_policy_query_tool()
+    ]
+
+def test_paraphrases_share_key():
+    """Different wordings of the same question resolve to the same cache key"""
+    cache = AnswerCache(enabled=True)
+    tools = _create_tools()
+
+    keys = [
+        cache.lookup_key("淮南工商电价", tools),
+        cache.lookup_key("安徽省淮南市的工商业电价是多少", tools),
+        cache.lookup_key("安徽淮南的工商电价是多少？", tools)
+    ]
+    print(f"缓存键: {keys}")
+    assert keys[0] is not None
+    assert len(set(keys)) == 1
+
+def test_context_dependent_queries_bypass():
+    """Follow-up references and multi-city questions never hit the cache"""
+    cache = AnswerCache(enabled=True)
+    tools = _create_tools()
+
+    for query in ["那边的补贴政策呢？", "北京和上海的电价", "你们投资地面项目吗"]:
+        key = cache.lookup_key(query, tools)
+        print(f"{query} -> {key}")
+        assert key is None
+
+def test_error_answers_not_cached():
+    """Failed tool answers are not stored"""
+    cache = AnswerCache(enabled=True)
+    key = "electricity_price|location=安徽省淮南市|price_type=工商加权电价"
+
+    cache.set(key, "电价查询失败：API请求失败")
+    assert cache.get(key) is None
+
+    cache.set(key, "安徽省淮南市的工商加权电价为0.5731元/千瓦时。")
+    assert cache.get(key) == "安徽省淮南市的工商加权电价为0.5731元/千瓦时。"
+
+def test_aquery_looks_up_cache_once():
+    """aquery consults the answer cache once; the worker-pool run reuses its key instead of looking up again"""
+    import electricity_price_tool
+    from fake_llm import create_offline_llm
+    from main_router_agent import MainRouterAgent
+
+    original_mock = electricity_price_tool.USE_MOCK_DATA
+    electricity_price_tool.USE_MOCK_DATA = True
+    try:
+        metrics = get_metrics_registry()
+        agent = MainRouterAgent(llm=create_offline_llm("scripted"))
+        misses = metrics.get_counter("answer_cache.misses")
+        hits = metrics.get_counter("answer_cache.hits")
+
+        first = asyncio.run(agent.aquery("安徽淮南的工商电价是多少？"))
+        assert metrics.get_counter("answer_cache.misses") == misses + 1
+        assert metrics.get_counter("answer_cache.hits") == hits
+
+        second = asyncio.run(agent.aquery("淮南工商电价"))
+        assert second == first
+        assert metrics.get_counter("answer_cache.misses") == misses + 1
+        assert metrics.get_counter("answer_cache.hits") == hits + 1
+    finally:
+        electricity_price_tool.USE_MOCK_DATA = original_mock
+
+if __name__ == "__main__":
+    test_paraphrases_share_key()
+    test_context_dependent_queries_bypass()
+    test_error_answers_not_cached()
+    test_aquery_looks_up_cache_once()
+    print("答案缓存测试完成")
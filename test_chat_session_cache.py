@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Test script for reusing chat agents of stateless OpenAI-style clients."""
+
+import threading
+from types import SimpleNamespace
+
+from chat_session_cache import ChatSessionCache, conversation_hash, split_chat_messages
+
+class FakeAgent:
+    """Records the history replayed into its memory."""
+
+    def __init__(self):
+        self.loaded = None
+
+    def load_history(self, history):
+        self.loaded = history
+
+def message(role, content):
+    return SimpleNamespace(role=role, content=content)
+
+def test_split_chat_messages():
+    """System messages are dropped and the last user message becomes the question"""
+    history, question = split_chat_messages([
+        message("system", "你是助手"),
+        message("user", "广东电价是多少？"),
+        message("assistant", "0.45元/千瓦时"),
+        message("user", "那广西呢？"),
+    ])
+    assert history == [("user", "广东电价是多少？"), ("assistant", "0.45元/千瓦时")]
+    assert question == "那广西呢？"
+
+    history, question = split_chat_messages([message("system", "你是助手"), message("assistant", "你好！")])
+    assert history == [("assistant", "你好！")]
+    assert question is None
+
+def test_hit_reuses_agent_without_rebuilding():
+    """The next turn of a conversation checks out the agent stored after the previous turn"""
+    cache = ChatSessionCache(max_entries=8, ttl_seconds=60)
+    agent = FakeAgent()
+    cache.checkin([("user", "广东电价是多少？"), ("assistant", "0.45元/千瓦时")], agent)
+
+    # Clients may resend turns with different surrounding whitespace
+    history = [("user", "广东电价是多少？ "), ("assistant", "0.45元/千瓦时\n")]
+    reused = cache.checkout_or_create(history, FakeAgent)
+    assert reused is agent
+    assert agent.loaded is None, "a cached agent must not have its history replayed again"
+    assert len(cache) == 0
+
+def test_miss_after_history_diverges_rebuilds_from_history():
+    """An edited earlier turn misses the cache and a new agent is built from the client history"""
+    cache = ChatSessionCache(max_entries=8, ttl_seconds=60)
+    cached = FakeAgent()
+    cache.checkin([("user", "广东电价是多少？"), ("assistant", "0.45元/千瓦时")], cached)
+
+    history = [("user", "广西电价是多少？"), ("assistant", "0.42元/千瓦时")]
+    agent = cache.checkout_or_create(history, FakeAgent)
+    assert agent is not cached
+    assert agent.loaded == history
+    assert len(cache) == 1
+
+    assert cache.checkout([]) is None
+    assert conversation_hash(history) != conversation_hash(history[:1])
+
+def test_expired_entry_is_a_miss():
+    """Agents older than the TTL are not reused"""
+    cache = ChatSessionCache(max_entries=8, ttl_seconds=-1)
+    cache.checkin([("user", "你好"), ("assistant", "你好！")], FakeAgent())
+    assert cache.checkout([("user", "你好"), ("assistant", "你好！")]) is None
+
+def test_concurrent_checkout_hands_agent_to_one_request():
+    """Two requests continuing the same conversation never share one agent"""
+    cache = ChatSessionCache(max_entries=8, ttl_seconds=60)
+    history = [("user", "广东电价是多少？"), ("assistant", "0.45元/千瓦时")]
+    agent = FakeAgent()
+    cache.checkin(history, agent)
+
+    start = threading.Barrier(8)
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        start.wait()
+        result = cache.checkout_or_create(history, FakeAgent)
+        with results_lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for result in results if result is agent) == 1
+    assert len({id(result) for result in results}) == 8
+    assert all(result.loaded == history for result in results if result is not agent)
+    print(f"并发取出: 1 个复用, {len(results) - 1} 个重建")
+
+def test_lru_eviction():
+    """The least recently stored conversation is evicted beyond max_entries"""
+    cache = ChatSessionCache(max_entries=2, ttl_seconds=60)
+    for index in range(3):
+        cache.checkin([("user", f"问题{index}"), ("assistant", f"回答{index}")], FakeAgent())
+    assert len(cache) == 2
+    assert cache.checkout([("user", "问题0"), ("assistant", "回答0")]) is None
+    assert cache.checkout([("user", "问题2"), ("assistant", "回答2")]) is not None
+
+if __name__ == "__main__":
+    test_split_chat_messages()
+    print("✅ 消息拆分测试通过")
+    test_hit_reuses_agent_without_rebuilding()
+    print("✅ 会话命中测试通过")
+    test_miss_after_history_diverges_rebuilds_from_history()
+    print("✅ 历史分叉重建测试通过")
+    test_expired_entry_is_a_miss()
+    print("✅ 过期失效测试通过")
+    test_concurrent_checkout_hands_agent_to_one_request()
+    print("✅ 并发取出测试通过")
+    test_lru_eviction()
+    print("✅ LRU 淘汰测试通过")
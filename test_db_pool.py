@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test script for the pooled database connection layer (runs against fake psycopg2 connections)."""
+
+import threading
+import time
+from unittest import mock
+
+from psycopg2 import extensions
+
+from db_pool import DatabasePool, DatabasePoolTimeout
+
+class FakeConnection:
+    opened = []
+
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        FakeConnection.opened.append(self)
+
+    def cursor(self):
+        return mock.MagicMock()
+
+    def get_transaction_status(self):
+        return self.status
+
+    @property
+    def info(self):
+        return mock.Mock(transaction_status=self.status)
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+def _pool(**kwargs) -> DatabasePool:
+    FakeConnection.opened = []
+    kwargs.setdefault("statement_timeout_at_startup", True)
+    return DatabasePool("test", "postgresql://test", min_size=1, statement_timeout_ms=5000, **kwargs)
+
+def test_connections_are_reused_and_bounded():
+    """Connections are reused, waits are bounded and statement_timeout is set"""
+    with mock.patch("psycopg2.connect", FakeConnection):
+        pool = _pool(max_size=1, acquire_timeout_seconds=0.1)
+        for _ in range(3):
+            with pool.connection() as conn:
+                conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        assert len(FakeConnection.opened) == 1
+        assert "statement_timeout=5000" in FakeConnection.opened[0].kwargs["options"]
+        assert FakeConnection.opened[0].status == extensions.TRANSACTION_STATUS_IDLE
+
+        held = pool.acquire()
+        try:
+            pool.acquire()
+            raise AssertionError("expected DatabasePoolTimeout")
+        except DatabasePoolTimeout as e:
+            print(f"等待超时: {e}")
+        threading.Timer(0.05, pool.release, args=[held]).start()
+        pool.release(pool.acquire())
+        assert pool.get_stats()["in_use"] == 0
+
+def test_old_and_broken_connections_are_replaced():
+    """Connections past max lifetime or closed by the server are replaced"""
+    with mock.patch("psycopg2.connect", FakeConnection):
+        pool = _pool(max_size=2, max_lifetime_seconds=0.05)
+        with pool.connection() as conn:
+            first = conn
+        time.sleep(0.1)
+        with pool.connection() as conn:
+            assert conn is not first
+            conn.closed = 2
+        with pool.connection() as conn:
+            assert not conn.closed
+        assert first.closed
+        print(f"打开的连接数: {len(FakeConnection.opened)}")
+
+def test_no_startup_options_by_default():
+    """Transaction poolers reject startup options, so none are sent unless enabled"""
+    with mock.patch("psycopg2.connect", FakeConnection):
+        pool = _pool(max_size=1, statement_timeout_at_startup=None)
+        with pool.connection():
+            pass
+        assert "options" not in FakeConnection.opened[0].kwargs
+        assert pool.get_stats()["statement_timeout_ms"] is None
+
+        pool = _pool(max_size=1, statement_timeout_at_startup=False)
+        with pool.connection():
+            pass
+        assert "options" not in FakeConnection.opened[0].kwargs
+
+if __name__ == "__main__":
+    test_connections_are_reused_and_bounded()
+    test_old_and_broken_connections_are_replaced()
+    test_no_startup_options_by_default()
+    print("✅ 数据库连接池测试通过")
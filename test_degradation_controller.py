@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Test script for the overload degradation controller (escalation and hysteresis)."""
+
+from degradation_controller import DegradationController, LEVEL_NORMAL, LEVEL_TEMPLATED_OCT, LEVEL_KEYWORD_ROUTER
+
+def _controller():
+    controller = DegradationController()
+    controller.forced_level = None
+    controller.evaluate_interval_seconds = 0
+    controller.min_hold_seconds = 0
+    return controller
+
+def test_escalates_with_llm_latency():
+    """Slow LLM calls move the controller straight to the matching level"""
+    controller = _controller()
+    assert controller.current_level() == LEVEL_NORMAL
+
+    controller.observe_llm_latency(16000)
+    assert controller.current_level() == LEVEL_TEMPLATED_OCT
+
+    for _ in range(10):
+        controller.observe_llm_latency(40000)
+    assert controller.current_level() == LEVEL_KEYWORD_ROUTER
+    print(f"降级状态: {controller.get_status()['mode']}")
+
+def test_recovers_one_level_at_a_time():
+    """Recovery needs latency well below the threshold and steps down gradually"""
+    controller = _controller()
+    controller.observe_llm_latency(30000)
+    assert controller.current_level() == LEVEL_KEYWORD_ROUTER
+
+    # Just under the entry threshold is not enough to recover (hysteresis)
+    controller._latency_ewma_ms = 24000
+    assert controller.current_level() == LEVEL_KEYWORD_ROUTER
+
+    controller._latency_ewma_ms = 1000
+    assert controller.current_level() == LEVEL_TEMPLATED_OCT
+    controller.current_level()
+    assert controller.current_level() == LEVEL_NORMAL
+    assert [t["to"] for t in controller.get_status()["transitions"]] == ["keyword_router", "templated_oct", "capped_rag", "normal"]
+
+if __name__ == "__main__":
+    test_escalates_with_llm_latency()
+    test_recovers_one_level_at_a_time()
+    print("降级控制测试完成")
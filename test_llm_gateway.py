@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Test script for the shared LLM gateway (priority rate limiting, jittered retry)."""
+
+from google.api_core import exceptions as google_exceptions
+
+from llm_gateway import LLMGateway, LLMRateLimited, ModelRateLimiter, PRIORITY_WECHAT, PRIORITY_INTERACTIVE
+
+def test_wechat_served_before_earlier_interactive_requests():
+    """Only the highest-priority waiter may take the next token"""
+    limiter = ModelRateLimiter("gemini-test", requests_per_minute=60, burst=1)
+    first = limiter.enqueue(PRIORITY_INTERACTIVE)
+    assert limiter.try_acquire(first) == 0
+
+    interactive = limiter.enqueue(PRIORITY_INTERACTIVE)
+    wechat = limiter.enqueue(PRIORITY_WECHAT)
+    assert limiter.try_acquire(interactive) > 0
+    assert limiter.try_acquire(wechat) > 0
+
+    limiter._tokens = 1
+    assert limiter.try_acquire(interactive) > 0
+    assert limiter.try_acquire(wechat) == 0
+    print(f"限流状态: {limiter.get_stats()}")
+
+def test_rate_limit_errors_are_retried_then_surface():
+    """429s are retried with backoff; persistent ones raise LLMRateLimited"""
+    gateway = LLMGateway()
+    gateway.default_rpm = 6000
+    gateway.backoff_base_seconds = 0.001
+    gateway.max_retries = 2
+    attempts = []
+
+    def flaky_call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise google_exceptions.ResourceExhausted("quota exceeded")
+        return "ok"
+
+    assert gateway.run("gemini-test", "test", flaky_call) == "ok"
+    assert len(attempts) == 3
+
+    def always_limited():
+        raise google_exceptions.ResourceExhausted("quota exceeded")
+
+    try:
+        gateway.run("gemini-test", "test", always_limited)
+        raise AssertionError("expected LLMRateLimited")
+    except LLMRateLimited as e:
+        print(f"限流异常: {e}")
+
+if __name__ == "__main__":
+    test_wechat_served_before_earlier_interactive_requests()
+    test_rate_limit_errors_are_retried_then_surface()
+    print("LLM网关测试完成")
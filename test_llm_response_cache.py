@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Test script for the exact-prompt LLM response cache."""
+
+import os
+import tempfile
+
+from llm_response_cache import LLMResponseCache, make_cache_key
+
+def test_key_covers_model_prompt_and_params():
+    """Only identical model + prompt + params share a key"""
+    key = make_cache_key("models/gemini-1.5-flash", "SELECT 1?", {"temperature": 0})
+    assert key == make_cache_key("gemini-1.5-flash", "SELECT 1?", {"temperature": 0})
+    assert key != make_cache_key("gemini-1.5-pro", "SELECT 1?", {"temperature": 0})
+    assert key != make_cache_key("gemini-1.5-flash", "SELECT 2?", {"temperature": 0})
+    assert key != make_cache_key("gemini-1.5-flash", "SELECT 1?", {"temperature": 0, "top_k": 1})
+
+def test_lru_ttl_and_sqlite_tier():
+    """Entries are evicted LRU, expire by TTL and survive a restart through SQLite"""
+    cache = LLMResponseCache(enabled=True, max_entries=2, ttl_seconds=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+    expired = LLMResponseCache(enabled=True, max_entries=2, ttl_seconds=-1)
+    expired.set("a", "1")
+    assert expired.get("a") is None
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "llm_cache.sqlite3")
+        LLMResponseCache(enabled=True, max_entries=8, ttl_seconds=60, sqlite_path=path).set("k", "cached answer")
+        restarted = LLMResponseCache(enabled=True, max_entries=8, ttl_seconds=60, sqlite_path=path)
+        print(f"重启后命中: {restarted.get('k')}")
+        assert restarted.get("k") == "cached answer"
+
+if __name__ == "__main__":
+    test_key_covers_model_prompt_and_params()
+    test_lru_ttl_and_sqlite_tier()
+    print("✅ LLM响应缓存测试通过")
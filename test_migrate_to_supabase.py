@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Test script for the chunked OCT migration (runs against fake psycopg2 cursors)."""
+
+import hashlib
+from decimal import Decimal
+from unittest import mock
+
+from psycopg2 import sql
+
+from migrate_to_supabase import _copy_text, diff_checksums, stream_local_rows, sync_table_incremental, upsert_rows
+
+class FakeNamedCursor:
+    description = [("id",), ("project_name",), ("revenue",)]
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+        self.fetch_sizes = []
+        self.closed = False
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        rows = self.rows[self.position:self.position + size]
+        self.position += size
+        return rows
+
+    def close(self):
+        self.closed = True
+
+class FakeTable:
+    """Rows of one table by id, answering the queries the incremental sync sends."""
+
+    columns = ["id", "project_name", "revenue"]
+
+    def __init__(self, rows, vanish_on_read=()):
+        self.rows = {row[0]: row for row in rows}
+        self.vanish_on_read = set(vanish_on_read)
+        self.deleted = []
+        self.committed = False
+
+    @staticmethod
+    def checksum(row):
+        return hashlib.md5(repr(row).encode("utf-8")).hexdigest()
+
+    def cursor(self, name=None):
+        return FakeTableCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+class FakeTableCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def execute(self, query, params=None):
+        text = repr(query)
+        rows = [self.table.rows[row_id] for row_id in sorted(self.table.rows)]
+        if "string_agg" in text:
+            self.result = [(hashlib.md5("".join(FakeTable.checksum(row) for row in rows).encode("utf-8")).hexdigest(),)]
+        elif "md5(t::text)" in text:
+            self.result = [(row[0], FakeTable.checksum(row)) for row in rows]
+        elif "DELETE" in text:
+            self.table.deleted.extend(params[0])
+        elif "SELECT *" in text:
+            self.description = [(column,) for column in FakeTable.columns]
+            self.result = [row for row in rows if row[0] in params[0] and row[0] not in self.table.vanish_on_read]
+        else:
+            self.result = []
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+def _sync(local, target, chunk_rows):
+    upserted = []
+    with mock.patch("migrate_to_supabase.execute_values",
+                    side_effect=lambda cursor, query, rows, page_size: upserted.append(list(rows))), \
+            mock.patch.object(sql.Composed, "as_string", return_value="INSERT ..."):
+        stats = sync_table_incremental(local, target, "h1_carry_over_performance", chunk_rows=chunk_rows)
+    return stats, upserted
+
+def test_rows_stream_in_chunks_from_a_named_cursor():
+    """Local rows are read through a named cursor, one bounded chunk at a time"""
+    cursor = FakeNamedCursor([(i, "水月周庄", Decimal("1.50")) for i in range(25)])
+    local_conn = mock.Mock()
+    local_conn.cursor.return_value = cursor
+    chunks = [rows for _, rows in stream_local_rows(local_conn, "h1_carry_over_performance", chunk_rows=10)]
+    assert local_conn.cursor.call_args.kwargs["name"] == "migrate_h1_carry_over_performance"
+    assert [len(rows) for rows in chunks] == [10, 10, 5]
+    assert set(cursor.fetch_sizes) == {10} and cursor.closed
+    print(f"分块大小: {[len(rows) for rows in chunks]}")
+
+def test_copy_fields_are_escaped():
+    """NULLs, tabs, newlines and backslashes survive the COPY text format"""
+    assert _copy_text(None) == "\\N"
+    assert _copy_text(Decimal("4953.00")) == "4953.00"
+    assert _copy_text("水月\t周庄\n\\") == "水月\\t周庄\\n\\\\"
+
+def test_incremental_diff_finds_only_changes():
+    """Merging id-ordered row checksums yields new/changed ids to upsert and removed ids to delete"""
+    local = [(1, "a"), (2, "b2"), (4, "d"), (5, "e")]
+    target = [(1, "a"), (2, "b"), (3, "c"), (5, "e"), (6, "f")]
+    changed, deleted = diff_checksums(local, target)
+    assert changed == [2, 4] and deleted == [3, 6]
+    assert diff_checksums([], target) == ([], [1, 2, 3, 5, 6])
+    assert diff_checksums(local, []) == ([1, 2, 4, 5], [])
+    assert diff_checksums(local, local) == ([], [])
+    print(f"需要更新: {changed}, 需要删除: {deleted}")
+
+def test_incremental_sync_upserts_and_deletes_only_changes():
+    """Only new and changed rows are upserted, in chunks, and rows gone locally are deleted"""
+    local = FakeTable([(1, "水月周庄", Decimal("1")), (2, "水月源岸", Decimal("2.5")), (4, "铂尔曼酒店", Decimal("4"))])
+    target = FakeTable([(1, "水月周庄", Decimal("1")), (2, "水月源岸", Decimal("2")), (3, "欢乐明湖", Decimal("3"))])
+    stats, upserted = _sync(local, target, chunk_rows=1)
+    assert upserted == [[(2, "水月源岸", Decimal("2.5"))], [(4, "铂尔曼酒店", Decimal("4"))]]
+    assert target.deleted == [3] and target.committed
+    assert stats["upserted"] == 2 and stats["deleted"] == 1
+
+    stats, upserted = _sync(local, FakeTable(list(local.rows.values())), chunk_rows=1)
+    assert upserted == [] and stats["upserted"] == 0
+
+def test_incremental_sync_skips_rows_that_vanish():
+    """A changed row deleted locally before it is re-read leaves an empty chunk that is skipped"""
+    local = FakeTable([(1, "水月周庄", Decimal("1")), (2, "水月源岸", Decimal("2"))], vanish_on_read=[1])
+    target = FakeTable([])
+    stats, upserted = _sync(local, target, chunk_rows=1)
+    assert upserted == [[(2, "水月源岸", Decimal("2"))]]
+    assert stats["upserted"] == 1 and target.committed
+
+    with mock.patch("migrate_to_supabase.execute_values") as execute_values:
+        assert upsert_rows(mock.Mock(), "h1_carry_over_performance", FakeTable.columns, []) == 0
+    execute_values.assert_not_called()
+
+if __name__ == "__main__":
+    test_rows_stream_in_chunks_from_a_named_cursor()
+    test_copy_fields_are_escaped()
+    test_incremental_diff_finds_only_changes()
+    test_incremental_sync_upserts_and_deletes_only_changes()
+    test_incremental_sync_skips_rows_that_vanish()
+    print("✅ 数据迁移测试通过")
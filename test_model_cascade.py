@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Test script for the fast/strong model cascade of the router agent (scripted fake chat models)."""
+
+import asyncio
+from typing import Any, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from model_cascade import CascadeChatModel, SCRATCHPAD_MARKER, STAGE_ESCALATED, STAGE_ROUTE, STAGE_SYNTHESIS
+from service_metrics import get_metrics_registry
+
+PARSE_ERROR = "Check your output and make sure it conforms to the expected format. Try again."
+TOOL_STEP = " 用户在问电价\nAction: query_electricity_price\nAction Input: 广东电价"
+
+class ScriptedChatModel(BaseChatModel):
+    reply: str
+    calls: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls.append(messages[-1].content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+def _cascade(fast_reply: str):
+    fast = ScriptedChatModel(reply=fast_reply, calls=[])
+    strong = ScriptedChatModel(reply=" 我现在知道最终答案了\nFinal Answer: 强模型回答", calls=[])
+    cascade = CascadeChatModel(fast_llm=fast, strong_llm=strong, fast_model_name="fast",
+                               strong_model_name="strong", parse_error_marker=PARSE_ERROR)
+    return cascade, fast, strong
+
+def _prompt(question: str = "广东的电价是多少？", scratchpad: str = "") -> List[HumanMessage]:
+    return [HumanMessage(content=f"系统说明……\nQuestion: 用户的问题\n{SCRATCHPAD_MARKER}{question}\nThought:{scratchpad}")]
+
+def _run(cascade, messages):
+    result = cascade._generate(messages)
+    return result.llm_output["model_name"], result.llm_output["cascade_stage"]
+
+def test_stage_selection():
+    """Route steps go to the fast model; steps with tool results or a parse-error retry go to the strong one"""
+    cascade, fast, strong = _cascade(TOOL_STEP)
+    assert _run(cascade, _prompt()) == ("fast", STAGE_ROUTE)
+    assert len(fast.calls) == 1 and not strong.calls
+
+    observed = TOOL_STEP + "\nObservation: 广东工商业电价0.65元/kWh\nThought:"
+    assert _run(cascade, _prompt(scratchpad=observed)) == ("strong", STAGE_SYNTHESIS)
+    assert _run(cascade, _prompt(scratchpad=f"\nObservation: {PARSE_ERROR}\nThought:")) == ("strong", STAGE_ESCALATED)
+    assert len(fast.calls) == 1
+
+    # "Question: " inside the user's input or an earlier example must not hide the scratchpad
+    assert _run(cascade, _prompt(question="Question: 这个呢", scratchpad=observed)) == ("strong", STAGE_SYNTHESIS)
+
+def test_simple_final_answers_stay_on_the_fast_model():
+    """A greeting or clarifying question from the fast model costs one call"""
+    cascade, fast, strong = _cascade(" 用户在打招呼\nFinal Answer: 您好！请问您想查询哪个地区的光伏信息？")
+    assert _run(cascade, _prompt("你好")) == ("fast", STAGE_ROUTE)
+    assert len(fast.calls) == 1 and not strong.calls
+
+def test_escalation_triggers():
+    """Parse failures, hedging answers, unsourced figures and empty answers are re-run on the strong model"""
+    cases = [
+        ("我觉得应该查电价", STAGE_ESCALATED),
+        (" 不清楚\nFinal Answer: 抱歉，我不知道广东的电价。", STAGE_SYNTHESIS),
+        (" 直接回答\nFinal Answer: 广东工商业电价约为0.65元/kWh。", STAGE_SYNTHESIS),
+        (" 直接回答\nFinal Answer: ", STAGE_SYNTHESIS),
+    ]
+    for fast_reply, stage in cases:
+        cascade, fast, strong = _cascade(fast_reply)
+        assert _run(cascade, _prompt()) == ("strong", stage), fast_reply
+        assert len(fast.calls) == 1 and len(strong.calls) == 1
+        print(f"升级到强模型 ({stage}): {fast_reply.strip().splitlines()[-1]}")
+
+def test_missing_marker_uses_the_strong_model():
+    """A prompt without the scratchpad marker is not routed blind"""
+    cascade, fast, strong = _cascade(TOOL_STEP)
+    before = get_metrics_registry().get_counter("cascade.scratchpad_marker_missing")
+    assert _run(cascade, [HumanMessage(content="Question: 广东电价\nThought:")]) == ("strong", STAGE_ESCALATED)
+    assert not fast.calls
+    assert get_metrics_registry().get_counter("cascade.scratchpad_marker_missing") == before + 1
+
+def test_async_path_matches():
+    """_agenerate follows the same stage selection and escalation"""
+    cascade, fast, strong = _cascade(" 直接回答\nFinal Answer: 0.65元/kWh")
+    result = asyncio.run(cascade._agenerate(_prompt()))
+    assert result.llm_output["model_name"] == "strong" and len(fast.calls) == 1
+
+def test_router_prompt_contains_the_marker():
+    """The router's ReAct prompt keeps the marker the cascade looks for"""
+    from main_router_agent import MainRouterAgent
+    template = MainRouterAgent._create_main_prompt(None).template
+    assert SCRATCHPAD_MARKER + "{input}\nThought: {agent_scratchpad}" in template
+
+if __name__ == "__main__":
+    test_stage_selection()
+    test_simple_final_answers_stay_on_the_fast_model()
+    test_escalation_triggers()
+    test_missing_marker_uses_the_strong_model()
+    test_async_path_matches()
+    test_router_prompt_contains_the_marker()
+    print("✅ 模型级联测试通过")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Test script for the deterministic OCT answer formatter."""
+
+from decimal import Decimal
+
+from oct_answer_formatter import format_amount, format_answer
+from oct_semantic_layer import build_template_query, question_fully_consumed
+
+def test_units_and_provenance():
+    """Amounts scale to 亿元 and answers name their source table"""
+    assert format_amount(Decimal("4953.00"), "万元") == "4,953.00万元"
+    assert format_amount(Decimal("37764.00"), "万元") == "3.78亿元（37,764.00万元）"
+    assert format_amount(115, "套") == "115套"
+
+    template = build_template_query("上半年水月周庄和水月源岸的总回款是多少？")
+    answer = format_answer([{"total_h1_actual": Decimal("37764.00")}], template.sql, template)
+    print(answer)
+    assert "3.78亿元" in answer
+    assert "数据来自 h1_collections_performance" in answer
+
+def test_complex_results_go_to_llm():
+    """Large results and columns of unknown meaning are left to Gemini"""
+    rows = [{"project_name": f"项目{i}", "revenue": Decimal(i)} for i in range(20)]
+    sql = "SELECT project_name, revenue FROM h1_carry_over_performance"
+    assert format_answer(rows, sql, fully_consumed=True) is None
+    assert format_answer([{"ratio": 0.5}], "SELECT 0.5 AS ratio FROM h1_carry_over_performance", fully_consumed=True) is None
+
+def test_subject_taken_from_where_clause():
+    """Generated SQL selecting only a metric is phrased with the project and period it filtered on"""
+    sql = "SELECT revenue FROM h1_carry_over_performance WHERE project_name = '水月周庄' AND period = '上半年实际'"
+    answer = format_answer([{"revenue": Decimal("4953.00")}], sql, fully_consumed=True)
+    print(answer)
+    assert answer.startswith("水月周庄上半年实际的结转收入为4,953.00万元。")
+
+    sql = ("SELECT SUM(h1_actual) AS total_h1_actual FROM h1_collections_performance "
+           "WHERE project_name IN ('水月周庄', '水月源岸')")
+    answer = format_answer([{"total_h1_actual": Decimal("37764.00")}], sql, fully_consumed=True)
+    assert answer.startswith("水月周庄、水月源岸的上半年实际回款合计为3.78亿元")
+
+    sql = "SELECT project_name, revenue FROM h1_carry_over_performance WHERE period = '下半年预计'"
+    answer = format_answer([{"project_name": "水月周庄", "revenue": Decimal("100")}], sql, fully_consumed=True)
+    assert answer.startswith("水月周庄下半年预计：结转收入为100.00万元。")
+
+def test_missing_subject_goes_to_llm():
+    """Rows that cannot be tied to a project are left to Gemini instead of losing their subject"""
+    def local(rows, sql):
+        return format_answer(rows, sql, fully_consumed=True)
+
+    row = [{"revenue": Decimal("4953.00")}]
+    assert local(row, "SELECT revenue FROM h1_carry_over_performance LIMIT 1") is None
+    assert local(row, "SELECT revenue FROM h1_carry_over_performance WHERE project_name LIKE '水月%'") is None
+    assert local(row, "SELECT revenue FROM h1_carry_over_performance WHERE project_name != '水月周庄'") is None
+    assert local(row, "SELECT revenue FROM h1_carry_over_performance WHERE project_name IN ('水月周庄', '水月源岸')") is None
+    rows = [{"revenue": Decimal("1")}, {"revenue": Decimal("2")}]
+    assert local(rows, "SELECT revenue FROM h1_carry_over_performance WHERE project_name = '水月周庄'") is None
+
+def test_only_fully_consumed_questions_are_formatted_locally():
+    """Without the semantic layer's fully-consumed flag the answer is left to Gemini"""
+    template = build_template_query("水月周庄上半年的净利润")
+    rows = [{"project_name": "水月周庄", "net_profit": Decimal("120.50")}]
+    assert template.fully_consumed
+    assert format_answer(rows, template.sql, template) is not None
+    template.fully_consumed = False
+    assert format_answer(rows, template.sql, template) is None
+
+    sql = "SELECT project_name, net_profit FROM h1_carry_over_performance WHERE period = '上半年实际'"
+    assert format_answer(rows, sql) is None
+    assert question_fully_consumed("水月周庄的净利润")
+    assert not question_fully_consumed("水月周庄上半年的净利润率")
+    assert not question_fully_consumed("去年水月周庄的净利润")
+    assert not question_fully_consumed("水月周庄净利润为什么下降")
+
+if __name__ == "__main__":
+    test_units_and_provenance()
+    test_complex_results_go_to_llm()
+    test_subject_taken_from_where_clause()
+    test_missing_subject_goes_to_llm()
+    test_only_fully_consumed_questions_are_formatted_locally()
+    print("✅ OCT回答格式化测试通过")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Test script for the in-process OCT replica (loads from a fake Postgres connection)."""
+
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+from oct_local_replica import OCTLocalReplica, ReplicaIncompatible, translate_to_sqlite
+from oct_semantic_layer import build_template_query
+
+TABLES = {
+    "h1_carry_over_performance": (
+        [("id", "integer"), ("project_name", "character varying"), ("period", "character varying"), ("revenue", "numeric")],
+        [(1, "水月周庄", "上半年实际", Decimal("4953.00")), (2, "水月源岸", "上半年实际", Decimal("47466.00")),
+         (3, "水月周庄", "下半年预计", Decimal("5000.00")), (4, "酒店", "上半年实际", None)],
+    ),
+    "h1_collections_performance": (
+        [("id", "integer"), ("project_name", "character varying"), ("h1_actual", "numeric"),
+         ("created_at", "timestamp without time zone")],
+        [(1, "水月周庄", Decimal("7764.00"), datetime(2025, 7, 29, 9, 0)),
+         (2, "水月源岸", Decimal("30000.00"), datetime(2025, 7, 29, 10, 30)),
+         (3, "ABC Hotel", Decimal("10.00"), datetime(2025, 7, 30, 8, 0))],
+    ),
+}
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql.startswith("SELECT md5"):
+            table = sql.split(" FROM ")[1].split()[0]
+            self.rows = [(f"{table}-{self.db.version}",)]
+        elif "information_schema" in sql:
+            self.rows = list(TABLES[params[0]][0])
+        else:
+            table = sql.split(" FROM ")[1].split()[0]
+            self.rows = list(TABLES[table][1])
+        self.db.queries += 1
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+class FakePool:
+    def __init__(self):
+        self.version = 1
+        self.queries = 0
+
+    @contextmanager
+    def connection(self):
+        conn = type("Conn", (), {})()
+        conn.cursor = lambda: FakeCursor(self)
+        conn.rollback = lambda: None
+        yield conn
+
+def test_templates_and_generated_sql_run_locally():
+    """Template and simple generated SQL are answered by the replica with Postgres semantics"""
+    replica = OCTLocalReplica("test", FakePool(), refresh_seconds=0)
+    replica.start()
+    template = build_template_query("水月周庄和源岸上半年结转收入")
+    results = replica.query(template.sql, template.params)
+    assert results == [{"project_name": "水月周庄", "revenue": 4953.0}, {"project_name": "水月源岸", "revenue": 47466.0}]
+
+    total = replica.query("SELECT SUM(h1_actual) AS total_h1_actual FROM h1_collections_performance")
+    assert total == [{"total_h1_actual": 37774.0}]
+    # Postgres puts NULLs last in ascending order
+    ordered = replica.query("SELECT project_name FROM h1_carry_over_performance WHERE period = '上半年实际' ORDER BY revenue")
+    assert ordered[-1]["project_name"] == "酒店"
+    print(f"副本查询结果: {results}")
+
+def test_incompatible_sql_falls_back():
+    """Postgres-only syntax and SQLite errors return None so the caller uses the remote database"""
+    replica = OCTLocalReplica("test", FakePool(), refresh_seconds=0)
+    assert replica.query("SELECT 1") is None  # not loaded yet
+    replica.start()
+    assert replica.query("SELECT revenue::numeric FROM h1_carry_over_performance") is None
+    assert replica.query("SELECT no_such_column FROM h1_carry_over_performance") is None
+    # ILIKE ignores case in Postgres; it must go remote instead of matching case-sensitively
+    assert replica.query("SELECT project_name FROM h1_collections_performance WHERE project_name ILIKE '%abc%'") is None
+    assert replica.query("SELECT project_name FROM h1_collections_performance WHERE project_name NOT ILIKE %s", ("%abc%",)) is None
+    # LIKE stays case-sensitive, as in Postgres
+    assert replica.query("SELECT project_name FROM h1_collections_performance WHERE project_name LIKE '%abc%'") == []
+    assert replica.query("SELECT project_name FROM h1_collections_performance WHERE project_name LIKE '%ABC%'") == [{"project_name": "ABC Hotel"}]
+    for sql in ["SELECT DISTINCT ON (project_name) * FROM t", "SELECT to_char(revenue, '999') FROM t"]:
+        try:
+            translate_to_sqlite(sql)
+            raise AssertionError(f"expected ReplicaIncompatible: {sql}")
+        except ReplicaIncompatible as e:
+            print(f"不兼容，回退远程数据库: {e}")
+
+def test_refresh_reloads_only_changed_data():
+    """Unchanged server checksums skip the reload; changed ones rebuild the replica"""
+    pool = FakePool()
+    replica = OCTLocalReplica("test", pool, refresh_seconds=0)
+    assert replica.refresh()
+    assert not replica.refresh()
+    pool.version = 2
+    assert replica.refresh()
+    assert replica.get_stats()["rows"] == {"h1_carry_over_performance": 4, "h1_collections_performance": 3}
+
+def test_results_match_postgres_semantics():
+    """Column names, timestamps and numeric operators behave as they would on Postgres"""
+    replica = OCTLocalReplica("test", FakePool(), refresh_seconds=0)
+    replica.start()
+    table = "h1_collections_performance"
+
+    # Postgres folds unquoted aliases to lower case and names bare aggregates after the function
+    assert replica.query(f"SELECT SUM(h1_actual) AS Total_H1_Actual FROM {table}") == [{"total_h1_actual": 37774.0}]
+    assert replica.query(f"SELECT SUM(h1_actual), COUNT(*) FROM {table}") == [{"sum": 37774.0, "count": 3}]
+    assert replica.query(f'SELECT h1_actual AS "Actual" FROM {table} WHERE id = 1') == [{"Actual": 7764.0}]
+    assert replica.query(f"SELECT t.Project_Name, h1_actual * 2 FROM {table} t WHERE id = 1") == [
+        {"project_name": "水月周庄", "?column?": 15528.0}]
+    assert list(replica.query(f"SELECT *, id AS Row_Id FROM {table} WHERE id = 1")[0]) == [
+        "id", "project_name", "h1_actual", "created_at", "row_id"]
+
+    # Timestamps compare against Postgres-style literals ('YYYY-MM-DD HH:MM')
+    later = replica.query(f"SELECT project_name FROM {table} WHERE created_at >= '2025-07-29 10:00' ORDER BY id")
+    assert later == [{"project_name": "水月源岸"}, {"project_name": "ABC Hotel"}]
+    assert replica.query(f"SELECT created_at FROM {table} WHERE id = 1") == [{"created_at": "2025-07-29 09:00:00"}]
+
+    # NUMERIC is REAL in SQLite: % and integer casts would not round or wrap like Postgres
+    assert replica.query(f"SELECT h1_actual % 7 AS remainder FROM {table}") is None
+    assert replica.query(f"SELECT CAST(h1_actual / 7 AS INTEGER) FROM {table}") is None
+    assert replica.query(f"SELECT SUM(h1_actual) total FROM {table}") is None
+
+if __name__ == "__main__":
+    test_templates_and_generated_sql_run_locally()
+    test_incompatible_sql_falls_back()
+    test_refresh_reloads_only_changed_data()
+    test_results_match_postgres_semantics()
+    print("✅ OCT 本地副本测试通过")
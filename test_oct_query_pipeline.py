@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Test script for the OCT question pipeline shared by both database agents (fake LLM and database)."""
+
+import asyncio
+
+from oct_database_agent import OCTDatabaseAgent
+from oct_database_agent_supabase import OCTDatabaseAgentSupabase
+from oct_query_pipeline import OCTQueryPipeline
+from oct_sql_cache import get_sql_cache
+from service_metrics import get_metrics_registry
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if "SQL查询:" in prompt and "查询结果:" not in prompt:
+            return FakeResponse("SELECT project_name, revenue FROM h1_carry_over_performance WHERE period = '上半年实际'")
+        return FakeResponse("回答")
+
+    async def stream_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        for part in ["回", "答"]:
+            yield part
+
+def _agent(cls, fail_first=False):
+    """An agent of cls with fake collaborators, skipping its database and LLM setup"""
+    agent = cls.__new__(cls)
+    OCTQueryPipeline.__init__(agent)
+    agent.llm = FakeLLM()
+    agent.get_database_info = lambda: {"status": "success", "tables": {"h1_carry_over_performance": ["revenue (numeric)"]}}
+    failures = [fail_first]
+
+    def execute(query, params=None):
+        if failures[0]:
+            failures[0] = False
+            raise Exception("column does not exist")
+        return [{"project_name": "水月周庄", "revenue": 4953}]
+    agent._execute_sql_query = execute
+    return agent
+
+def test_both_agents_share_the_pipeline():
+    """Both agents plan, execute and answer through the same pipeline, under their own metric prefix"""
+    get_sql_cache().clear()
+    for cls, prefix in [(OCTDatabaseAgent, "oct"), (OCTDatabaseAgentSupabase, "oct_supabase")]:
+        assert issubclass(cls, OCTQueryPipeline) and cls.metrics_prefix == prefix
+        agent = _agent(cls)
+        before = get_metrics_registry().get_counter(f"{prefix}.sql_source.template")
+        result = asyncio.run(agent.ask_question("水月周庄上半年结转收入是多少？"))
+        assert result["status"] == "success" and result["sql_source"] == "template"
+        assert not agent.llm.prompts and "4,953.00万元" in result["answer"]
+        assert get_metrics_registry().get_counter(f"{prefix}.sql_source.template") == before + 1
+        print(f"{cls.__name__}: {result['answer'].splitlines()[0]}")
+
+def test_failing_template_falls_back_to_gemini_and_streams():
+    """A template that fails to run is regenerated by Gemini; the stream reports both statements"""
+    get_sql_cache().clear()
+    agent = _agent(OCTDatabaseAgentSupabase, fail_first=True)
+
+    async def collect():
+        return [event async for event in agent.ask_question_stream("水月周庄上半年结转收入是多少？")]
+    events = asyncio.run(collect())
+    types = [event["type"] for event in events]
+    assert types[:3] == ["sql", "sql", "rows"] and types[-1] == "done"
+    assert [event["sql_source"] for event in events if event["type"] == "sql"] == ["template", "llm"]
+    print(f"流式事件: {types}")
+
+def test_partly_understood_question_is_answered_by_gemini():
+    """Rows for a question the semantic layer did not fully understand are phrased by Gemini, not locally"""
+    get_sql_cache().clear()
+    agent = _agent(OCTDatabaseAgent)
+    result = asyncio.run(agent.ask_question("水月周庄上半年结转收入为什么这么高？"))
+    assert result["sql_source"] == "llm"
+    assert result["answer"] == "回答"
+    assert "用户问题: 水月周庄上半年结转收入为什么这么高？" in agent.llm.prompts[-1]
+
+if __name__ == "__main__":
+    test_both_agents_share_the_pipeline()
+    test_failing_template_falls_back_to_gemini_and_streams()
+    test_partly_understood_question_is_answered_by_gemini()
+    print("✅ OCT 查询流程测试通过")
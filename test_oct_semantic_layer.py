@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test script for OCT question normalization and the NL-to-SQL cache."""
+
+from oct_semantic_layer import build_template_query, normalize_question
+from oct_sql_cache import SQLCache, schema_fingerprint
+
+def test_paraphrases_normalize_alike():
+    """Wording, aliases and synonyms collapse; projects and metrics stay distinct"""
+    forms = {
+        normalize_question("周庄上半年的营收是多少？"),
+        normalize_question("请问 水月周庄上半年结转收入是多少"),
+        normalize_question("水月周庄上半年的结转收入？"),
+    }
+    print(f"规范化结果: {forms}")
+    assert forms == {"水月周庄上半年结转收入"}
+    assert normalize_question("水月源岸上半年的净利润") != normalize_question("水月周庄上半年的净利润")
+    assert normalize_question("水月周庄上半年的毛利") != normalize_question("水月周庄上半年的净利润")
+
+def test_schema_change_invalidates_cached_sql():
+    """A changed schema fingerprint never serves SQL cached for the old schema"""
+    cache = SQLCache(enabled=True)
+    old_version = schema_fingerprint({"h1_carry_over_performance": ["revenue (numeric)"]})
+    new_version = schema_fingerprint({"h1_carry_over_performance": ["revenue (numeric)", "region (text)"]})
+    question = normalize_question("水月周庄上半年的结转收入")
+
+    cache.set(SQLCache.make_key(question, old_version), "SELECT revenue FROM h1_carry_over_performance")
+    assert cache.get(SQLCache.make_key(question, old_version)) is not None
+    assert cache.get(SQLCache.make_key(question, new_version)) is None
+
+def test_template_fast_path():
+    """Metric-by-project questions get parameterized SQL; anything else falls back to Gemini"""
+    single = build_template_query("周庄上半年的营收是多少？")
+    print(f"模板SQL: {single.sql} {single.params}")
+    assert single.table == "h1_carry_over_performance" and single.column == "revenue"
+    assert single.params == (["水月周庄"], "上半年实际")
+    assert "%s" in single.sql and "水月周庄" not in single.sql
+
+    total = build_template_query("上半年水月周庄和水月源岸的总回款是多少？")
+    assert total.aggregate and total.sql.startswith("SELECT SUM(h1_actual)")
+    assert total.params == (["水月周庄", "水月源岸"],)
+
+    assert build_template_query("水月周庄的净利润") is None  # no period for a carry-over metric
+    assert build_template_query("哪个项目上半年回款最高？") is None
+    assert build_template_query("欢乐明湖上半年的净利润") is None  # project not in the carry-over table
+
+def test_ratio_and_target_questions_are_not_misread():
+    """Ratios and targets named after a metric never resolve to the metric itself"""
+    assert build_template_query("水月周庄的回款完成率") is None  # 上半年 or 年度 is ambiguous
+    assert build_template_query("水月周庄上半年的毛利率") is None
+    assert build_template_query("水月周庄上半年的净利润率") is None
+    assert build_template_query("水月周庄的回款占比") is None
+
+    annual = build_template_query("水月源岸全年回款完成率")
+    assert annual.column == "annual_completion_rate"
+    assert build_template_query("水月周庄上半年的回款完成率").column == "h1_completion_rate"
+    assert build_template_query("水月周庄的回款目标").column == "annual_target"
+
+def test_period_qualifiers_are_respected():
+    """Relative years and 预计/实际 words that contradict the period go to Gemini"""
+    assert build_template_query("去年上半年水月周庄的收入") is None
+    assert build_template_query("今年水月周庄上半年的收入") is None
+    assert build_template_query("前年水月周庄的回款") is None
+    assert build_template_query("水月周庄上半年预计收入") is None
+    assert build_template_query("水月周庄下半年实际收入") is None
+
+    assert build_template_query("水月周庄下半年预计收入").params == (["水月周庄"], "下半年预计")
+    assert build_template_query("水月周庄上半年实际收入").params == (["水月周庄"], "上半年实际")
+
+def test_unconsumed_words_go_to_llm():
+    """A question with words the template does not understand is not answered from a template"""
+    assert build_template_query("水月周庄上半年的收入和去化") is None
+    assert build_template_query("水月周庄上半年按月的收入") is None
+    assert build_template_query("水月周庄项目和水月源岸上半年的总收入") is not None
+
+if __name__ == "__main__":
+    test_paraphrases_normalize_alike()
+    test_schema_change_invalidates_cached_sql()
+    test_template_fast_path()
+    test_ratio_and_target_questions_are_not_misread()
+    test_period_qualifiers_are_respected()
+    test_unconsumed_words_go_to_llm()
+    print("✅ OCT语义层测试通过")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test script for cancelling agent work when the streaming client disconnects."""
+
+import asyncio
+
+from admission_control import AdmissionLimiter, AdmittedStreamingResponse
+from request_cancellation import CancellationToken, cancel_on_disconnect, get_cancellation_token
+
+class FakeRequest:
+    """Stands in for a Starlette request that reports a disconnect after a number of polls."""
+
+    def __init__(self, connected_polls):
+        self.connected_polls = connected_polls
+        self.polls = 0
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.polls > self.connected_polls
+
+class FakeAgentRun:
+    """An agent stream that emits one chunk and then waits on a slow LLM call."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+        self.token_seen = None
+
+    async def stream(self):
+        self.token_seen = get_cancellation_token()
+        yield "第一段"
+        self.started.set()
+        try:
+            await asyncio.sleep(30)
+            yield "永远不会发送"
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+def test_disconnect_cancels_agent_and_releases_slot():
+    """A client disconnect cancels the agent task and frees its admission slot"""
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=0, max_wait_seconds=1)
+        slot = await limiter.acquire()
+        assert limiter.get_stats()["active"] == 1
+
+        run = FakeAgentRun()
+        token = CancellationToken("req-1")
+        http_request = FakeRequest(connected_polls=1)
+
+        async def body():
+            async for chunk in cancel_on_disconnect(http_request, run.stream(), token, poll_interval=0.01):
+                yield chunk
+
+        sent = []
+        never = asyncio.Event()
+
+        async def receive():
+            await never.wait()
+
+        async def send(message):
+            sent.append(message)
+
+        response = AdmittedStreamingResponse(body(), slot, media_type="text/event-stream")
+        scope = {"type": "http", "asgi": {"spec_version": "2.3"}}
+        await asyncio.wait_for(response({**scope}, receive, send), timeout=5)
+
+        assert run.token_seen is token
+        assert run.cancelled, "agent task should have been cancelled"
+        assert token.cancelled and token.reason == "client_disconnect"
+        assert [m["body"] for m in sent if m["type"] == "http.response.body" and m.get("body")] == ["第一段".encode("utf-8")]
+        assert limiter.get_stats()["active"] == 0
+        print(f"断开前发送: {len(sent)} 条消息, 令牌原因: {token.reason}")
+
+    asyncio.run(scenario())
+
+def test_finished_stream_is_not_cancelled():
+    """A stream that completes normally leaves its token untouched"""
+    async def scenario():
+        token = CancellationToken("req-2")
+
+        async def short_stream():
+            yield "a"
+            yield "b"
+
+        items = [item async for item in cancel_on_disconnect(FakeRequest(connected_polls=100), short_stream(), token,
+                                                              poll_interval=0.01)]
+        assert items == ["a", "b"]
+        assert not token.cancelled
+
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_disconnect_cancels_agent_and_releases_slot()
+    print("✅ 客户端断开取消测试通过")
+    test_finished_stream_is_not_cancelled()
+    print("✅ 正常结束不取消测试通过")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Test script for resumable agent streams (replay, heartbeats, grace-period cancellation)."""
+
+import asyncio
+
+import resumable_stream
+from resumable_stream import HEARTBEAT_EVENT, StreamRegistry
+
+class FakeRequest:
+    """Stands in for a Starlette request; disconnected is flipped by the test."""
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+async def scripted_source(events, pause=0.0):
+    for event in events:
+        if pause:
+            await asyncio.sleep(pause)
+        yield event
+
+async def collect(stream, limit=None):
+    items = []
+    async for item in stream:
+        items.append(item)
+        if limit is not None and len(items) >= limit:
+            break
+    return items
+
+def test_stream_ids_are_issued_by_server():
+    """Each run gets a fresh random id, and a reused id cancels the earlier run"""
+    async def scenario():
+        registry = StreamRegistry(ttl_seconds=60, max_streams=8, grace_seconds=1)
+        first = registry.start(scripted_source([b"data: a\n\n"]))
+        second = registry.start(scripted_source([b"data: b\n\n"]))
+        assert first.stream_id != second.stream_id
+        assert len(first.stream_id) == 32
+
+        never_ends = asyncio.Event()
+
+        async def slow_source():
+            yield b"data: x\n\n"
+            await never_ends.wait()
+
+        old = registry.start(slow_source(), stream_id="fixed")
+        await asyncio.sleep(0.01)
+        replacement = registry.start(scripted_source([b"data: y\n\n"]), stream_id="fixed")
+        await asyncio.sleep(0.01)
+        assert old.token.cancelled and old.token.reason == "stream_replaced"
+        assert old.finished
+        assert registry.resume("fixed:0")[0] is replacement
+
+    asyncio.run(scenario())
+
+def test_resume_replays_after_last_event_id():
+    """Reconnecting with Last-Event-ID replays only the events after that sequence number"""
+    async def scenario():
+        registry = StreamRegistry(ttl_seconds=60, max_streams=8, grace_seconds=1)
+        events = [f"data: {i}\n\n".encode("utf-8") for i in range(1, 5)]
+        run = registry.start(scripted_source(events))
+        first = await collect(run.follow(FakeRequest(), 0, heartbeat_seconds=60))
+        assert len(first) == 4
+        assert first[0].startswith(f"id: {run.stream_id}:1\n".encode("utf-8"))
+
+        resumed_run, after_seq = registry.resume(f"{run.stream_id}:2")
+        assert resumed_run is run and after_seq == 2
+        replay = await collect(resumed_run.follow(FakeRequest(), after_seq, heartbeat_seconds=60))
+        assert replay == first[2:]
+        print(f"续传事件: {replay}")
+
+        assert registry.resume("unknown:1") is None
+        assert registry.resume(f"{run.stream_id}:abc") is None
+
+    asyncio.run(scenario())
+
+def test_heartbeat_while_run_is_quiet():
+    """A follower gets heartbeat comments while the run produces nothing"""
+    async def scenario():
+        registry = StreamRegistry(ttl_seconds=60, max_streams=8, grace_seconds=1)
+        release = asyncio.Event()
+
+        async def quiet_source():
+            yield b"data: start\n\n"
+            await release.wait()
+            yield b"data: end\n\n"
+
+        run = registry.start(quiet_source())
+        follower = run.follow(FakeRequest(), 0, heartbeat_seconds=0.02)
+        items = await collect(follower, limit=3)
+        assert items[1:] == [HEARTBEAT_EVENT, HEARTBEAT_EVENT]
+        release.set()
+        rest = await collect(follower)
+        assert rest[-1].endswith(b"data: end\n\n")
+
+    original_interval = resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS
+    resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS = 0.01
+    try:
+        asyncio.run(scenario())
+    finally:
+        resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS = original_interval
+
+def test_disconnect_cancels_after_grace_period():
+    """An abandoned run is cancelled after the grace period unless the client resumes in time"""
+    async def scenario():
+        registry = StreamRegistry(ttl_seconds=60, max_streams=8, grace_seconds=0.05)
+        never_ends = asyncio.Event()
+
+        async def endless_source():
+            yield b"data: start\n\n"
+            await never_ends.wait()
+
+        # Resumed within the grace period: the run keeps going
+        kept = registry.start(endless_source())
+        request = FakeRequest()
+        follower = kept.follow(request, 0, heartbeat_seconds=60)
+        await collect(follower, limit=1)
+        request.disconnected = True
+        assert await collect(follower) == []
+        resumed = kept.follow(FakeRequest(), 1, heartbeat_seconds=60)
+        resume_task = asyncio.create_task(collect(resumed))
+        await asyncio.sleep(0.1)
+        assert not kept.token.cancelled
+        resume_task.cancel()
+        await asyncio.gather(resume_task, return_exceptions=True)
+
+        # Not resumed: the run is cancelled once the grace period runs out
+        abandoned = registry.start(endless_source())
+        request = FakeRequest()
+        follower = abandoned.follow(request, 0, heartbeat_seconds=60)
+        await collect(follower, limit=1)
+        request.disconnected = True
+        assert await collect(follower) == []
+        assert not abandoned.token.cancelled
+        await asyncio.sleep(0.1)
+        assert abandoned.token.cancelled and abandoned.token.reason == "client_disconnect"
+        assert abandoned.finished
+
+        kept.abort("test_done")
+
+    original_interval = resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS
+    resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS = 0.01
+    try:
+        asyncio.run(scenario())
+    finally:
+        resumable_stream.DISCONNECT_POLL_INTERVAL_SECONDS = original_interval
+
+if __name__ == "__main__":
+    test_stream_ids_are_issued_by_server()
+    print("✅ 流 ID 服务端生成测试通过")
+    test_resume_replays_after_last_event_id()
+    print("✅ Last-Event-ID 续传测试通过")
+    test_heartbeat_while_run_is_quiet()
+    print("✅ 心跳测试通过")
+    test_disconnect_cancels_after_grace_period()
+    print("✅ 宽限期取消测试通过")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test script for the SQL guardrails on generated OCT queries (runs against a fake psycopg2 connection)."""
+
+from unittest import mock
+
+from sql_guard import RowSet, SQLGuard, UnsafeSQLError, validate_read_only_sql
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.fetched = None
+        self.rolled_back = False
+
+    def cursor(self, name=None):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.execute.side_effect = lambda sql, params=None: self.statements.append((name, sql, params))
+        cursor.description = [("project_name",), ("revenue",)]
+
+        def fetchmany(size):
+            self.fetched = size
+            return self.rows[:size]
+        cursor.fetchmany.side_effect = fetchmany
+        return cursor
+
+    def rollback(self):
+        self.rolled_back = True
+
+def test_only_single_read_only_selects_pass():
+    """SELECT/WITH pass; writes, stacked statements, SELECT INTO and side-effecting functions are rejected"""
+    allowed = [
+        "SELECT SUM(revenue) FROM h1_carry_over_performance WHERE project_name = '删除; DROP TABLE x';",
+        "WITH t AS (SELECT * FROM h1_collections_performance) SELECT project_name, h1_actual FROM t -- delete",
+        "(SELECT 1) /* UPDATE */",
+        'SELECT "update" FROM t WHERE note = $$; DROP TABLE t$$',
+    ]
+    for sql in allowed:
+        assert not validate_read_only_sql(sql).endswith(";")
+
+    rejected = [
+        "",
+        "DELETE FROM h1_carry_over_performance",
+        "SELECT 1; DROP TABLE h1_carry_over_performance",
+        "SELECT * INTO backup FROM h1_carry_over_performance",
+        "SELECT * FROM h1_carry_over_performance FOR UPDATE",
+        "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+        "SELECT pg_sleep(60)",
+        "SELECT 'unterminated",
+    ]
+    for sql in rejected:
+        try:
+            validate_read_only_sql(sql)
+            raise AssertionError(f"expected UnsafeSQLError: {sql}")
+        except UnsafeSQLError as e:
+            print(f"已拒绝: {sql!r} -> {e}")
+
+def test_execution_is_read_only_timed_and_capped():
+    """Queries run read-only with SET LOCAL statement_timeout on a named cursor, fetching at most the row cap"""
+    conn = FakeConnection([(f"项目{i}", i) for i in range(10)])
+    results = SQLGuard(max_rows=3, statement_timeout_ms=2000).execute(conn, "SELECT project_name, revenue FROM t")
+    assert [sql for _, sql, _ in conn.statements[:2]] == ["SET TRANSACTION READ ONLY", "SET LOCAL statement_timeout = %s"]
+    assert conn.statements[1][2] == (2000,)
+    assert conn.statements[2][0].startswith("sql_guard_")
+    assert conn.fetched == 4 and conn.rolled_back
+    assert results == [{"project_name": f"项目{i}", "revenue": i} for i in range(3)] and results.truncated
+
+def test_prompt_results_fit_the_token_budget():
+    """Rows beyond the prompt token budget are left out with a note"""
+    guard = SQLGuard(max_rows=100, prompt_token_budget=60)
+    results = RowSet([{"project_name": "水月周庄", "revenue": i} for i in range(100)], truncated=True, row_cap=100)
+    text = guard.results_for_prompt(results)
+    print(text)
+    assert "仅列出前" in text and "已截断" in text
+    assert text.count("水月周庄") < 100
+    assert guard.results_for_prompt([{"a": 1}]) == "[{'a': 1}]"
+
+if __name__ == "__main__":
+    test_only_single_read_only_selects_pass()
+    test_execution_is_read_only_timed_and_capped()
+    test_prompt_results_fit_the_token_budget()
+    print("✅ SQL 防护测试通过")
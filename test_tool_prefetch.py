@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Test script for follow-up tool prefetch (scheduling, pending cap, cache hits)."""
+
+import os
+import json
+import threading
+
+os.environ.setdefault("AUTHORIZATION_TOKEN", "test-token")
+
+import requests
+
+from electricity_price_tool import create_electricity_price_tool
+from service_metrics import get_metrics_registry
+from tool_prefetch import ToolPrefetcher
+from tool_result_cache import get_tool_result_cache
+
+URL = "https://example.invalid/hub/followup/"
+
+class FakeTool:
+    """A tool whose API call goes through the shared tool result cache and is counted."""
+
+    def __init__(self, name, intent, release=None):
+        self.name = name
+        self.intent = intent
+        self.release = release
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _fetch(self, query):
+        if self.release is not None:
+            self.release.wait(5)
+        with self._lock:
+            self.calls.append(query)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"code": 0, "res": query}).encode("utf-8")
+        return response
+
+    def _run(self, query):
+        response = get_tool_result_cache().fetch(self.intent, URL + self.name, {"q": query}, lambda: self._fetch(query))
+        return response.json()["res"]
+
+def _create_tools(release=None):
+    return [
+        create_electricity_price_tool(),
+        FakeTool("query_power_generation_duration", "power_generation_duration", release),
+        FakeTool("query_photovoltaic_capacity", "photovoltaic_capacity", release),
+        FakeTool("query_policies", "policy", release),
+    ]
+
+def test_followups_scheduled_and_served_from_cache():
+    """After a price answer the other tools are prefetched for the same city and the next turn hits the cache"""
+    get_tool_result_cache().clear()
+    metrics = get_metrics_registry()
+    hits = metrics.get_counter("tool_prefetch.followup.hits")
+    prefetcher = ToolPrefetcher(max_workers=1, followup_workers=2, followup_max_pending=8)
+    tools = _create_tools()
+
+    submitted = prefetcher.prefetch_followups("安徽淮南的工商电价是多少？", tools)
+    prefetcher._followup_executor.shutdown(wait=True)
+    assert submitted == 3
+    assert tools[1].calls == ["安徽省淮南市的发电小时数"]
+    assert tools[2].calls == ["安徽省淮南市的光伏承载力"]
+    assert tools[3].calls == ["安徽省淮南市的补贴政策"]
+    assert prefetcher.get_stats()["followup"]["pending"] == 0
+
+    # The agent's own call on the follow-up turn is answered without another API request
+    assert tools[1]._run("安徽省淮南市的发电小时数") == "安徽省淮南市的发电小时数"
+    assert len(tools[1].calls) == 1
+    assert metrics.get_counter("tool_prefetch.followup.hits") == hits + 1
+    print(f"预取后续查询: {submitted} 个, 命中: 1")
+
+def test_followups_capped_by_pending_limit():
+    """Follow-ups beyond followup_max_pending are dropped instead of queued"""
+    get_tool_result_cache().clear()
+    metrics = get_metrics_registry()
+    dropped = metrics.get_counter("tool_prefetch.followup.dropped")
+    release = threading.Event()
+    prefetcher = ToolPrefetcher(max_workers=1, followup_workers=1, followup_max_pending=2)
+    tools = _create_tools(release)
+
+    assert prefetcher.prefetch_followups("安徽淮南的工商电价是多少？", tools) == 2
+    assert prefetcher.prefetch_followups("北京市的工商电价是多少？", tools) == 0
+    assert metrics.get_counter("tool_prefetch.followup.dropped") == dropped + 2
+    assert prefetcher.get_stats()["followup"]["pending"] == 2
+
+    release.set()
+    prefetcher._followup_executor.shutdown(wait=True)
+    assert prefetcher.get_stats()["followup"]["pending"] == 0
+    assert sum(len(tool.calls) for tool in tools[1:]) == 2
+
+def test_no_followups_without_a_location():
+    """Context-dependent, nationwide or disabled prefetches schedule nothing"""
+    tools = _create_tools()
+    prefetcher = ToolPrefetcher(max_workers=1, followup_workers=1, followup_max_pending=8)
+    assert prefetcher.prefetch_followups("那边的电价呢？", tools) == 0
+    assert prefetcher.prefetch_followups("你们地面项目投资吗？", tools) == 0
+
+    disabled = ToolPrefetcher(max_workers=1, followup_workers=1, followup_enabled=False)
+    assert disabled.prefetch_followups("安徽淮南的工商电价是多少？", tools) == 0
+    prefetcher._followup_executor.shutdown(wait=True)
+    assert all(not tool.calls for tool in tools[1:])
+
+if __name__ == "__main__":
+    test_followups_scheduled_and_served_from_cache()
+    print("✅ 后续查询预取测试通过")
+    test_followups_capped_by_pending_limit()
+    print("✅ 预取上限测试通过")
+    test_no_followups_without_a_location()
+    print("✅ 无地点不预取测试通过")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Test script for the single-flight tool result cache and speculative prefetch accounting."""
+
+import json
+import threading
+import time
+
+import requests
+
+from service_metrics import get_metrics_registry
+from tool_result_cache import SpeculationRecord, ToolResultCache, bind_speculation
+
+URL = "https://example.invalid/hub/elec_price/"
+
+def _response(payload: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(payload).encode("utf-8")
+    return response
+
+def test_concurrent_calls_share_one_request():
+    """Identical in-flight calls join the first one; successful responses are cached"""
+    cache = ToolResultCache(enabled=True)
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return _response({"code": 0, "res": {"elec_price": "0.4155"}})
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.fetch("electricity_price", URL, {"city": "上海市"}, slow_fetch)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.fetch("electricity_price", URL, {"city": "上海市"}, slow_fetch)
+
+    print(f"HTTP调用次数: {len(calls)}")
+    assert len(calls) == 1
+    assert all(result.json()["res"]["elec_price"] == "0.4155" for result in results)
+
+    cache.fetch("electricity_price", URL, {"city": "北京市"}, lambda: _response({"code": -1, "message": "error"}))
+    cache.fetch("electricity_price", URL, {"city": "北京市"}, lambda: calls.append(1) or _response({"code": 0}))
+    assert len(calls) == 2
+
+def test_speculation_hits_and_waste():
+    """A speculative result read by the agent is a hit; one nobody reads is waste"""
+    cache = ToolResultCache(enabled=True)
+    metrics = get_metrics_registry()
+    hits = metrics.get_counter("tool_prefetch.hits")
+    wasted = metrics.get_counter("tool_prefetch.wasted")
+
+    record = SpeculationRecord()
+    bind_speculation(record)
+    try:
+        cache.fetch("electricity_price", URL, {"city": "上海市"}, lambda: _response({"code": 0}))
+        cache.fetch("electricity_price", URL, {"city": "深圳市"}, lambda: _response({"code": 0}))
+    finally:
+        bind_speculation(None)
+
+    cache.fetch("electricity_price", URL, {"city": "上海市"}, lambda: _response({"code": 0}))
+    assert cache.settle_speculation(record) == 1
+    assert metrics.get_counter("tool_prefetch.hits") == hits + 1
+    assert metrics.get_counter("tool_prefetch.wasted") == wasted + 1
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_one_request()
+    test_speculation_hits_and_waste()
+    print("✅ 工具结果缓存测试通过")
@@ -0,0 +1,190 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from answer_cache import has_context_reference, resolve_query_intent
+from degradation_controller import get_degradation_controller, LEVEL_CAPPED_RAG
+from service_metrics import get_metrics_registry
+from tool_result_cache import PREFETCH_FOLLOWUP, SpeculationRecord, bind_speculation, get_tool_result_cache
+
+logger = logging.getLogger(__name__)
+
+# answer_cache intent -> the tool the ReAct agent picks for it
+INTENT_TOOLS = {
+    "electricity_price": "query_electricity_price",
+    "power_generation_duration": "query_power_generation_duration",
+    "photovoltaic_capacity": "query_photovoltaic_capacity",
+    "policy": "query_policies",
+}
+
+# Follow-up questions users typically ask about a location once one tool answered for it,
+# e.g. price first, then "那边的发电小时数/承载力/补贴政策呢？"
+FOLLOWUP_QUERIES = {
+    "query_electricity_price": ["{location}的工商电价", "{location}的上网电价"],
+    "query_power_generation_duration": ["{location}的发电小时数"],
+    "query_photovoltaic_capacity": ["{location}的光伏承载力"],
+    "query_policies": ["{location}的补贴政策"],
+}
+
+
+class Speculation:
+    """A predicted tool call running ahead of the agent's first LLM step."""
+
+    def __init__(self, tool_name: str, future: Future, record: SpeculationRecord):
+        self.tool_name = tool_name
+        self.future = future
+        self.record = record
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def settle(self):
+        """Call when the agent run is over; hits and waste are counted once the speculative call finishes."""
+        with self._lock:
+            if self._settled:
+                return
+            self._settled = True
+        self.future.add_done_callback(lambda _: get_tool_result_cache().settle_speculation(self.record))
+
+
+class ToolPrefetcher:
+    """Start the tool call the agent is about to make before the LLM has decided on it.
+
+    Queries the answer cache can resolve to a single (intent, entities) pair are
+    unambiguous enough to predict the agent's action. The predicted tool runs on
+    the raw query in a small background pool; its API responses land in the
+    tool result cache, where the agent's own call finds them (or joins the call
+    still in flight). Predictions the agent does not follow are counted as
+    tool_prefetch.wasted.
+    """
+
+    def __init__(self, max_workers: int = None, enabled: bool = None,
+                 followup_workers: int = None, followup_max_pending: int = None, followup_enabled: bool = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("TOOL_PREFETCH_MAX_WORKERS", "4"))
+        if enabled is None:
+            enabled = os.getenv("TOOL_PREFETCH_ENABLED", "true").lower() == "true"
+        if followup_workers is None:
+            followup_workers = int(os.getenv("TOOL_FOLLOWUP_PREFETCH_MAX_WORKERS", "2"))
+        if followup_max_pending is None:
+            followup_max_pending = int(os.getenv("TOOL_FOLLOWUP_PREFETCH_MAX_PENDING", "16"))
+        if followup_enabled is None:
+            followup_enabled = os.getenv("TOOL_FOLLOWUP_PREFETCH_ENABLED", "true").lower() == "true"
+        self.enabled = enabled
+        self.followup_enabled = followup_enabled
+        self.followup_max_pending = followup_max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-prefetch")
+        # Follow-up prefetches get their own small pool so they never delay a speculative call
+        self._followup_executor = ThreadPoolExecutor(max_workers=followup_workers, thread_name_prefix="tool-followup")
+        self._followup_pending = 0
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    def predict_tool(self, query: str, tools: List[Any]) -> Optional[Any]:
+        """The tool the agent will call for query, or None when the choice depends on context or is ambiguous."""
+        if has_context_reference(query):
+            return None
+        resolved = resolve_query_intent(query, tools)
+        if resolved is None:
+            return None
+        tool_name = INTENT_TOOLS.get(resolved[0])
+        return next((tool for tool in tools if tool.name == tool_name), None)
+
+    def speculate(self, query: str, tools: List[Any]) -> Optional[Speculation]:
+        if not self.enabled or not get_tool_result_cache().enabled:
+            return None
+        tool = self.predict_tool(query, tools)
+        if tool is None:
+            return None
+        record = SpeculationRecord()
+        future = self._executor.submit(self._run_speculative, tool, query, record)
+        self._metrics.increment("tool_prefetch.started")
+        return Speculation(tool.name, future, record)
+
+    def _run_speculative(self, tool: Any, query: str, record: SpeculationRecord):
+        bind_speculation(record)
+        try:
+            tool._run(query)
+        except Exception as e:
+            self._metrics.increment("tool_prefetch.errors")
+            logger.warning(f"Speculative {tool.name} call failed: {e}")
+        finally:
+            bind_speculation(None)
+
+    def prefetch_followups(self, query: str, tools: List[Any]) -> int:
+        """Warm the tool cache with the other tools' data for the location query resolved to.
+
+        Best effort and low priority: skipped while the service is degraded, and
+        dropped when too many follow-up prefetches are already queued. Returns the
+        number of tool calls submitted.
+        """
+        if not self.followup_enabled or not get_tool_result_cache().enabled:
+            return 0
+        if has_context_reference(query) or get_degradation_controller().current_level() >= LEVEL_CAPPED_RAG:
+            return 0
+        resolved = resolve_query_intent(query, tools)
+        if resolved is None:
+            return 0
+        intent, entities = resolved
+        location = entities.get("location") or entities.get("region")
+        if not location or location == "全国":
+            return 0
+
+        answered_tool = INTENT_TOOLS.get(intent)
+        submitted = 0
+        for tool in tools:
+            if tool.name == answered_tool:
+                continue
+            for template in FOLLOWUP_QUERIES.get(tool.name, []):
+                with self._lock:
+                    if self._followup_pending >= self.followup_max_pending:
+                        self._metrics.increment("tool_prefetch.followup.dropped")
+                        return submitted
+                    self._followup_pending += 1
+                self._followup_executor.submit(self._run_followup, tool, template.format(location=location))
+                submitted += 1
+        self._metrics.increment("tool_prefetch.followup.started", submitted)
+        return submitted
+
+    def _run_followup(self, tool: Any, query: str):
+        bind_speculation(SpeculationRecord(PREFETCH_FOLLOWUP))
+        try:
+            tool._run(query)
+        except Exception as e:
+            self._metrics.increment("tool_prefetch.followup.errors")
+            logger.warning(f"Follow-up prefetch {tool.name} failed: {e}")
+        finally:
+            bind_speculation(None)
+            with self._lock:
+                self._followup_pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        started = self._metrics.get_counter("tool_prefetch.started")
+        hits = self._metrics.get_counter("tool_prefetch.hits")
+        wasted = self._metrics.get_counter("tool_prefetch.wasted")
+        settled = hits + wasted
+        return {
+            "enabled": self.enabled,
+            "started": int(started),
+            "hits": int(hits),
+            "wasted": int(wasted),
+            "hit_ratio": round(hits / settled, 3) if settled else None,
+            "followup": {
+                "enabled": self.followup_enabled,
+                "started": int(self._metrics.get_counter("tool_prefetch.followup.started")),
+                "hits": int(self._metrics.get_counter("tool_prefetch.followup.hits")),
+                "wasted": int(self._metrics.get_counter("tool_prefetch.followup.wasted")),
+                "pending": self._followup_pending
+            }
+        }
+
+
+tool_prefetcher = None
+
+def get_tool_prefetcher() -> ToolPrefetcher:
+    """Get or create the shared tool prefetcher"""
+    global tool_prefetcher
+    if tool_prefetcher is None:
+        tool_prefetcher = ToolPrefetcher()
+    return tool_prefetcher
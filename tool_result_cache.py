@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import requests
+
+from answer_cache import INTENT_TTL_SECONDS
+from request_cancellation import cancellable_get
+from service_metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+# Prefetch kinds and the metric prefixes their hits and waste are counted under
+PREFETCH_SPECULATIVE = "speculative"
+PREFETCH_FOLLOWUP = "followup"
+PREFETCH_METRICS = {
+    PREFETCH_SPECULATIVE: "tool_prefetch",
+    PREFETCH_FOLLOWUP: "tool_prefetch.followup",
+}
+
+
+class _Entry:
+    """One tool API response, in flight or cached."""
+
+    def __init__(self, prefetch: Optional[str]):
+        self.future: Future = Future()
+        self.response: Optional[requests.Response] = None
+        self.expires_at = 0.0
+        # Fetched ahead of the agent; counts as a prefetch hit the first time the agent reads it
+        self.prefetch = prefetch
+        self.used = False
+
+
+class SpeculationRecord:
+    """Cache keys a prefetching tool run fetched, so hits can be told from waste."""
+
+    def __init__(self, kind: str = PREFETCH_SPECULATIVE):
+        self.kind = kind
+        self.keys: List[str] = []
+
+
+_speculation: contextvars.ContextVar = contextvars.ContextVar("tool_speculation", default=None)
+
+
+def bind_speculation(record: Optional[SpeculationRecord]):
+    """Mark tool calls made in this context as prefetches and collect their keys in record."""
+    _speculation.set(record)
+
+
+class ToolResultCache:
+    """Single-flight cache of tool API responses keyed on URL and query params.
+
+    Concurrent requests for the same key share one HTTP call: the first caller
+    fetches, the others wait on its future. Successful responses (HTTP 200 with
+    an API code of 0/200) are kept for the answer cache's per-intent TTL, since
+    both caches go stale with the same upstream /hub data.
+    """
+
+    def __init__(self, max_entries: int = None, enabled: bool = None, wait_seconds: float = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+        if enabled is None:
+            enabled = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+        if wait_seconds is None:
+            wait_seconds = float(os.getenv("TOOL_CACHE_INFLIGHT_WAIT_SECONDS", "15"))
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.wait_seconds = wait_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._metrics = get_metrics_registry()
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, Any]]) -> str:
+        return f"{url}?{urlencode(sorted((params or {}).items()))}"
+
+    @staticmethod
+    def _is_cacheable(response: requests.Response) -> bool:
+        if response.status_code != 200:
+            return False
+        try:
+            return response.json().get("code") in [0, 200]
+        except ValueError:
+            return False
+
+    def _claim(self, entry: _Entry, prefetching: bool):
+        """Count the first non-prefetch read of a prefetched result as a prefetch hit."""
+        if not prefetching and entry.prefetch is not None and not entry.used:
+            entry.used = True
+            self._metrics.increment(f"{PREFETCH_METRICS[entry.prefetch]}.hits")
+
+    def _discard(self, entry: _Entry):
+        """Count a follow-up prefetch that expired or was evicted unread as waste."""
+        if entry.prefetch == PREFETCH_FOLLOWUP and not entry.used:
+            self._metrics.increment(f"{PREFETCH_METRICS[PREFETCH_FOLLOWUP]}.wasted")
+
+    def fetch(self, intent: str, url: str, params: Optional[Dict[str, Any]], fetch: Callable[[], requests.Response]) -> requests.Response:
+        if not self.enabled:
+            return fetch()
+        key = self.make_key(url, params)
+        speculation = _speculation.get()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._claim(entry, speculation is not None)
+                self._metrics.increment("tool_cache.hits")
+                return entry.response
+            if entry is not None:
+                del self._entries[key]
+                self._discard(entry)
+
+            entry = self._inflight.get(key)
+            owner = entry is None
+            if owner:
+                entry = _Entry(speculation.kind if speculation is not None else None)
+                self._inflight[key] = entry
+
+        if not owner:
+            self._metrics.increment("tool_cache.inflight_joins")
+            try:
+                response = entry.future.result(timeout=self.wait_seconds)
+            except Exception:
+                # The shared call failed or was cancelled with its own request; make ours
+                return fetch()
+            with self._lock:
+                self._claim(entry, speculation is not None)
+            return response
+
+        self._metrics.increment("tool_cache.misses")
+        if speculation is not None:
+            speculation.keys.append(key)
+        try:
+            response = fetch()
+            response.content  # Read the body once so waiters can share the response
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            entry.future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            ttl = INTENT_TTL_SECONDS.get(intent, 0)
+            if ttl > 0 and self._is_cacheable(response):
+                entry.response = response
+                entry.expires_at = time.time() + ttl
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._discard(self._entries.popitem(last=False)[1])
+                self._metrics.set_gauge("tool_cache.entries", len(self._entries))
+        entry.future.set_result(response)
+        return response
+
+    def settle_speculation(self, record: SpeculationRecord) -> int:
+        """Close a speculative run: count its unread results as waste; returns how many were used."""
+        used = 0
+        with self._lock:
+            for key in record.keys:
+                entry = self._entries.get(key) or self._inflight.get(key)
+                if entry is None or entry.prefetch != PREFETCH_SPECULATIVE:
+                    continue
+                if entry.used:
+                    used += 1
+                else:
+                    self._metrics.increment(f"{PREFETCH_METRICS[PREFETCH_SPECULATIVE]}.wasted")
+                entry.prefetch = None
+        return used
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._metrics.set_gauge("tool_cache.entries", 0)
+
+
+tool_result_cache = None
+
+def get_tool_result_cache() -> ToolResultCache:
+    """Get or create the shared tool result cache"""
+    global tool_result_cache
+    if tool_result_cache is None:
+        tool_result_cache = ToolResultCache()
+    return tool_result_cache
+
+
+def cached_get(intent: str, url: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> requests.Response:
+    """cancellable_get through the shared tool result cache."""
+    return get_tool_result_cache().fetch(
+        intent, url, params, lambda: cancellable_get(url, params=params, **kwargs)
+    )
@@ -4,7 +4,6 @@ from typing import Dict, Any, List, Optional
 from fastapi import HTTPException
 import logging
 from dotenv import load_dotenv
-import google.generativeai as genai
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
@@ -12,10 +11,17 @@ from langchain_community.document_loaders import DirectoryLoader, TextLoader
 import chromadb
 from pathlib import Path
 
+from llm_gateway import get_llm_gateway, LLMRateLimited, PRIORITY_WECHAT
+from degradation_controller import get_degradation_controller, LEVEL_CAPPED_RAG
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# RAG context limits while the service is degraded
+DEGRADED_RAG_K = int(os.getenv("DEGRADED_RAG_K", "1"))
+DEGRADED_RAG_MAX_CHARS = int(os.getenv("DEGRADED_RAG_MAX_CHARS", "1200"))
+
 class WeChatRAGAgent:
     def __init__(self):
         self.knowledge_base_path = "/home/ubuntu/daxiazhaoguang-ai/knowledge_base"
@@ -31,12 +37,7 @@ class WeChatRAGAgent:
     def _initialize_llm(self):
         """Initialize Gemini LLM"""
         try:
-            gemini_api_key = os.getenv('GOOGLE_API_KEY')
-            if not gemini_api_key:
-                raise ValueError("GOOGLE_API_KEY environment variable not set")
-            
-            genai.configure(api_key=gemini_api_key)
-            self.llm = genai.GenerativeModel('gemini-1.5-flash')
+            self.llm = get_llm_gateway().client("wechat", 'gemini-1.5-flash', PRIORITY_WECHAT)
             
             logger.info("Gemini LLM initialized successfully")
             
@@ -171,12 +172,19 @@ class WeChatRAGAgent:
     async def process_message(self, user_message: str, user_id: str = "default") -> Dict[str, Any]:
         """Process user message and generate response"""
         try:
-            relevant_docs = self._retrieve_relevant_docs(user_message)
+            degraded = get_degradation_controller().is_active(LEVEL_CAPPED_RAG)
+            if degraded:
+                relevant_docs = self._retrieve_relevant_docs(user_message, k=DEGRADED_RAG_K)
+            else:
+                relevant_docs = self._retrieve_relevant_docs(user_message)
             conversation_context = self._get_conversation_context(user_id)
             
             context_text = ""
             if relevant_docs:
-                context_text = "\n\n相关技术文档:\n" + "\n---\n".join(relevant_docs)
+                docs_text = "\n---\n".join(relevant_docs)
+                if degraded:
+                    docs_text = docs_text[:DEGRADED_RAG_MAX_CHARS]
+                context_text = "\n\n相关技术文档:\n" + docs_text
             
             conversation_text = ""
             if conversation_context:
@@ -192,7 +200,7 @@ class WeChatRAGAgent:
 
 请基于上述技术文档和对话历史，为用户提供专业的技术支持回答："""
 
-            response = self.llm.generate_content(prompt)
+            response = await self.llm.generate_content_async(prompt)
             assistant_response = response.text.strip()
             
             self._update_conversation_history(user_id, user_message, assistant_response)
@@ -205,6 +213,15 @@ class WeChatRAGAgent:
                 "status": "success"
             }
             
+        except LLMRateLimited as e:
+            logger.warning(f"Rate limited while processing message: {e}")
+            return {
+                "user_message": user_message,
+                "assistant_response": "当前咨询人数较多，请稍后再试。",
+                "user_id": user_id,
+                "status": "rate_limited"
+            }
+            
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             error_response = "抱歉，处理您的问题时出现技术故障。请稍后重试或联系技术支持。"